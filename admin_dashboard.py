@@ -4,32 +4,150 @@ Discord Bot 管理後台系統
 與 main_complete.py 共用 wallet.db 資料庫
 """
 
-import sqlite3
 from datetime import datetime, timedelta
 import csv
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import os
 
 # 導入安全系統
 from security_system import SecurityManager
+from db_manager import get_db
+from migrations import run_migrations
+from deposit_approval import APPROVED, approve_deposit_requests
+from daily_stats import DAILY_STATS_RANGE_SQL, rebuild_daily_stats, sum_daily_stats
+from exporters import EXPORT_FORMATS, export_cursor
+from ledger_verifier import LedgerVerifier
+from sql_profiler import SQLProfiler
+from money import Money, ZERO, to_plain
+from staff_earnings import ALL_TIME, STAFF_EARNINGS_SQL, TOP_EARNERS_SQL, get_staff_earnings, rebuild_staff_earnings
+
+# ============ 報表查詢 ============
+# 時間條件一律寫成 created_at >= ? AND created_at < ?（半開區間），
+# 不對欄位套用 DATE()，才能使用 created_at 相關索引
+
+ORDERS_BY_DATE_RANGE_SQL = '''
+    SELECT 
+        o.order_number, o.user_id, o.username, o.item_name,
+        o.total_price, o.status, o.created_at, o.completed_at,
+        o.staff_id, c.staff_name, c.staff_earning, c.platform_fee
+    FROM orders o
+    LEFT JOIN commissions c ON o.order_number = c.order_number
+    WHERE o.created_at >= ? AND o.created_at < ?
+    ORDER BY o.created_at DESC
+'''
+
+ACTIVE_STAFF_BY_DATE_RANGE_SQL = '''
+    SELECT COUNT(DISTINCT staff_id)
+    FROM commissions
+    WHERE created_at >= ? AND created_at < ?
+'''
+
+STAFF_PENDING_ORDERS_SQL = '''
+    SELECT COUNT(*)
+    FROM orders
+    WHERE staff_id = ? AND status = 'pending'
+'''
+
+# 餘額異常門檻
+SUSPICIOUS_BALANCE = Money.from_amount(10000)
+
+# ============ 匯出查詢 ============
+# (SQL, 欄位名稱)；由 export_query() 直接從游標串流寫出
+# 金額欄位以分儲存，匯出時除以 100 轉成元
+
+ORDER_EXPORT_HEADERS = [
+    '訂單號', '客戶ID', '客戶名', '商品', '訂單金額', '狀態', '下單時間', '完成時間',
+    '工作人員ID', '工作人員名', '工作人員收入', '平台抽成'
+]
+
+EXPORTS = {
+    'orders': ('''
+        SELECT 
+            o.order_number, o.user_id, o.username, o.item_name,
+            o.total_price / 100.0, o.status, o.created_at, o.completed_at,
+            o.staff_id, c.staff_name, c.staff_earning / 100.0, c.platform_fee / 100.0
+        FROM orders o
+        LEFT JOIN commissions c ON o.order_number = c.order_number
+        ORDER BY o.id
+    ''', ORDER_EXPORT_HEADERS),
+    'commissions': ('''
+        SELECT order_number, staff_id, staff_name, order_amount / 100.0, commission_rate,
+               staff_earning / 100.0, platform_fee / 100.0, created_at
+        FROM commissions
+        ORDER BY id
+    ''', ['訂單號', '工作人員ID', '工作人員名', '訂單金額', '分潤比例', '工作人員收入', '平台抽成', '時間']),
+    'wallets': ('''
+        SELECT user_id, username, balance / 100.0, created_at
+        FROM wallets
+        ORDER BY user_id
+    ''', ['用戶ID', '用戶名', '餘額', '註冊時間']),
+    'deposits': ('''
+        SELECT id, user_id, amount / 100.0, method, status, created_at
+        FROM deposits
+        ORDER BY id
+    ''', ['編號', '用戶ID', '金額', '方式', '狀態', '時間']),
+    'transactions': ('''
+        SELECT id, user_id, amount / 100.0, type, description, created_at
+        FROM transactions
+        ORDER BY id
+    ''', ['編號', '用戶ID', '金額', '類型', '說明', '時間']),
+}
+
+ORDERS_EXPORT_BY_DATE_RANGE_SQL = '''
+    SELECT 
+        o.order_number, o.user_id, o.username, o.item_name,
+        o.total_price / 100.0, o.status, o.created_at, o.completed_at,
+        o.staff_id, c.staff_name, c.staff_earning / 100.0, c.platform_fee / 100.0
+    FROM orders o
+    LEFT JOIN commissions c ON o.order_number = c.order_number
+    WHERE o.created_at >= ? AND o.created_at < ?
+    ORDER BY o.created_at DESC
+'''
+
+# 需要檢查執行計畫的報表查詢
+REPORT_QUERIES = [
+    ('時間區間訂單', ORDERS_BY_DATE_RANGE_SQL),
+    ('每日活躍工作人員', ACTIVE_STAFF_BY_DATE_RANGE_SQL),
+    ('工作人員收入彙總', STAFF_EARNINGS_SQL),
+    ('工作人員收入排行', TOP_EARNERS_SQL),
+    ('工作人員待處理訂單', STAFF_PENDING_ORDERS_SQL),
+    ('每日統計彙總', DAILY_STATS_RANGE_SQL),
+]
+
+
+def date_range_bounds(start_date: str, end_date: Optional[str] = None) -> Tuple[str, str]:
+    """將日期區間轉成半開區間的時間邊界
+    
+    Args:
+        start_date: 開始日期 (YYYY-MM-DD)
+        end_date: 結束日期 (YYYY-MM-DD，包含當天)，預設與開始日期相同
+    
+    Returns:
+        (開始, 結束隔天)，用於 created_at >= ? AND created_at < ?
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date or start_date, '%Y-%m-%d') + timedelta(days=1)
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
 
 class OrderManager:
     """訂單管理系統"""
     
     def __init__(self, db_path='wallet.db'):
         self.db_path = db_path
+        self.db = get_db(db_path)
+        run_migrations(self.db)
+        self.ledger_verifier = LedgerVerifier(self.db)
     
     def get_connection(self):
-        """獲取資料庫連接"""
-        return sqlite3.connect(self.db_path)
+        """獲取資料庫連接（與 Bot 共用連線管理，不需自行關閉）"""
+        return self.db.connection()
     
     # ============ 訂單查詢功能 ============
     
     def get_order_detail(self, order_number: str) -> Optional[Dict]:
         """獲取訂單完整資訊（防糾紛用）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         cursor.execute('''
             SELECT 
@@ -42,7 +160,6 @@ class OrderManager:
         ''', (order_number,))
         
         result = cursor.fetchone()
-        conn.close()
         
         if not result:
             return None
@@ -52,24 +169,23 @@ class OrderManager:
             '用戶ID': result[1],
             '用戶名': result[2],
             '商品名稱': result[3],
-            '商品單價': result[4],
+            '商品單價': Money(result[4]),
             '數量': result[5],
-            '總金額': result[6],
+            '總金額': Money(result[6]),
             '訂單狀態': result[7],
             '用戶備註': result[8],
             '下單時間': result[9],
             '完成時間': result[10],
             '工作人員ID': result[11],
             '分潤比例': result[12],
-            '工作人員收入': result[13],
-            '平台抽成': result[14],
+            '工作人員收入': Money(result[13]),
+            '平台抽成': Money(result[14]),
             '分潤已發放': result[15]
         }
     
     def get_orders_by_user(self, user_id: int, limit: int = 100) -> List[Dict]:
         """查詢某用戶的所有訂單（防詐騙用）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         cursor.execute('''
             SELECT 
@@ -82,14 +198,13 @@ class OrderManager:
         ''', (user_id, limit))
         
         results = cursor.fetchall()
-        conn.close()
         
         orders = []
         for r in results:
             orders.append({
                 '訂單號': r[0],
                 '商品': r[1],
-                '金額': r[2],
+                '金額': Money(r[2]),
                 '狀態': r[3],
                 '下單時間': r[4],
                 '完成時間': r[5],
@@ -100,8 +215,7 @@ class OrderManager:
     
     def get_orders_by_staff(self, staff_id: int, limit: int = 100) -> List[Dict]:
         """查詢某工作人員的所有訂單（防跑路用）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         cursor.execute('''
             SELECT 
@@ -116,7 +230,6 @@ class OrderManager:
         ''', (staff_id, limit))
         
         results = cursor.fetchall()
-        conn.close()
         
         orders = []
         for r in results:
@@ -125,12 +238,12 @@ class OrderManager:
                 '客戶ID': r[1],
                 '客戶名': r[2],
                 '商品': r[3],
-                '訂單金額': r[4],
+                '訂單金額': Money(r[4]),
                 '狀態': r[5],
                 '下單時間': r[6],
                 '完成時間': r[7],
-                '工作人員收入': r[8] if r[8] else 0,
-                '平台抽成': r[9] if r[9] else 0
+                '工作人員收入': Money(r[8] or 0),
+                '平台抽成': Money(r[9] or 0)
             })
         
         return orders
@@ -142,22 +255,11 @@ class OrderManager:
             start_date: 開始日期 (格式: YYYY-MM-DD)
             end_date: 結束日期 (格式: YYYY-MM-DD)
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
-        cursor.execute('''
-            SELECT 
-                o.order_number, o.user_id, o.username, o.item_name,
-                o.total_price, o.status, o.created_at, o.completed_at,
-                o.staff_id, c.staff_name, c.staff_earning, c.platform_fee
-            FROM orders o
-            LEFT JOIN commissions c ON o.order_number = c.order_number
-            WHERE DATE(o.created_at) >= ? AND DATE(o.created_at) <= ?
-            ORDER BY o.created_at DESC
-        ''', (start_date, end_date))
+        cursor.execute(ORDERS_BY_DATE_RANGE_SQL, date_range_bounds(start_date, end_date))
         
         results = cursor.fetchall()
-        conn.close()
         
         orders = []
         for r in results:
@@ -166,22 +268,21 @@ class OrderManager:
                 '客戶ID': r[1],
                 '客戶名': r[2],
                 '商品': r[3],
-                '訂單金額': r[4],
+                '訂單金額': Money(r[4]),
                 '狀態': r[5],
                 '下單時間': r[6],
                 '完成時間': r[7],
                 '工作人員ID': r[8],
                 '工作人員名': r[9] if r[9] else '未分配',
-                '工作人員收入': r[10] if r[10] else 0,
-                '平台抽成': r[11] if r[11] else 0
+                '工作人員收入': Money(r[10] or 0),
+                '平台抽成': Money(r[11] or 0)
             })
         
         return orders
     
     def get_pending_orders_detail(self) -> List[Dict]:
         """獲取所有待處理訂單的詳細資訊"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         cursor.execute('''
             SELECT 
@@ -193,7 +294,6 @@ class OrderManager:
         ''')
         
         results = cursor.fetchall()
-        conn.close()
         
         orders = []
         for r in results:
@@ -207,12 +307,12 @@ class OrderManager:
                 '客戶ID': r[1],
                 '客戶名': r[2],
                 '商品': r[3],
-                '金額': r[4],
+                '金額': Money(r[4]),
                 '備註': r[5],
                 '下單時間': r[6],
                 '等待時長': f'{wait_hours} 小時',
-                '工作人員可得': r[7],
-                '平台抽成': r[8]
+                '工作人員可得': Money(r[7]),
+                '平台抽成': Money(r[8])
             })
         
         return orders
@@ -221,8 +321,7 @@ class OrderManager:
     
     def get_user_statistics(self, user_id: int) -> Dict:
         """獲取用戶統計資料（防詐騙分析）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         # 基本統計
         cursor.execute('''
@@ -230,13 +329,13 @@ class OrderManager:
                 COUNT(*) as total_orders,
                 SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed_orders,
                 SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending_orders,
-                SUM(total_price) as total_spent,
-                AVG(total_price) as avg_order_value
+                SUM(total_price) as total_spent
             FROM orders
             WHERE user_id = ?
         ''', (user_id,))
         
         stats = cursor.fetchone()
+        total_spent = Money(stats[3] or 0)
         
         # 最近訂單
         cursor.execute('''
@@ -253,68 +352,41 @@ class OrderManager:
         cursor.execute('SELECT balance FROM wallets WHERE user_id = ?', (user_id,))
         balance = cursor.fetchone()
         
-        conn.close()
         
         return {
             '總訂單數': stats[0],
             '已完成訂單': stats[1],
             '待處理訂單': stats[2],
-            '總消費金額': stats[3] if stats[3] else 0,
-            '平均訂單金額': stats[4] if stats[4] else 0,
-            '當前餘額': balance[0] if balance else 0,
+            '總消費金額': total_spent,
+            '平均訂單金額': total_spent / stats[0] if stats[0] else ZERO,
+            '當前餘額': Money(balance[0]) if balance else ZERO,
             '最後下單時間': last_order[0] if last_order else '無',
             '最後訂單狀態': last_order[2] if last_order else '無'
         }
     
     def get_staff_statistics(self, staff_id: int) -> Dict:
         """獲取工作人員統計資料（防跑路監控）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 訂單統計
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_orders,
-                SUM(staff_earning) as total_earning,
-                AVG(staff_earning) as avg_earning,
-                MIN(created_at) as first_order,
-                MAX(created_at) as last_order
-            FROM commissions
-            WHERE staff_id = ?
-        ''', (staff_id,))
-        
-        stats = cursor.fetchone()
-        
-        # 本月統計
+        # 累計與本月收入（讀取彙總）
+        stats = get_staff_earnings(self.db, staff_id, ALL_TIME) or (0, ZERO, ZERO, None, None)
         now = datetime.now()
-        start_of_month = f"{now.year}-{now.month:02d}-01"
-        cursor.execute('''
-            SELECT COUNT(*), SUM(staff_earning)
-            FROM commissions
-            WHERE staff_id = ? AND created_at >= ?
-        ''', (staff_id, start_of_month))
-        
-        monthly = cursor.fetchone()
+        monthly = get_staff_earnings(self.db, staff_id, f"{now.year}-{now.month:02d}") or (0, ZERO)
         
         # 待處理訂單
-        cursor.execute('''
-            SELECT COUNT(*)
-            FROM orders
-            WHERE staff_id = ? AND status = 'pending'
-        ''', (staff_id,))
+        cursor = self.db.cursor()
+        cursor.execute(STAFF_PENDING_ORDERS_SQL, (staff_id,))
         
         pending = cursor.fetchone()
         
-        conn.close()
+        order_count, total_earning = stats[0], stats[1]
         
         return {
-            '總完成訂單': stats[0] if stats[0] else 0,
-            '總收入': stats[1] if stats[1] else 0,
-            '平均單價': stats[2] if stats[2] else 0,
+            '總完成訂單': order_count,
+            '總收入': total_earning,
+            '平均單價': total_earning / order_count if order_count else ZERO,
             '首次接單': stats[3] if stats[3] else '無',
             '最後接單': stats[4] if stats[4] else '無',
-            '本月訂單': monthly[0] if monthly[0] else 0,
-            '本月收入': monthly[1] if monthly[1] else 0,
+            '本月訂單': monthly[0],
+            '本月收入': monthly[1],
             '待處理訂單': pending[0] if pending[0] else 0
         }
     
@@ -324,66 +396,62 @@ class OrderManager:
         Args:
             date: 日期 (格式: YYYY-MM-DD)
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # 訂單統計
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_orders,
-                SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) as completed,
-                SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END) as pending,
-                SUM(total_price) as total_revenue
-            FROM orders
-            WHERE DATE(created_at) = ?
-        ''', (date,))
+        bounds = date_range_bounds(date)
+        stats = sum_daily_stats(self.db, *bounds)
         
-        order_stats = cursor.fetchone()
-        
-        # 分潤統計
-        cursor.execute('''
-            SELECT 
-                SUM(staff_earning) as total_paid_out,
-                SUM(platform_fee) as total_platform_fee,
-                COUNT(DISTINCT staff_id) as active_staff
-            FROM commissions
-            WHERE DATE(created_at) = ?
-        ''', (date,))
-        
-        commission_stats = cursor.fetchone()
-        
-        # 儲值統計
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as deposit_count,
-                SUM(amount) as total_deposits
-            FROM deposits
-            WHERE DATE(created_at) = ?
-        ''', (date,))
-        
-        deposit_stats = cursor.fetchone()
-        
-        conn.close()
+        # 活躍工作人員無法從彙總相加，只查詢當天的分潤
+        cursor = self.db.cursor()
+        cursor.execute(ACTIVE_STAFF_BY_DATE_RANGE_SQL, bounds)
+        active_staff = cursor.fetchone()[0]
         
         return {
             '日期': date,
-            '總訂單數': order_stats[0],
-            '已完成': order_stats[1],
-            '待處理': order_stats[2],
-            '訂單總額': order_stats[3] if order_stats[3] else 0,
-            '已付出分潤': commission_stats[0] if commission_stats[0] else 0,
-            '平台收益': commission_stats[1] if commission_stats[1] else 0,
-            '活躍工作人員': commission_stats[2] if commission_stats[2] else 0,
-            '儲值筆數': deposit_stats[0],
-            '儲值總額': deposit_stats[1] if deposit_stats[1] else 0
+            '總訂單數': stats['order_count'],
+            '已完成': stats['completed_count'],
+            '待處理': stats['pending_count'],
+            '訂單總額': stats['order_amount'],
+            '已付出分潤': stats['staff_earning'],
+            '平台收益': stats['platform_fee'],
+            '活躍工作人員': active_staff,
+            '儲值筆數': stats['deposit_count'],
+            '儲值總額': stats['deposit_amount']
         }
     
+    def rebuild_daily_stats(self) -> int:
+        """從訂單、分潤、儲值、交易紀錄重建每日統計，回傳天數"""
+        with self.db.transaction() as cursor:
+            return rebuild_daily_stats(cursor)
+    
+    def rebuild_staff_earnings(self) -> int:
+        """從分潤紀錄重建工作人員收入彙總，回傳列數"""
+        with self.db.transaction() as cursor:
+            return rebuild_staff_earnings(cursor)
+    
+    def verify_ledger(self, full: bool = False) -> Dict:
+        """檢查錢包餘額與交易紀錄是否一致（預設只檢查上次之後的新交易）"""
+        return self.ledger_verifier.verify(full)
+    
+    def get_balance_as_of(self, user_id: int, date: str) -> Money:
+        """查詢用戶在某日結束時的餘額"""
+        return self.ledger_verifier.balance_as_of(user_id, date)
+    
+    # ============ 儲值審核 ============
+    
+    def approve_deposits(self, request_ids: Optional[List[int]] = None, max_amount: Optional[Money] = None,
+                         created_before: Optional[str] = None, admin_id: int = 0) -> List[Dict]:
+        """在一個交易中批次通過儲值申請，回傳每筆申請的結果
+        
+        Bot 的排行榜與風控計數會在下次背景維護時與資料庫同步
+        """
+        results, _ = approve_deposit_requests(self.db, admin_id, request_ids,
+                                              max_amount=max_amount, created_before=created_before)
+        return results
+    
     # ============ 異常檢測功能（防詐騙）============
     
     def detect_suspicious_users(self) -> List[Dict]:
         """檢測可疑用戶"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         suspicious_users = []
         
@@ -403,7 +471,7 @@ class OrderManager:
                 '用戶名': r[1],
                 '異常類型': '大量未完成訂單',
                 '待處理訂單數': r[2],
-                '涉及金額': r[3],
+                '涉及金額': Money(r[3]),
                 '風險等級': '⚠️ 中'
             })
         
@@ -423,7 +491,7 @@ class OrderManager:
                 '用戶名': r[1],
                 '異常類型': '1小時內大量下單',
                 '訂單數': r[2],
-                '涉及金額': r[3],
+                '涉及金額': Money(r[3]),
                 '風險等級': '🚨 高'
             })
         
@@ -431,8 +499,8 @@ class OrderManager:
         cursor.execute('''
             SELECT user_id, username, balance
             FROM wallets
-            WHERE balance < 0 OR balance > 10000
-        ''')
+            WHERE balance < 0 OR balance > ?
+        ''', (SUSPICIOUS_BALANCE,))
         
         for r in cursor.fetchall():
             risk = '🚨 高' if r[2] < 0 else '⚠️ 中'
@@ -440,17 +508,15 @@ class OrderManager:
                 '用戶ID': r[0],
                 '用戶名': r[1],
                 '異常類型': '餘額異常',
-                '當前餘額': r[2],
+                '當前餘額': Money(r[2]),
                 '風險等級': risk
             })
         
-        conn.close()
         return suspicious_users
     
     def detect_suspicious_staff(self) -> List[Dict]:
         """檢測可疑工作人員（防跑路）"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         suspicious_staff = []
         
@@ -507,7 +573,6 @@ class OrderManager:
                     '風險等級': '⚠️ 中'
                 })
         
-        conn.close()
         return suspicious_staff
     
     # ============ 匯出功能 ============
@@ -528,10 +593,82 @@ class OrderManager:
     def export_to_json(self, data: List[Dict], filename: str):
         """匯出資料為 JSON 檔案"""
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+            json.dump(to_plain(data), f, ensure_ascii=False, indent=2)
         
         print(f"✅ 資料已匯出到 {filename}")
     
+    def export_query(self, sql: str, params: tuple, headers: List[str], filename: str,
+                     fmt: str = 'csv', compress: bool = False) -> int:
+        """執行查詢並直接從游標串流匯出（不會先載入整個結果）
+        
+        Args:
+            fmt: 'csv'、'ndjson' 或 'json'
+            compress: 是否以 gzip 壓縮
+        """
+        cursor = self.db.cursor()
+        cursor.execute(sql, params)
+        count, filename = export_cursor(cursor, headers, filename, fmt, compress)
+        
+        if count:
+            print(f"✅ 已匯出 {count} 筆資料到 {filename}")
+        else:
+            print(f"沒有資料可匯出（已建立空檔案 {filename}）")
+        return count
+    
+    def export_table(self, name: str, filename: str, fmt: str = 'csv', compress: bool = False) -> int:
+        """串流匯出整個資料表（name 為 EXPORTS 的鍵）"""
+        sql, headers = EXPORTS[name]
+        return self.export_query(sql, (), headers, filename, fmt, compress)
+    
+    def export_orders_by_date_range(self, start_date: str, end_date: str, filename: str,
+                                    fmt: str = 'csv', compress: bool = False) -> int:
+        """串流匯出時間區間內的訂單"""
+        return self.export_query(ORDERS_EXPORT_BY_DATE_RANGE_SQL, date_range_bounds(start_date, end_date),
+                                 ORDER_EXPORT_HEADERS, filename, fmt, compress)
+    
+    # ============ 查詢效能檢查 ============
+    
+    def explain_report_queries(self) -> List[Dict]:
+        """以 EXPLAIN QUERY PLAN 檢查每個報表查詢是否使用索引"""
+        cursor = self.db.cursor()
+        
+        results = []
+        for name, sql in REPORT_QUERIES:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', (None,) * sql.count('?'))
+            steps = [row[3] for row in cursor.fetchall()]
+            # 沒有 USING 的 SCAN 代表整張表掃描
+            full_scans = [step for step in steps if step.startswith('SCAN') and 'USING' not in step]
+            results.append({
+                '查詢': name,
+                '執行計畫': ' | '.join(steps),
+                '使用索引': '❌ 全表掃描' if full_scans else '✅'
+            })
+        
+        return results
+    
+    # ============ SQL 效能分析 ============
+    
+    def start_sql_profiler(self) -> SQLProfiler:
+        """開始記錄之後所有 SQL 的次數、耗時與列數"""
+        if self.db.profiler is None:
+            self.db.enable_profiler(SQLProfiler())
+        return self.db.profiler
+    
+    def stop_sql_profiler(self):
+        self.db.disable_profiler()
+    
+    def sql_profile_report(self, limit: int = 20) -> Tuple[List[Dict], Optional[str]]:
+        """依總耗時排序的 SQL 統計（含執行計畫與全表掃描警告），完整報告寫入檔案
+        
+        Returns:
+            (前 limit 筆統計, 報告檔名)；尚未開始記錄時回傳 ([], None)
+        """
+        profiler = self.db.profiler
+        if profiler is None:
+            return [], None
+        path = profiler.write_report(self.db)
+        return profiler.report_rows(limit=limit), path
+    
     # ============ 對帳報表功能 ============
     
     def generate_reconciliation_report(self, start_date: str, end_date: str) -> Dict:
@@ -541,72 +678,24 @@ class OrderManager:
             start_date: 開始日期 (YYYY-MM-DD)
             end_date: 結束日期 (YYYY-MM-DD)
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        stats = sum_daily_stats(self.db, *date_range_bounds(start_date, end_date))
         
-        # 訂單營收
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_orders,
-                SUM(CASE WHEN status = 'completed' THEN total_price ELSE 0 END) as completed_revenue,
-                SUM(CASE WHEN status = 'pending' THEN total_price ELSE 0 END) as pending_revenue
-            FROM orders
-            WHERE DATE(created_at) >= ? AND DATE(created_at) <= ?
-        ''', (start_date, end_date))
-        
-        order_stats = cursor.fetchone()
-        
-        # 分潤支出
-        cursor.execute('''
-            SELECT 
-                SUM(staff_earning) as total_commission,
-                SUM(platform_fee) as total_platform_fee
-            FROM commissions
-            WHERE DATE(created_at) >= ? AND DATE(created_at) <= ?
-        ''', (start_date, end_date))
-        
-        commission_stats = cursor.fetchone()
-        
-        # 儲值收入
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as deposit_count,
-                SUM(amount) as total_deposits
-            FROM deposits
-            WHERE DATE(created_at) >= ? AND DATE(created_at) <= ?
-        ''', (start_date, end_date))
-        
-        deposit_stats = cursor.fetchone()
-        
-        # 交易紀錄
-        cursor.execute('''
-            SELECT 
-                SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END) as total_income,
-                SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END) as total_expense
-            FROM transactions
-            WHERE DATE(created_at) >= ? AND DATE(created_at) <= ?
-        ''', (start_date, end_date))
-        
-        transaction_stats = cursor.fetchone()
-        
-        conn.close()
-        
-        completed_revenue = order_stats[1] if order_stats[1] else 0
-        total_commission = commission_stats[0] if commission_stats[0] else 0
-        total_platform_fee = commission_stats[1] if commission_stats[1] else 0
-        total_deposits = deposit_stats[1] if deposit_stats[1] else 0
+        completed_revenue = stats['completed_amount']
+        total_commission = stats['staff_earning']
+        total_platform_fee = stats['platform_fee']
+        total_deposits = stats['deposit_amount']
         
         return {
             '對帳期間': f'{start_date} 至 {end_date}',
-            '總訂單數': order_stats[0],
+            '總訂單數': stats['order_count'],
             '已完成訂單營收': completed_revenue,
-            '待處理訂單金額': order_stats[2] if order_stats[2] else 0,
+            '待處理訂單金額': stats['pending_amount'],
             '已付出分潤': total_commission,
             '平台實際收益': total_platform_fee,
-            '儲值筆數': deposit_stats[0],
+            '儲值筆數': stats['deposit_count'],
             '儲值總額': total_deposits,
-            '系統記錄收入': transaction_stats[0] if transaction_stats[0] else 0,
-            '系統記錄支出': abs(transaction_stats[1]) if transaction_stats[1] else 0,
+            '系統記錄收入': stats['ledger_income'],
+            '系統記錄支出': abs(stats['ledger_expense']),
             '淨利潤': total_platform_fee,
             '營收確認': '✅ 正常' if completed_revenue == (total_commission + total_platform_fee) else '❌ 異常'
         }
@@ -622,7 +711,7 @@ def print_dict(data: Dict, title: str = ""):
         print('='*50)
     
     for key, value in data.items():
-        if isinstance(value, float):
+        if isinstance(value, (float, Money)):
             print(f"{key}: ${value:.2f}")
         else:
             print(f"{key}: {value}")
@@ -642,7 +731,7 @@ def print_list(data: List[Dict], title: str = ""):
     for i, item in enumerate(data, 1):
         print(f"\n[{i}]")
         for key, value in item.items():
-            if isinstance(value, float):
+            if isinstance(value, (float, Money)):
                 print(f"  {key}: ${value:.2f}")
             else:
                 print(f"  {key}: {value}")
@@ -654,6 +743,10 @@ def main():
     manager = OrderManager()
     security = SecurityManager()  # 初始化安全系統
     
+    # 設定 SQL_PROFILE=1 時從啟動就開始記錄 SQL 效能
+    if os.getenv('SQL_PROFILE'):
+        manager.start_sql_profiler()
+    
     print("""
 ╔═══════════════════════════════════════════╗
 ║     Discord Bot 訂單管理後台系統           ║
@@ -692,6 +785,16 @@ def main():
 18. 查看儲值限制記錄
 19. 自動風控處理
 
+【維護工具】
+20. 重建統計彙總
+21. 檢查報表查詢執行計畫
+22. 帳本一致性檢查
+23. 查詢歷史餘額
+25. SQL 效能分析（開始記錄／輸出報告）
+
+【儲值審核】
+24. 批次通過儲值
+
 0. 退出
 """)
         
@@ -732,12 +835,16 @@ def main():
         elif choice == '4':
             start_date = input("請輸入開始日期 (YYYY-MM-DD): ").strip()
             end_date = input("請輸入結束日期 (YYYY-MM-DD): ").strip()
-            orders = manager.get_orders_by_date_range(start_date, end_date)
+            try:
+                orders = manager.get_orders_by_date_range(start_date, end_date)
+            except ValueError:
+                print("❌ 日期格式錯誤")
+                continue
             print_list(orders, f"{start_date} 至 {end_date} 的訂單")
             
             export = input("\n是否匯出? (y/n): ").strip().lower()
             if export == 'y':
-                manager.export_to_csv(orders, f'orders_{start_date}_to_{end_date}.csv')
+                manager.export_orders_by_date_range(start_date, end_date, f'orders_{start_date}_to_{end_date}.csv')
         
         elif choice == '5':
             orders = manager.get_pending_orders_detail()
@@ -763,7 +870,11 @@ def main():
             date = input("請輸入日期 (YYYY-MM-DD，留空=今天): ").strip()
             if not date:
                 date = datetime.now().strftime('%Y-%m-%d')
-            summary = manager.get_daily_summary(date)
+            try:
+                summary = manager.get_daily_summary(date)
+            except ValueError:
+                print("❌ 日期格式錯誤")
+                continue
             print_dict(summary, f"{date} 營運摘要")
         
         elif choice == '9':
@@ -787,13 +898,17 @@ def main():
         elif choice == '11':
             start_date = input("請輸入開始日期 (YYYY-MM-DD): ").strip()
             end_date = input("請輸入結束日期 (YYYY-MM-DD): ").strip()
-            report = manager.generate_reconciliation_report(start_date, end_date)
+            try:
+                report = manager.generate_reconciliation_report(start_date, end_date)
+            except ValueError:
+                print("❌ 日期格式錯誤")
+                continue
             print_dict(report, "對帳報表")
             
             export = input("\n是否匯出? (y/n): ").strip().lower()
             if export == 'y':
                 with open(f'reconciliation_{start_date}_to_{end_date}.json', 'w', encoding='utf-8') as f:
-                    json.dump(report, f, ensure_ascii=False, indent=2)
+                    json.dump(to_plain(report), f, ensure_ascii=False, indent=2)
                 print(f"✅ 報表已匯出")
         
         elif choice == '12':
@@ -803,12 +918,29 @@ def main():
 2. 所有分潤紀錄
 3. 所有用戶
 4. 所有儲值紀錄
+5. 所有交易紀錄
 """)
             export_choice = input("請選擇: ").strip()
+            tables = {
+                '1': ('orders', 'all_orders'),
+                '2': ('commissions', 'all_commissions'),
+                '3': ('wallets', 'all_users'),
+                '4': ('deposits', 'all_deposits'),
+                '5': ('transactions', 'all_transactions'),
+            }
             
-            if export_choice == '1':
-                orders = manager.get_orders_by_date_range('2020-01-01', '2099-12-31')
-                manager.export_to_csv(orders, 'all_orders.csv')
+            if export_choice in tables:
+                fmt_choice = input("格式 (1=CSV, 2=NDJSON, 3=JSON，留空=CSV): ").strip() or '1'
+                fmt = {'1': 'csv', '2': 'ndjson', '3': 'json'}.get(fmt_choice)
+                if fmt not in EXPORT_FORMATS:
+                    print("❌ 無效的格式")
+                    continue
+                compress = input("是否以 gzip 壓縮? (y/n): ").strip().lower() == 'y'
+                
+                table, basename = tables[export_choice]
+                manager.export_table(table, f'{basename}.{fmt}', fmt, compress)
+            else:
+                print("❌ 無效的選項")
         
         # ============ 安全管理功能 ============
         
@@ -865,6 +997,7 @@ def main():
             # 檢查黑名單狀態
             try:
                 user_id = int(input("用戶ID: "))
+                security.reload_blacklist_cache()  # 讀取 Bot 端的最新封禁
                 is_banned, reason = security.is_blacklisted(user_id)
                 
                 print(f"\n{'='*60}")
@@ -977,6 +1110,70 @@ def main():
                         json.dump(results, f, ensure_ascii=False, indent=2)
                     print(f"✅ 已匯出到 {filename}")
         
+        elif choice == '20':
+            days = manager.rebuild_daily_stats()
+            print(f"✅ 已重建 {days} 天的每日統計")
+            rows = manager.rebuild_staff_earnings()
+            print(f"✅ 已重建 {rows} 筆工作人員收入彙總")
+        
+        elif choice == '21':
+            plans = manager.explain_report_queries()
+            print_list(plans, "報表查詢執行計畫")
+        
+        elif choice == '22':
+            full = input("完整重新檢查所有交易? (y/n，預設只檢查新交易): ").strip().lower() == 'y'
+            result = manager.verify_ledger(full)
+            print(f"\n檢查交易數: {result['檢查交易數']}")
+            print(f"檢查用戶數: {result['檢查用戶數']}")
+            print(f"已檢查至交易編號: {result['已檢查至交易編號']}")
+            if result['異常用戶']:
+                print_list(result['異常用戶'], "⚠️ 餘額與帳本不一致")
+            else:
+                print("✅ 帳本一致")
+        
+        elif choice == '23':
+            try:
+                user_id = int(input("請輸入用戶ID: ").strip())
+                date = input("請輸入日期 (YYYY-MM-DD): ").strip()
+                balance = manager.get_balance_as_of(user_id, date)
+                print(f"\n用戶 {user_id} 在 {date} 結束時的餘額: ${balance:.2f}")
+            except ValueError:
+                print("❌ 輸入格式錯誤")
+        
+        elif choice == '24':
+            try:
+                ids_text = input("申請編號（以空白或逗號分隔，留空=依條件篩選待審核申請）: ").strip()
+                request_ids = [int(value) for value in ids_text.replace(',', ' ').split()] or None
+                max_amount_text = input("轉帳金額上限（留空=不限）: ").strip()
+                max_amount = Money.from_amount(max_amount_text) if max_amount_text else None
+                created_before = input("只通過此日期之前的申請 (YYYY-MM-DD，留空=不限): ").strip() or None
+                if created_before:
+                    datetime.strptime(created_before, '%Y-%m-%d')
+            except (ValueError, ArithmeticError):
+                print("❌ 輸入格式錯誤")
+                continue
+            
+            if request_ids is None and max_amount is None and created_before is None:
+                if input("未指定條件，確定通過所有待審核申請? (y/n): ").strip().lower() != 'y':
+                    continue
+            
+            results = manager.approve_deposits(request_ids, max_amount, created_before)
+            approved = [result for result in results if result['結果'] == APPROVED]
+            print_list(results, "儲值審核結果")
+            print(f"通過 {len(approved)} 筆，失敗 {len(results) - len(approved)} 筆")
+        
+        elif choice == '25':
+            if manager.db.profiler is None:
+                manager.start_sql_profiler()
+                print("✅ 已開始記錄 SQL，操作其他功能後再選 25 輸出報告")
+            else:
+                rows, path = manager.sql_profile_report()
+                print_list(rows, "SQL 耗時排行（依總耗時）")
+                print(f"完整報告已寫入 {path}")
+                if input("停止記錄? (y/n): ").strip().lower() == 'y':
+                    manager.stop_sql_profiler()
+                    print("✅ 已停止記錄")
+        
         elif choice == '0':
             print("\n再見！")
             break
@@ -0,0 +1,83 @@
+"""
+按鈕路由
+功能：按鈕需要的狀態全部編碼在 custom_id（例如 shop:buy:<商品ID>:<目錄版本>），
+由 on_interaction 統一解析並交給對應的處理函式
+送出訊息時使用已停止的 View 當作元件模板，discord.py 不會為每則訊息保存 View 物件，
+記憶體用量與開啟中的訊息數量無關，Bot 重啟後舊訊息的按鈕也能繼續使用
+"""
+
+from typing import Awaitable, Callable, Dict, Optional
+
+import discord
+
+# custom_id 欄位分隔符號與長度上限
+SEPARATOR = ':'
+MAX_CUSTOM_ID_LENGTH = 100
+
+# 處理函式：(interaction, *custom_id 參數) ，參數皆為字串
+Handler = Callable[..., Awaitable[None]]
+
+
+def make_custom_id(route: str, *args) -> str:
+    """組合 custom_id，例如 make_custom_id('shop:buy', 3, 12) == 'shop:buy:3:12'"""
+    custom_id = SEPARATOR.join([route, *(str(arg) for arg in args)])
+    if len(custom_id) > MAX_CUSTOM_ID_LENGTH:
+        raise ValueError(f"custom_id 過長: {custom_id}")
+    return custom_id
+
+
+def template_view(*items: discord.ui.Item) -> discord.ui.View:
+    """建立只用來產生元件的 View
+
+    View 在送出前就已停止，discord.py 不會把它存入 ViewStore，
+    點擊事件改由 ComponentRouter 處理；同一個模板可以重複用於多則訊息。
+    """
+    view = discord.ui.View(timeout=None)
+    for item in items:
+        view.add_item(item)
+    view.stop()
+    return view
+
+
+class ComponentRouter:
+    """依 custom_id 前兩段（例如 shop:buy）分派按鈕事件"""
+
+    def __init__(self):
+        self._handlers: Dict[str, Handler] = {}
+
+        self.dispatched = 0
+        self.unrouted = 0
+        self.errors = 0
+
+    def route(self, route: str):
+        """註冊處理函式的裝飾器"""
+        def decorator(handler: Handler) -> Handler:
+            self._handlers[route] = handler
+            return handler
+        return decorator
+
+    async def dispatch(self, interaction: discord.Interaction) -> Optional[str]:
+        """處理一次元件互動，回傳處理的路由（沒有對應的處理函式時回傳 None）"""
+        if interaction.type != discord.InteractionType.component:
+            return None
+
+        custom_id = (interaction.data or {}).get('custom_id', '')
+        parts = custom_id.split(SEPARATOR)
+        route = SEPARATOR.join(parts[:2])
+        handler = self._handlers.get(route)
+        if handler is None:
+            self.unrouted += 1
+            return None
+
+        self.dispatched += 1
+        try:
+            await handler(interaction, *parts[2:])
+        except Exception as e:
+            self.errors += 1
+            print(f"處理按鈕錯誤 ({custom_id}): {e}")
+            if not interaction.response.is_done():
+                try:
+                    await interaction.response.send_message("❌ 操作失敗，請重新開啟選單", ephemeral=True)
+                except discord.HTTPException:
+                    pass
+        return route
@@ -0,0 +1,157 @@
+"""
+每日統計彙總
+功能：在寫入訂單、分潤、儲值、交易紀錄的同一個交易中累加 daily_stats，
+平台統計與對帳報表只需讀取日期範圍內的彙總列
+日期以 DATE(created_at) 計算（UTC，與 CURRENT_TIMESTAMP 一致）
+金額欄位以分為單位的整數儲存
+"""
+
+from typing import Dict, Optional
+
+from money import Money
+
+# 彙總欄位
+#   依訂單建立日：order_count / order_amount、pending_*、completed_*
+#   依訂單完成日：fulfilled_count / fulfilled_amount
+#   依分潤建立日：commission_count、staff_earning、platform_fee
+#   依儲值建立日：deposit_count / deposit_amount
+#   依交易建立日：ledger_income（正數加總）、ledger_expense（負數加總）
+STAT_COLUMNS = (
+    'order_count', 'order_amount',
+    'pending_count', 'pending_amount',
+    'completed_count', 'completed_amount',
+    'fulfilled_count', 'fulfilled_amount',
+    'commission_count', 'staff_earning', 'platform_fee',
+    'deposit_count', 'deposit_amount',
+    'ledger_income', 'ledger_expense',
+)
+
+# 已發布為遷移 5，不可修改；金額欄位由遷移 8 轉為 INTEGER（分）
+CREATE_DAILY_STATS = f'''
+    CREATE TABLE IF NOT EXISTS daily_stats (
+        day TEXT PRIMARY KEY,
+        {", ".join(
+            f"{column} {'INTEGER' if column.endswith('_count') else 'REAL'} NOT NULL DEFAULT 0"
+            for column in STAT_COLUMNS
+        )}
+    )
+'''
+
+
+def add_daily_stats(cursor, day: Optional[str] = None, **deltas):
+    """累加某一天的統計（必須在寫入基礎資料的交易內呼叫）
+
+    Args:
+        day: 日期 (YYYY-MM-DD)，預設為今天（UTC）
+        deltas: 欄位名稱 -> 增加的數值
+    """
+    deltas = {column: value for column, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    for column in deltas:
+        if column not in STAT_COLUMNS:
+            raise ValueError(f"未知的統計欄位: {column}")
+
+    columns = ", ".join(deltas)
+    placeholders = ", ".join("?" for _ in deltas)
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in deltas)
+
+    cursor.execute(f'''
+        INSERT INTO daily_stats (day, {columns})
+        VALUES (COALESCE(?, DATE('now')), {placeholders})
+        ON CONFLICT(day) DO UPDATE SET {updates}
+    ''', (day, *deltas.values()))
+
+
+def add_ledger_entry(cursor, amount: Money, day: Optional[str] = None):
+    """累加一筆交易紀錄"""
+    if amount > 0:
+        add_daily_stats(cursor, day, ledger_income=amount)
+    else:
+        add_daily_stats(cursor, day, ledger_expense=amount)
+
+
+def rebuild_daily_stats(cursor) -> int:
+    """從基礎資料重新計算所有每日統計（必須在交易內呼叫），回傳天數"""
+    cursor.execute('DELETE FROM daily_stats')
+
+    sources = [
+        # 訂單（依建立日）
+        '''
+        SELECT DATE(created_at),
+               COUNT(*), SUM(total_price),
+               SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'pending' THEN total_price ELSE 0 END),
+               SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN status = 'completed' THEN total_price ELSE 0 END)
+        FROM orders GROUP BY DATE(created_at)
+        ''',
+        # 訂單（依完成日）
+        '''
+        SELECT DATE(completed_at), COUNT(*), SUM(total_price)
+        FROM orders
+        WHERE status = 'completed' AND completed_at IS NOT NULL
+        GROUP BY DATE(completed_at)
+        ''',
+        # 分潤
+        '''
+        SELECT DATE(created_at), COUNT(*), SUM(staff_earning), SUM(platform_fee)
+        FROM commissions GROUP BY DATE(created_at)
+        ''',
+        # 儲值
+        '''
+        SELECT DATE(created_at), COUNT(*), SUM(amount)
+        FROM deposits GROUP BY DATE(created_at)
+        ''',
+        # 交易紀錄
+        '''
+        SELECT DATE(created_at),
+               SUM(CASE WHEN amount > 0 THEN amount ELSE 0 END),
+               SUM(CASE WHEN amount < 0 THEN amount ELSE 0 END)
+        FROM transactions GROUP BY DATE(created_at)
+        ''',
+    ]
+    columns = [
+        ('order_count', 'order_amount', 'pending_count', 'pending_amount',
+         'completed_count', 'completed_amount'),
+        ('fulfilled_count', 'fulfilled_amount'),
+        ('commission_count', 'staff_earning', 'platform_fee'),
+        ('deposit_count', 'deposit_amount'),
+        ('ledger_income', 'ledger_expense'),
+    ]
+
+    for query, names in zip(sources, columns):
+        cursor.execute(query)
+        for row in cursor.fetchall():
+            day, values = row[0], row[1:]
+            if day is None:
+                continue
+            add_daily_stats(cursor, day, **dict(zip(names, values)))
+
+    cursor.execute('SELECT COUNT(*) FROM daily_stats')
+    return cursor.fetchone()[0]
+
+
+DAILY_STATS_RANGE_SQL = f'''
+    SELECT {", ".join(f"COALESCE(SUM({column}), 0)" for column in STAT_COLUMNS)}
+    FROM daily_stats
+    WHERE day >= ? AND day < ?
+'''
+
+# 不限範圍時使用的邊界（日期字串依字典序比較）
+MIN_DAY = '0000-01-01'
+MAX_DAY = '9999-12-31'
+
+
+def sum_daily_stats(db, start_day: Optional[str] = None, end_day: Optional[str] = None) -> Dict[str, int]:
+    """加總日期範圍內的統計（筆數為 int，金額為 Money）
+
+    Args:
+        start_day: 開始日期（含），None 表示不限
+        end_day: 結束日期（不含），None 表示不限
+    """
+    cursor = db.cursor()
+    cursor.execute(DAILY_STATS_RANGE_SQL, (start_day or MIN_DAY, end_day or MAX_DAY))
+    return {column: value if column.endswith('_count') else Money(value)
+            for column, value in zip(STAT_COLUMNS, cursor.fetchone())}
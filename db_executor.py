@@ -0,0 +1,93 @@
+"""
+資料庫執行器
+功能：將阻塞的 SQLite 呼叫移出 asyncio 事件迴圈，提供排隊與背壓控制
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from metrics import Counter, Gauge, Histogram
+
+DB_CALL_SECONDS = Histogram('wallet_db_call_seconds', '資料庫函式在執行緒中的執行時間（秒）', ['executor', 'function'])
+DB_WAIT_SECONDS = Histogram('wallet_db_wait_seconds', '資料庫函式開始執行前的排隊時間（秒）', ['executor'])
+DB_CALL_ERRORS = Counter('wallet_db_call_errors_total', '資料庫函式拋出例外的次數', ['executor', 'function'])
+DB_IN_FLIGHT = Gauge('wallet_db_in_flight', '已送入執行緒池的資料庫工作數', ['executor'])
+DB_WAITING = Gauge('wallet_db_waiting', '因背壓在事件迴圈端等待的資料庫呼叫數', ['executor'])
+
+
+def function_name(func: Callable) -> str:
+    """指標用的函式名稱，例如 discord_wallet_bot.get_balance、SecurityManager.check_deposit_limit"""
+    while isinstance(func, functools.partial):
+        func = func.func
+    qualname = getattr(func, '__qualname__', None) or repr(func)
+    if '.' in qualname:
+        return qualname
+    return f"{getattr(func, '__module__', '?')}.{qualname}"
+
+
+class DBExecutor:
+    """有界的資料庫執行緒池
+
+    所有資料庫函式都透過 run() 在獨立執行緒中執行，事件迴圈只負責等待結果。
+    同時在池中（執行中 + 排隊中）的工作數量上限為 max_pending，
+    超過上限的呼叫者會在 asyncio 端等待空位，避免無限制地堆積工作。
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, name: str = 'db'):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._in_flight = 0
+        self._waiting = 0
+        DB_IN_FLIGHT.set_function(lambda: self._in_flight, executor=name)
+        DB_WAITING.set_function(lambda: self._waiting, executor=name)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在執行緒池中執行阻塞函式並等待結果"""
+        submitted = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(self._timed_call, submitted, func, *args, **kwargs)
+            return await loop.run_in_executor(self._pool, call)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    def _timed_call(self, submitted: float, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在工作執行緒中執行並記錄排隊與執行時間"""
+        started = time.perf_counter()
+        DB_WAIT_SECONDS.observe(started - submitted, executor=self.name)
+        name = function_name(func)
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_CALL_ERRORS.inc(executor=self.name, function=name)
+            raise
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - started, executor=self.name, function=name)
+
+    @property
+    def in_flight(self) -> int:
+        """已送入執行緒池（執行中或池內排隊）的工作數"""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """因背壓而在事件迴圈端等待的呼叫數"""
+        return self._waiting
+
+    def shutdown(self, wait: bool = True):
+        """關閉執行緒池"""
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,145 @@
+"""
+資料庫連線管理
+功能：共用長連線（每個執行緒一條）、WAL 模式、busy_timeout、交易 API
+Bot、SecurityManager 與 OrderManager 透過 get_db() 共用同一個管理器
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# 等待其他連線釋放寫入鎖的時間（毫秒）
+BUSY_TIMEOUT_MS = 5000
+
+# 每條連線保留的已編譯語句數量
+CACHED_STATEMENTS = 256
+
+
+class ConnectionManager:
+    """SQLite 連線管理器
+
+    每個執行緒持有一條長連線，避免每次呼叫都重新建立連線與讀取 schema。
+    連線以自動提交模式開啟，寫入一律透過 transaction() 明確開始交易。
+    """
+
+    def __init__(self, db_path: str = 'wallet.db', busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: List[sqlite3.Connection] = []
+        self.profiler = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """建立新連線並套用 PRAGMA 設定"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+
+        with self._lock:
+            self._connections.append(conn)
+            if self.profiler is not None:
+                conn.set_trace_callback(self.profiler.trace)
+        return conn
+
+    def enable_profiler(self, profiler):
+        """開始記錄 SQL 效能（sql_profiler.SQLProfiler），套用到現有與之後建立的連線"""
+        with self._lock:
+            self.profiler = profiler
+            for conn in self._connections:
+                conn.set_trace_callback(profiler.trace)
+
+    def disable_profiler(self) -> Optional[object]:
+        """停止記錄，回傳原本的分析器"""
+        with self._lock:
+            profiler, self.profiler = self.profiler, None
+            for conn in self._connections:
+                conn.set_trace_callback(None)
+        return profiler
+
+    def _new_cursor(self, conn: sqlite3.Connection) -> sqlite3.Cursor:
+        profiler = self.profiler
+        if profiler is None:
+            return conn.cursor()
+        return conn.cursor(profiler.cursor_factory)
+
+    def connection(self) -> sqlite3.Connection:
+        """取得目前執行緒的連線（不存在時建立）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """取得目前執行緒連線的游標（用於唯讀查詢）"""
+        return self._new_cursor(self.connection())
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """交易區塊
+
+        最外層以 BEGIN IMMEDIATE 開始，正常結束時 COMMIT、發生例外時 ROLLBACK。
+        巢狀呼叫會使用 SAVEPOINT，讓內層失敗只回滾內層的寫入。
+        """
+        conn = self.connection()
+        depth = self._local.depth
+
+        if depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        else:
+            conn.execute(f'SAVEPOINT sp_{depth}')
+
+        self._local.depth = depth + 1
+        try:
+            yield self._new_cursor(conn)
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0:
+                conn.rollback()
+            else:
+                conn.execute(f'ROLLBACK TO sp_{depth}')
+                conn.execute(f'RELEASE sp_{depth}')
+            raise
+        else:
+            self._local.depth = depth
+            if depth == 0:
+                conn.commit()
+            else:
+                conn.execute(f'RELEASE sp_{depth}')
+
+    def close_all(self):
+        """關閉所有執行緒的連線（僅在關機時呼叫）"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+_managers: Dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_db(db_path: str = 'wallet.db') -> ConnectionManager:
+    """取得指定資料庫檔案的共用連線管理器"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _managers[key] = manager
+        return manager
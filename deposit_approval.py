@@ -0,0 +1,134 @@
+"""
+儲值審核
+功能：在一個交易中批次通過儲值申請
+以一條 UPDATE ... WHERE id IN 標記申請、依用戶合併入帳金額、executemany 寫入交易與儲值紀錄
+Bot 的 /通過儲值、/批次通過儲值 與管理後台共用
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from daily_stats import add_daily_stats, add_ledger_entry
+from money import Money
+
+# 一次批次通過的申請數上限
+MAX_BATCH_DEPOSITS = 500
+
+APPROVED = '✅ 通過'
+
+
+def approve_deposit_requests(db, admin_id: int, request_ids: Optional[Iterable[int]] = None,
+                             max_amount: Optional[Money] = None, created_before: Optional[str] = None,
+                             user_id: Optional[int] = None,
+                             limit: int = MAX_BATCH_DEPOSITS) -> Tuple[List[Dict], Dict[int, Tuple[Money, Money]]]:
+    """批次通過儲值申請
+
+    Args:
+        admin_id: 審核者
+        request_ids: 指定的申請編號；None 表示所有符合條件的待審核申請
+        max_amount: 只通過轉帳金額不超過此金額的申請
+        created_before: 只通過此時間之前提出的申請（YYYY-MM-DD 或完整時間）
+        user_id: 只通過此用戶的申請
+
+    Returns:
+        (每筆申請的結果 [{'申請編號', '用戶ID', '用戶名', '轉帳金額', '入帳點數', '結果'}, ...],
+         各用戶入帳 {user_id: (入帳點數合計, 轉帳金額合計)})
+    """
+    conditions = []
+    params = []
+    ids = None
+    if request_ids is not None:
+        ids = list(dict.fromkeys(request_ids))
+        if not ids:
+            return [], {}
+        conditions.append(f"id IN ({', '.join('?' for _ in ids)})")
+        params.extend(ids)
+    else:
+        # 依條件篩選時只看待審核的申請
+        conditions.append("status = 'pending'")
+    if max_amount is not None:
+        conditions.append("amount <= ?")
+        params.append(max_amount)
+    if created_before is not None:
+        conditions.append("created_at < ?")
+        params.append(created_before)
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+
+    results = []
+    credits: Dict[int, Tuple[Money, Money]] = {}
+
+    with db.transaction() as cursor:
+        cursor.execute(f'''
+            SELECT id, user_id, username, amount, bonus_points, status
+            FROM deposit_requests
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
+            LIMIT ?
+        ''', (*params, limit))
+        rows = cursor.fetchall()
+
+        requested_users = list({row[1] for row in rows})
+        cursor.execute(f'''
+            SELECT user_id FROM wallets WHERE user_id IN ({', '.join('?' for _ in requested_users)})
+        ''', requested_users)
+        wallets = {row[0] for row in cursor.fetchall()}
+
+        approved = []
+        for request_id, owner_id, username, amount, bonus_points, status in rows:
+            amount, bonus_points = Money(amount), Money(bonus_points)
+            if status != 'pending':
+                outcome = f"此申請已處理（狀態: {status}）"
+            elif owner_id not in wallets:
+                outcome = "用戶尚未註冊錢包"
+            else:
+                outcome = APPROVED
+                approved.append((request_id, owner_id, amount, bonus_points))
+            results.append({
+                '申請編號': request_id,
+                '用戶ID': owner_id,
+                '用戶名': username,
+                '轉帳金額': amount,
+                '入帳點數': bonus_points,
+                '結果': outcome
+            })
+
+        if ids is not None:
+            found = {row[0] for row in rows}
+            results.extend({'申請編號': request_id, '用戶ID': None, '用戶名': None,
+                            '轉帳金額': None, '入帳點數': None, '結果': "找不到此申請"}
+                           for request_id in ids if request_id not in found)
+
+        if not approved:
+            return results, credits
+
+        cursor.execute(f'''
+            UPDATE deposit_requests
+            SET status = 'approved', processed_at = CURRENT_TIMESTAMP, processed_by = ?
+            WHERE id IN ({', '.join('?' for _ in approved)})
+        ''', (admin_id, *(request_id for request_id, *_ in approved)))
+
+        for _, owner_id, amount, bonus_points in approved:
+            points_total, amount_total = credits.get(owner_id, (Money(0), Money(0)))
+            credits[owner_id] = (points_total + bonus_points, amount_total + amount)
+
+        # 每位用戶只更新一次餘額
+        cursor.executemany('UPDATE wallets SET balance = balance + ? WHERE user_id = ?',
+                           [(points, owner_id) for owner_id, (points, _) in credits.items()])
+
+        # 交易與儲值紀錄仍逐筆保留，帳本可對應到每一筆申請
+        cursor.executemany('''
+            INSERT INTO transactions (user_id, amount, type, description)
+            VALUES (?, ?, ?, ?)
+        ''', [(owner_id, bonus_points, "儲值", f"台灣轉帳 ${amount} → {bonus_points} 點")
+              for _, owner_id, amount, bonus_points in approved])
+        cursor.executemany('''
+            INSERT INTO deposits (user_id, amount, method)
+            VALUES (?, ?, ?)
+        ''', [(owner_id, amount, "台灣轉帳") for _, owner_id, amount, _ in approved])
+
+        add_ledger_entry(cursor, sum(bonus_points for *_, bonus_points in approved))
+        add_daily_stats(cursor, deposit_count=len(approved),
+                        deposit_amount=sum(amount for _, _, amount, _ in approved))
+
+    return results, credits
@@ -1,20 +1,40 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import sqlite3
 from datetime import datetime
 import os
-from typing import Optional
+import time
+from typing import Literal, Optional
 from dotenv import load_dotenv
 import calendar
+import io
+import math
 
 # ============ 導入安全系統 ============
-from security_system import SecurityManager
+from security_system import SecurityManager, DAILY_DEPOSIT_LIMIT
+from db_executor import DBExecutor, DB_CALL_SECONDS
+from db_manager import get_db
+from migrations import run_migrations
+from shop_catalog import ShopCatalog, SHOP_BUY_ROUTE
+from component_router import ComponentRouter, make_custom_id, template_view
+from risk_worker import RiskWorker
+from outbound_dispatcher import OutboundDispatcher
+from user_cache import UserResolver
+from leaderboard import BalanceLeaderboard
+from ledger_verifier import LedgerVerifier
+import staff_earnings
+from daily_stats import add_daily_stats, add_ledger_entry, sum_daily_stats
+from deposit_approval import APPROVED, MAX_BATCH_DEPOSITS, approve_deposit_requests
+from money import Money
+from metrics import Counter, Gauge, Histogram, MetricsServer, top_series
+from sql_profiler import SQLProfiler
 
 # 載入 .env 文件
 load_dotenv()
 
 # ============ 儲值方案配置 ============
+# 轉帳金額（元）→ 入帳點數（元）
 DEPOSIT_PLANS = {
     300: 300,
     500: 520,
@@ -31,6 +51,7 @@ BANK_INFO = {
 }
 
 # ============ 商城商品配置 ============
+# 價格以元填寫，寫入資料庫時轉成分
 SHOP_ITEMS = {
     "陪玩1小時": {
         "price": 200,
@@ -91,11 +112,161 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='/', intents=intents)
+# ============ 效能指標 ============
+INTERACTION_SECONDS = Histogram('wallet_interaction_seconds', '斜線指令與按鈕從收到到處理完成的時間（秒）', ['kind', 'name'])
+INTERACTION_ERRORS = Counter('wallet_interaction_errors_total', '處理失敗的斜線指令與按鈕', ['kind', 'name'])
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    """記錄每個斜線指令的開始時間，完成或失敗時計入延遲統計"""
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras['started_at'] = time.perf_counter()
+        return True
+    
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        name = interaction.command.qualified_name if interaction.command else '未知指令'
+        observe_command(interaction, name)
+        INTERACTION_ERRORS.inc(kind='command', name=name)
+        await super().on_error(interaction, error)
+
+def observe_command(interaction: discord.Interaction, name: str):
+    started_at = interaction.extras.get('started_at')
+    if started_at is not None:
+        INTERACTION_SECONDS.observe(time.perf_counter() - started_at, kind='command', name=name)
+
+bot = commands.Bot(command_prefix='/', intents=intents, tree_cls=InstrumentedCommandTree)
+
+@bot.listen('on_app_command_completion')
+async def record_command_latency(interaction: discord.Interaction, command):
+    observe_command(interaction, command.qualified_name)
+
+# ============ 資料庫連線 ============
+db = get_db('wallet.db')
+
+# 設定 SQL_PROFILE=1 時從啟動就記錄所有 SQL 的耗時與執行計畫，用 /sql分析 查看報告
+if os.getenv('SQL_PROFILE'):
+    db.enable_profiler(SQLProfiler())
 
 # ============ 初始化安全系統 ============
 security_manager = SecurityManager()
 
+# ============ 商城目錄快取 ============
+shop_catalog = ShopCatalog(db)
+
+# ============ 按鈕路由 ============
+# 商城與儲值按鈕的狀態都在 custom_id 中，由 on_interaction 統一處理，重啟後仍可使用
+component_router = ComponentRouter()
+
+@bot.listen('on_interaction')
+async def route_component_interaction(interaction: discord.Interaction):
+    started_at = time.perf_counter()
+    route = await component_router.dispatch(interaction)
+    if route:
+        INTERACTION_SECONDS.observe(time.perf_counter() - started_at, kind='button', name=route)
+
+# 風控計數（寫入提交後更新）
+risk_state = security_manager.risk_state
+
+# 每隔幾輪維護從資料庫重建風控計數，修正其他程序（管理後台）造成的差異
+RISK_STATE_REBUILD_EVERY = 30
+
+# ============ 餘額排行榜 ============
+balance_leaderboard = BalanceLeaderboard()
+
+# 每隔幾輪維護與資料庫比對排行榜
+LEADERBOARD_VERIFY_EVERY = 10
+
+# ============ 帳本檢查 ============
+ledger_verifier = LedgerVerifier(db)
+
+# 每隔幾輪維護檢查一次新交易與錢包餘額是否一致
+LEDGER_VERIFY_EVERY = 60
+
+# ============ 資料庫執行器 ============
+# 一般指令與管理員的重型查詢使用不同的執行緒池，避免報表或批次風控佔滿工作執行緒
+db_executor = DBExecutor(max_workers=4, max_pending=64, name='wallet-db')
+bulk_db_executor = DBExecutor(max_workers=1, max_pending=16, name='wallet-db-bulk')
+
+async def run_db(func, *args, **kwargs):
+    """在資料庫執行緒池中執行阻塞的資料庫函式"""
+    return await db_executor.run(func, *args, **kwargs)
+
+async def run_bulk_db(func, *args, **kwargs):
+    """在管理員專用的執行緒池中執行耗時的資料庫函式"""
+    return await bulk_db_executor.run(func, *args, **kwargs)
+
+# ============ 用戶快取 ============
+# 私訊對象優先從 Bot 與伺服器成員快取取得，未命中時批次查詢並快取
+user_resolver = UserResolver(bot)
+
+# ============ 訊息發送佇列 ============
+# 指令只把通知與私訊排入佇列，由背景工作依頻道 / 用戶限速發送
+async def resolve_channel(channel_id: int):
+    return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+dispatcher = OutboundDispatcher(resolve_channel, user_resolver.get_dm_channel)
+
+# ============ 背景風控 ============
+# 每則警報訊息最多列出的用戶數
+RISK_ALERTS_PER_EMBED = 10
+
+async def analyze_user_risk(user_id: int, username: str):
+    return await run_db(security_manager.detect_suspicious_activity, user_id, username)
+
+async def send_risk_alerts(alerts):
+    """將一批可疑操作合併成警報訊息排入通知頻道"""
+    if not NOTIFICATION_CHANNEL_ID:
+        return
+    
+    for start in range(0, len(alerts), RISK_ALERTS_PER_EMBED):
+        chunk = alerts[start:start + RISK_ALERTS_PER_EMBED]
+        alert_embed = discord.Embed(
+            title="⚠️ 可疑操作警報",
+            description=f"{len(chunk)} 位用戶行為異常",
+            color=discord.Color.orange()
+        )
+        for user_id, username, warnings in chunk:
+            alert_embed.add_field(
+                name=f"{username} (ID: {user_id})",
+                value="\n".join([f"• {w}" for w in warnings])[:1024],
+                inline=False
+            )
+        dispatcher.send_channel(NOTIFICATION_CHANNEL_ID, embed=alert_embed)
+
+risk_worker = RiskWorker(analyze_user_risk, send_risk_alerts)
+
+# ============ 效能指標輸出 ============
+# 背景工作的佇列長度與計數在輸出時直接讀取各物件的屬性
+QUEUE_DEPTH = Gauge('wallet_queue_depth', '背景工作佇列中的項目數', ['queue'])
+QUEUE_DEPTH.set_function(lambda: risk_worker.queue_size, queue='risk')
+QUEUE_DEPTH.set_function(lambda: dispatcher.queue_size, queue='outbound')
+
+WORKER_EVENTS = Counter('wallet_worker_events_total', '背景工作處理結果計數', ['worker', 'result'])
+for result in ('submitted', 'coalesced', 'dropped', 'analyzed'):
+    WORKER_EVENTS.set_function(lambda result=result: getattr(risk_worker, result), worker='risk', result=result)
+for result in ('enqueued', 'sent', 'coalesced', 'retried', 'delayed', 'dropped', 'failed'):
+    WORKER_EVENTS.set_function(lambda result=result: getattr(dispatcher, result), worker='outbound', result=result)
+for result in ('cache_hits', 'gateway_queries', 'rest_fetches', 'dm_creates'):
+    WORKER_EVENTS.set_function(lambda result=result: getattr(user_resolver, result), worker='user_resolver', result=result)
+for result in ('dispatched', 'unrouted', 'errors'):
+    WORKER_EVENTS.set_function(lambda result=result: getattr(component_router, result), worker='component_router', result=result)
+
+GATEWAY_LATENCY = Gauge('wallet_gateway_latency_seconds', 'Discord gateway 心跳延遲（秒）')
+GATEWAY_LATENCY.set_function(lambda: bot.latency)
+
+def database_size() -> int:
+    """資料庫檔案大小（含 WAL）"""
+    return sum(os.path.getsize(path) for path in (db.db_path, f"{db.db_path}-wal") if os.path.exists(path))
+
+DB_FILE_BYTES = Gauge('wallet_db_file_bytes', '資料庫檔案大小（含 WAL，位元組）')
+DB_FILE_BYTES.set_function(database_size)
+
+# 只在本機提供 /metrics，可用 METRICS_HOST / METRICS_PORT 調整
+metrics_server = MetricsServer(
+    host=os.getenv('METRICS_HOST', '127.0.0.1'),
+    port=int(os.getenv('METRICS_PORT', '9108'))
+)
+
 # ============ 安全檢查裝飾器 ============
 async def check_blacklist(interaction: discord.Interaction) -> bool:
     """檢查用戶是否在黑名單"""
@@ -120,262 +291,241 @@ async def check_blacklist(interaction: discord.Interaction) -> bool:
 
 # 資料庫初始化
 def init_database():
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    run_migrations(db)
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS wallets (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT NOT NULL,
-            balance REAL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            type TEXT NOT NULL,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES wallets (user_id)
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS deposits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            method TEXT,
-            status TEXT DEFAULT 'completed',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES wallets (user_id)
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS deposit_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            username TEXT NOT NULL,
-            amount REAL NOT NULL,
-            bonus_points REAL NOT NULL,
-            screenshot_url TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            processed_at TIMESTAMP,
-            processed_by INTEGER,
-            reject_reason TEXT,
-            FOREIGN KEY (user_id) REFERENCES wallets (user_id)
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shop_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            price REAL NOT NULL,
-            description TEXT,
-            category TEXT,
-            stock INTEGER DEFAULT -1,
-            emoji TEXT,
-            enabled INTEGER DEFAULT 1,
-            commission_rate REAL DEFAULT 0.70,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_number TEXT UNIQUE NOT NULL,
-            user_id INTEGER NOT NULL,
-            username TEXT NOT NULL,
-            item_name TEXT NOT NULL,
-            item_price REAL NOT NULL,
-            quantity INTEGER DEFAULT 1,
-            total_price REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            note TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            completed_at TIMESTAMP,
-            staff_id INTEGER,
-            commission_rate REAL DEFAULT 0.70,
-            staff_earning REAL DEFAULT 0,
-            platform_fee REAL DEFAULT 0,
-            commission_paid INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES wallets (user_id)
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS commissions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_number TEXT NOT NULL,
-            staff_id INTEGER NOT NULL,
-            staff_name TEXT NOT NULL,
-            order_amount REAL NOT NULL,
-            commission_rate REAL NOT NULL,
-            staff_earning REAL NOT NULL,
-            platform_fee REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (order_number) REFERENCES orders (order_number)
-        )
-    ''')
-    
-    cursor.execute('SELECT COUNT(*) FROM shop_items')
-    if cursor.fetchone()[0] == 0:
-        for name, info in SHOP_ITEMS.items():
-            cursor.execute('''
+    with db.transaction() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM shop_items')
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany('''
                 INSERT INTO shop_items (name, price, description, category, stock, emoji, commission_rate)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (name, info["price"], info["description"], info["category"], 
-                  info["stock"], info["emoji"], info["commission_rate"]))
-    
-    conn.commit()
-    conn.close()
+            ''', [(name, Money.from_amount(info["price"]), info["description"], info["category"],
+                   info["stock"], info["emoji"], info["commission_rate"])
+                  for name, info in SHOP_ITEMS.items()])
 
 def create_wallet(user_id: int, username: str):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO wallets (user_id, username) VALUES (?, ?)', 
-                      (user_id, username))
-        conn.commit()
+        with db.transaction() as cursor:
+            cursor.execute('INSERT INTO wallets (user_id, username) VALUES (?, ?)', 
+                          (user_id, username))
+        risk_state.on_wallet_created(user_id)
+        balance_leaderboard.add_user(user_id, username)
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
-def get_balance(user_id: int) -> Optional[float]:
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+def get_balance(user_id: int) -> Optional[Money]:
+    cursor = db.cursor()
     cursor.execute('SELECT balance FROM wallets WHERE user_id = ?', (user_id,))
     result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
+    return Money(result[0]) if result else None
 
-def update_balance(user_id: int, amount: float, transaction_type: str, description: str = ""):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    
+def update_balance(user_id: int, amount: Money, transaction_type: str, description: str = ""):
     try:
-        cursor.execute('UPDATE wallets SET balance = balance + ? WHERE user_id = ?', 
-                      (amount, user_id))
-        
-        cursor.execute('''
-            INSERT INTO transactions (user_id, amount, type, description)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, amount, transaction_type, description))
-        
-        if transaction_type == '儲值':
+        with db.transaction() as cursor:
+            cursor.execute('UPDATE wallets SET balance = balance + ? WHERE user_id = ?', 
+                          (amount, user_id))
+            
             cursor.execute('''
-                INSERT INTO deposits (user_id, amount, method)
-                VALUES (?, ?, ?)
-            ''', (user_id, abs(amount), description))
+                INSERT INTO transactions (user_id, amount, type, description)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, amount, transaction_type, description))
+            
+            add_ledger_entry(cursor, amount)
+            
+            if transaction_type == '儲值':
+                cursor.execute('''
+                    INSERT INTO deposits (user_id, amount, method)
+                    VALUES (?, ?, ?)
+                ''', (user_id, abs(amount), description))
+                add_daily_stats(cursor, deposit_count=1, deposit_amount=abs(amount))
         
-        conn.commit()
+        risk_state.on_balance_changed(user_id, amount)
+        balance_leaderboard.add_balance(user_id, amount)
+        if transaction_type == '儲值':
+            risk_state.on_deposit(user_id, abs(amount))
+        elif transaction_type == '退款':
+            risk_state.on_refund(user_id)
         return True
     except Exception as e:
-        conn.rollback()
         print(f"更新餘額錯誤: {e}")
         return False
-    finally:
-        conn.close()
 
 def get_shop_items(enabled_only=True):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    cursor = db.cursor()
     if enabled_only:
         cursor.execute('SELECT name, price, description, category, stock, emoji, commission_rate FROM shop_items WHERE enabled = 1')
     else:
         cursor.execute('SELECT name, price, description, category, stock, emoji, commission_rate FROM shop_items')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return [(name, Money(price), *rest) for name, price, *rest in cursor.fetchall()]
 
 def get_shop_item(item_name: str):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    cursor = db.cursor()
     cursor.execute('SELECT name, price, description, category, stock, emoji, commission_rate FROM shop_items WHERE name = ? AND enabled = 1', (item_name,))
     result = cursor.fetchone()
-    conn.close()
-    return result
+    if not result:
+        return None
+    name, price, *rest = result
+    return (name, Money(price), *rest)
 
-def create_order(user_id: int, username: str, item_name: str, item_price: float, quantity: int, commission_rate: float, note: str = ""):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+def next_order_number(cursor) -> str:
+    """取得下一個訂單號（必須在寫入交易內呼叫）
+    
+    格式為 ORD + 日期 + 當日流水號，例如 ORD20240101000001。
+    計數器存在資料庫，由 BEGIN IMMEDIATE 的寫入鎖保證跨程序唯一，且同一天內依建立順序排序。
+    """
+    day = datetime.now().strftime('%Y%m%d')
+    cursor.execute('''
+        INSERT INTO order_sequences (day, last_seq) VALUES (?, 1)
+        ON CONFLICT(day) DO UPDATE SET last_seq = last_seq + 1
+        RETURNING last_seq
+    ''', (day,))
+    seq = cursor.fetchone()[0]
+    return f"ORD{day}{seq:06d}"
+
+# 商品已下架或價格與用戶看到的不同
+ITEM_CHANGED_REASON = "商品已下架或資訊已更新，請重新開啟 /商城"
+
+def purchase(user_id: int, username: str, item_name: str, item_price: Money, note: str = ""):
+    """購買商品：確認商品、扣款、寫入交易紀錄、建立訂單在同一個交易中完成
+    
+    商品在交易內從 shop_items 重新讀取，已下架或價格與 item_price 不同時不成交，
+    分潤比例也以資料庫為準，不依賴可能尚未更新的目錄快取。
+    扣款以 balance >= 價格 為條件，並發購買不會透支；任何一步失敗整筆回滾，不需要退款。
+    """
     try:
-        order_number = f"ORD{datetime.now().strftime('%Y%m%d%H%M%S')}{user_id % 1000:03d}"
+        quantity = 1
         total_price = item_price * quantity
-        staff_earning = total_price * commission_rate
-        platform_fee = total_price - staff_earning
         
-        cursor.execute('''
-            INSERT INTO orders (order_number, user_id, username, item_name, item_price, quantity, 
-                               total_price, note, commission_rate, staff_earning, platform_fee)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (order_number, user_id, username, item_name, item_price, quantity, 
-              total_price, note, commission_rate, staff_earning, platform_fee))
+        with db.transaction() as cursor:
+            cursor.execute('''
+                SELECT price, commission_rate FROM shop_items WHERE name = ? AND enabled = 1
+            ''', (item_name,))
+            item = cursor.fetchone()
+            if item is None or Money(item[0]) != item_price:
+                return False, ITEM_CHANGED_REASON
+            commission_rate = item[1]
+            # 分潤四捨五入到分，平台抽成取剩餘部分，兩者相加必定等於訂單金額
+            staff_earning, platform_fee = total_price.split(commission_rate)
+            
+            cursor.execute('''
+                UPDATE wallets SET balance = balance - ?
+                WHERE user_id = ? AND balance >= ?
+            ''', (total_price, user_id, total_price))
+            
+            if cursor.rowcount == 0:
+                cursor.execute('SELECT 1 FROM wallets WHERE user_id = ?', (user_id,))
+                if cursor.fetchone() is None:
+                    return False, "請先註冊錢包"
+                return False, "餘額不足"
+            
+            cursor.execute('''
+                INSERT INTO transactions (user_id, amount, type, description)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, -total_price, "消費", f"購買: {item_name}"))
+            add_ledger_entry(cursor, -total_price)
+            
+            order_number = next_order_number(cursor)
+            cursor.execute('''
+                INSERT INTO orders (order_number, user_id, username, item_name, item_price, quantity, 
+                                   total_price, note, commission_rate, staff_earning, platform_fee)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (order_number, user_id, username, item_name, item_price, quantity, 
+                  total_price, note, commission_rate, staff_earning, platform_fee))
+            add_daily_stats(cursor, order_count=1, order_amount=total_price,
+                            pending_count=1, pending_amount=total_price)
+            
+            cursor.execute('SELECT balance FROM wallets WHERE user_id = ?', (user_id,))
+            new_balance = Money(cursor.fetchone()[0])
         
-        conn.commit()
-        return order_number
+        risk_state.on_balance_set(user_id, new_balance)
+        balance_leaderboard.set_balance(user_id, new_balance)
+        risk_state.on_order_created(user_id)
+        return True, {
+            'order_number': order_number,
+            'new_balance': new_balance,
+            'commission_rate': commission_rate
+        }
     except Exception as e:
-        conn.rollback()
-        print(f"創建訂單錯誤: {e}")
-        return None
-    finally:
-        conn.close()
+        print(f"購買錯誤: {e}")
+        return False, "購買失敗，請稍後再試"
 
 def get_order(order_number: str):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    cursor = db.cursor()
     cursor.execute('''
         SELECT order_number, user_id, username, item_name, item_price, quantity, total_price, 
                status, note, created_at, staff_id, commission_rate, staff_earning, platform_fee, commission_paid
         FROM orders WHERE order_number = ?
     ''', (order_number,))
     result = cursor.fetchone()
-    conn.close()
-    return result
+    if not result:
+        return None
+    (order_number, user_id, username, item_name, item_price, quantity, total_price,
+     status, note, created_at, staff_id, commission_rate, staff_earning, platform_fee, commission_paid) = result
+    return (order_number, user_id, username, item_name, Money(item_price), quantity, Money(total_price),
+            status, note, created_at, staff_id, commission_rate, Money(staff_earning), Money(platform_fee),
+            commission_paid)
+
+def order_completion_error(commission_paid) -> Optional[str]:
+    """檢查訂單能否完成並發放分潤，可以時回傳 None（單筆與批次完成共用）
+    
+    規則：分潤尚未發放的訂單都可以完成。已標記完成但尚未發放分潤的訂單只補發分潤，
+    每日統計的完成數與營收不會重複計入。
+    """
+    if commission_paid:
+        return "分潤已發放"
+    return None
 
 def complete_order_with_commission(order_number: str, staff_id: int, staff_name: str):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    """完成訂單並發放分潤，可完成的條件見 order_completion_error()"""
     try:
-        cursor.execute('''
-            SELECT total_price, commission_rate, staff_earning, platform_fee, commission_paid
-            FROM orders WHERE order_number = ?
-        ''', (order_number,))
-        result = cursor.fetchone()
-        
-        if not result:
-            return False, "訂單不存在"
-        
-        total_price, commission_rate, staff_earning, platform_fee, commission_paid = result
-        
-        if commission_paid:
-            return False, "分潤已發放"
-        
-        cursor.execute('''
-            UPDATE orders 
-            SET status = 'completed', completed_at = CURRENT_TIMESTAMP, 
-                staff_id = ?, commission_paid = 1
-            WHERE order_number = ?
-        ''', (staff_id, order_number))
-        
-        cursor.execute('''
-            INSERT INTO commissions (order_number, staff_id, staff_name, order_amount, 
-                                    commission_rate, staff_earning, platform_fee)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (order_number, staff_id, staff_name, total_price, commission_rate, 
-              staff_earning, platform_fee))
+        with db.transaction() as cursor:
+            cursor.execute('''
+                SELECT user_id, status, DATE(created_at), total_price, commission_rate, 
+                       staff_earning, platform_fee, commission_paid
+                FROM orders WHERE order_number = ?
+            ''', (order_number,))
+            result = cursor.fetchone()
+            
+            if not result:
+                return False, "訂單不存在"
+            
+            (user_id, status, created_day, total_price, commission_rate, 
+             staff_earning, platform_fee, commission_paid) = result
+            total_price, staff_earning, platform_fee = Money(total_price), Money(staff_earning), Money(platform_fee)
+            
+            error = order_completion_error(commission_paid)
+            if error:
+                return False, error
+            
+            cursor.execute('''
+                UPDATE orders 
+                SET status = 'completed', completed_at = CURRENT_TIMESTAMP, 
+                    staff_id = ?, commission_paid = 1
+                WHERE order_number = ?
+            ''', (staff_id, order_number))
+            
+            cursor.execute('''
+                INSERT INTO commissions (order_number, staff_id, staff_name, order_amount, 
+                                        commission_rate, staff_earning, platform_fee)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (order_number, staff_id, staff_name, total_price, commission_rate, 
+                  staff_earning, platform_fee))
+            
+            if status != 'completed':
+                # 建立日的待處理轉為已完成，完成日計入完成營收
+                was_pending = status == 'pending'
+                add_daily_stats(cursor, created_day,
+                                pending_count=-1 if was_pending else 0,
+                                pending_amount=-total_price if was_pending else 0,
+                                completed_count=1, completed_amount=total_price)
+                add_daily_stats(cursor, fulfilled_count=1, fulfilled_amount=total_price)
+            add_daily_stats(cursor, commission_count=1, staff_earning=staff_earning,
+                            platform_fee=platform_fee)
+            staff_earnings.add_staff_earning(cursor, staff_id, staff_name, staff_earning, total_price)
         
-        conn.commit()
+        if status == 'pending':
+            risk_state.on_order_completed(user_id)
         return True, {
             'staff_earning': staff_earning,
             'platform_fee': platform_fee,
@@ -383,270 +533,374 @@ def complete_order_with_commission(order_number: str, staff_id: int, staff_name:
             'commission_rate': commission_rate
         }
     except Exception as e:
-        conn.rollback()
         print(f"完成訂單錯誤: {e}")
         return False, f"系統錯誤: {e}"
-    finally:
-        conn.close()
 
-def get_pending_orders():
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT order_number, user_id, username, item_name, item_price, quantity, 
-               total_price, note, created_at, staff_earning, platform_fee
-        FROM orders WHERE status = 'pending'
-        ORDER BY created_at DESC
-    ''')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+# 一次批次完成的訂單數上限
+MAX_BATCH_ORDERS = 50
 
-def get_user_orders(user_id: int, limit: int = 10):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT order_number, item_name, total_price, status, created_at
-        FROM orders WHERE user_id = ?
-        ORDER BY created_at DESC LIMIT ?
-    ''', (user_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+def complete_orders_with_commission(order_numbers, staff_id: int, staff_name: str):
+    """批次完成訂單並發放分潤
+    
+    以一次 IN 查詢驗證所有訂單、一條 UPDATE 標記完成、executemany 寫入分潤，
+    每日統計與工作人員收入合併累加後一次提交。可完成的條件與單筆完成相同（order_completion_error()），
+    無法完成的訂單略過並回傳原因。
+    
+    Returns:
+        (已完成訂單列表, [(訂單號, 失敗原因), ...])
+    """
+    order_numbers = list(dict.fromkeys(order_numbers))
+    if not order_numbers:
+        return [], []
+    
+    placeholders = ", ".join("?" for _ in order_numbers)
+    completed = []
+    failed = []
+    
+    try:
+        with db.transaction() as cursor:
+            cursor.execute(f'''
+                SELECT order_number, user_id, item_name, status, DATE(created_at), total_price, 
+                       commission_rate, staff_earning, platform_fee, commission_paid
+                FROM orders WHERE order_number IN ({placeholders})
+            ''', order_numbers)
+            found = {row[0]: row for row in cursor.fetchall()}
+            
+            for order_number in order_numbers:
+                row = found.get(order_number)
+                error = "訂單不存在" if row is None else order_completion_error(row[9])
+                if error:
+                    failed.append((order_number, error))
+                else:
+                    completed.append({
+                        'order_number': order_number,
+                        'user_id': row[1],
+                        'item_name': row[2],
+                        'status': row[3],
+                        'created_day': row[4],
+                        'total_price': Money(row[5]),
+                        'commission_rate': row[6],
+                        'staff_earning': Money(row[7]),
+                        'platform_fee': Money(row[8])
+                    })
+            
+            if not completed:
+                return [], failed
+            
+            done = [order['order_number'] for order in completed]
+            cursor.execute(f'''
+                UPDATE orders 
+                SET status = 'completed', completed_at = CURRENT_TIMESTAMP, 
+                    staff_id = ?, commission_paid = 1
+                WHERE order_number IN ({", ".join("?" for _ in done)})
+            ''', (staff_id, *done))
+            
+            cursor.executemany('''
+                INSERT INTO commissions (order_number, staff_id, staff_name, order_amount, 
+                                        commission_rate, staff_earning, platform_fee)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(order['order_number'], staff_id, staff_name, order['total_price'],
+                   order['commission_rate'], order['staff_earning'], order['platform_fee'])
+                  for order in completed])
+            
+            # 建立日的待處理轉為已完成（依建立日合併）；已標記完成的訂單只補發分潤
+            newly_completed = [order for order in completed if order['status'] != 'completed']
+            by_day = {}
+            for order in newly_completed:
+                day = by_day.setdefault(order['created_day'], {
+                    'pending_count': 0, 'pending_amount': Money(0),
+                    'completed_count': 0, 'completed_amount': Money(0)
+                })
+                if order['status'] == 'pending':
+                    day['pending_count'] -= 1
+                    day['pending_amount'] -= order['total_price']
+                day['completed_count'] += 1
+                day['completed_amount'] += order['total_price']
+            for created_day, deltas in by_day.items():
+                add_daily_stats(cursor, created_day, **deltas)
+            
+            total_price = sum(order['total_price'] for order in completed)
+            total_earning = sum(order['staff_earning'] for order in completed)
+            total_fee = sum(order['platform_fee'] for order in completed)
+            add_daily_stats(cursor, fulfilled_count=len(newly_completed),
+                            fulfilled_amount=sum(order['total_price'] for order in newly_completed),
+                            commission_count=len(completed), staff_earning=total_earning,
+                            platform_fee=total_fee)
+            staff_earnings.add_staff_earning(cursor, staff_id, staff_name, total_earning, total_price,
+                                             order_count=len(completed))
+        
+        for order in completed:
+            if order['status'] == 'pending':
+                risk_state.on_order_completed(order['user_id'])
+        return completed, failed
+    except Exception as e:
+        print(f"批次完成訂單錯誤: {e}")
+        return [], [(order_number, f"系統錯誤: {e}") for order_number in order_numbers]
+
+# ============ 分頁查詢 ============
+# 以 (created_at, id) 做 keyset 分頁：after 為上一頁最後一筆的 (created_at, id)，
+# 查詢從該筆之後繼續，不使用 OFFSET，每一頁的成本都相同
+
+def keyset_after(after, descending: bool = True) -> str:
+    """產生 keyset 分頁條件（after 為 None 時表示第一頁）"""
+    if after is None:
+        return ""
+    return f"AND (created_at, id) {'<' if descending else '>'} (?, ?)"
+
+def get_pending_orders(limit: int = 10, after=None):
+    cursor = db.cursor()
+    cursor.execute(f'''
+        SELECT order_number, user_id, username, item_name, item_price, quantity, 
+               total_price, note, staff_earning, platform_fee, created_at, id
+        FROM orders WHERE status = 'pending' {keyset_after(after)}
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', (*(after or ()), limit))
+    return [(order_number, user_id, username, item_name, Money(item_price), quantity,
+             Money(total_price), note, Money(staff_earning), Money(platform_fee), created_at, row_id)
+            for (order_number, user_id, username, item_name, item_price, quantity,
+                 total_price, note, staff_earning, platform_fee, created_at, row_id) in cursor.fetchall()]
+
+def get_user_orders(user_id: int, limit: int = 10, after=None):
+    cursor = db.cursor()
+    cursor.execute(f'''
+        SELECT order_number, item_name, total_price, status, created_at, id
+        FROM orders WHERE user_id = ? {keyset_after(after)}
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', (user_id, *(after or ()), limit))
+    return [(order_number, item_name, Money(total_price), *rest)
+            for order_number, item_name, total_price, *rest in cursor.fetchall()]
 
 def get_staff_commissions(staff_id: int, limit: int = 10):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    cursor = db.cursor()
     cursor.execute('''
         SELECT order_number, order_amount, commission_rate, staff_earning, platform_fee, created_at
         FROM commissions WHERE staff_id = ?
         ORDER BY created_at DESC LIMIT ?
     ''', (staff_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return [(order_number, Money(order_amount), commission_rate, Money(staff_earning), Money(platform_fee), created_at)
+            for (order_number, order_amount, commission_rate, staff_earning, platform_fee,
+                 created_at) in cursor.fetchall()]
 
 def get_staff_total_earnings(staff_id: int):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT SUM(staff_earning), COUNT(*)
-        FROM commissions WHERE staff_id = ?
-    ''', (staff_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result if result else (0, 0)
+    result = staff_earnings.get_staff_earnings(db, staff_id)
+    return (result[1], result[0]) if result else (0, 0)
 
 def get_platform_stats():
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*), SUM(total_price) FROM orders WHERE status = "completed"')
-    total_orders, total_revenue = cursor.fetchone()
-    
-    cursor.execute('SELECT SUM(staff_earning), SUM(platform_fee) FROM commissions')
-    total_paid_out, total_platform_fee = cursor.fetchone()
-    
-    conn.close()
+    stats = sum_daily_stats(db)
     
     return {
-        'total_orders': total_orders or 0,
-        'total_revenue': total_revenue or 0,
-        'total_paid_out': total_paid_out or 0,
-        'total_platform_fee': total_platform_fee or 0
+        'total_orders': stats['fulfilled_count'],
+        'total_revenue': stats['fulfilled_amount'],
+        'total_paid_out': stats['staff_earning'],
+        'total_platform_fee': stats['platform_fee']
     }
 
 def get_monthly_platform_stats(year: int, month: int):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    
     start_date = f"{year}-{month:02d}-01"
     if month == 12:
         end_date = f"{year+1}-01-01"
     else:
         end_date = f"{year}-{month+1:02d}-01"
     
-    cursor.execute('''
-        SELECT COUNT(*), SUM(total_price) 
-        FROM orders 
-        WHERE status = "completed" AND completed_at >= ? AND completed_at < ?
-    ''', (start_date, end_date))
-    monthly_orders, monthly_revenue = cursor.fetchone()
-    
-    cursor.execute('''
-        SELECT SUM(staff_earning), SUM(platform_fee) 
-        FROM commissions 
-        WHERE created_at >= ? AND created_at < ?
-    ''', (start_date, end_date))
-    monthly_paid_out, monthly_platform_fee = cursor.fetchone()
-    
-    conn.close()
+    stats = sum_daily_stats(db, start_date, end_date)
     
     return {
-        'monthly_orders': monthly_orders or 0,
-        'monthly_revenue': monthly_revenue or 0,
-        'monthly_paid_out': monthly_paid_out or 0,
-        'monthly_platform_fee': monthly_platform_fee or 0
+        'monthly_orders': stats['fulfilled_count'],
+        'monthly_revenue': stats['fulfilled_amount'],
+        'monthly_paid_out': stats['staff_earning'],
+        'monthly_platform_fee': stats['platform_fee']
     }
 
+def get_staff_monthly_earnings(staff_id: int, year: int, month: int):
+    result = staff_earnings.get_staff_earnings(db, staff_id, f"{year}-{month:02d}")
+    return result[:3] if result else None
+
 def get_top_earners(limit: int = 10):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT staff_name, staff_id, SUM(staff_earning) as total_earning, COUNT(*) as order_count
-        FROM commissions
-        GROUP BY staff_id
-        ORDER BY total_earning DESC
-        LIMIT ?
-    ''', (limit,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return staff_earnings.get_top_earners(db, limit)
 
-def create_deposit_request(user_id: int, username: str, amount: float, bonus_points: float, screenshot_url: str):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+def create_deposit_request(user_id: int, username: str, amount: Money, bonus_points: Money, screenshot_url: str):
     try:
-        cursor.execute('''
-            INSERT INTO deposit_requests (user_id, username, amount, bonus_points, screenshot_url)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, username, amount, bonus_points, screenshot_url))
-        conn.commit()
-        request_id = cursor.lastrowid
+        with db.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO deposit_requests (user_id, username, amount, bonus_points, screenshot_url)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, username, amount, bonus_points, screenshot_url))
+            request_id = cursor.lastrowid
         return request_id
     except Exception as e:
         print(f"創建儲值申請錯誤: {e}")
         return None
-    finally:
-        conn.close()
 
-def get_pending_requests():
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, user_id, username, amount, bonus_points, screenshot_url, created_at
+def get_pending_requests(limit: int = 10, after=None):
+    cursor = db.cursor()
+    cursor.execute(f'''
+        SELECT user_id, username, amount, bonus_points, screenshot_url, created_at, id
         FROM deposit_requests
-        WHERE status = 'pending'
-        ORDER BY created_at ASC
-    ''')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+        WHERE status = 'pending' {keyset_after(after, descending=False)}
+        ORDER BY created_at ASC, id ASC LIMIT ?
+    ''', (*(after or ()), limit))
+    return [(user_id, username, Money(amount), Money(bonus_points), *rest)
+            for user_id, username, amount, bonus_points, *rest in cursor.fetchall()]
 
 def get_deposit_request(request_id: int):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    cursor = db.cursor()
     cursor.execute('''
         SELECT id, user_id, username, amount, bonus_points, screenshot_url, status
         FROM deposit_requests
         WHERE id = ?
     ''', (request_id,))
     result = cursor.fetchone()
-    conn.close()
-    return result
-
-def approve_deposit_request(request_id: int, admin_id: int):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
+    if not result:
+        return None
+    request_id, user_id, username, amount, bonus_points, screenshot_url, status = result
+    return request_id, user_id, username, Money(amount), Money(bonus_points), screenshot_url, status
+
+def apply_deposit_credits(credits):
+    """儲值入帳提交後更新風控計數與排行榜"""
+    for user_id, (points, amount) in credits.items():
+        risk_state.on_balance_changed(user_id, points)
+        balance_leaderboard.add_balance(user_id, points)
+        risk_state.on_deposit(user_id, amount)
+
+def approve_deposit_requests_batch(request_ids=None, admin_id: int = 0, **filters):
+    """批次通過儲值申請，回傳每筆申請的結果（見 deposit_approval.approve_deposit_requests）"""
     try:
-        cursor.execute('SELECT user_id, amount, bonus_points FROM deposit_requests WHERE id = ?', (request_id,))
-        result = cursor.fetchone()
-        if not result:
-            return False, "找不到此申請"
-        
-        user_id, amount, bonus_points = result
-        
-        cursor.execute('''
-            UPDATE deposit_requests 
-            SET status = 'approved', processed_at = CURRENT_TIMESTAMP, processed_by = ?
-            WHERE id = ?
-        ''', (admin_id, request_id))
-        
-        cursor.execute('UPDATE wallets SET balance = balance + ? WHERE user_id = ?', 
-                      (bonus_points, user_id))
-        
-        cursor.execute('''
-            INSERT INTO transactions (user_id, amount, type, description)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, bonus_points, "儲值", f"台灣轉帳 ${amount} → {bonus_points} 點"))
-        
-        cursor.execute('''
-            INSERT INTO deposits (user_id, amount, method)
-            VALUES (?, ?, ?)
-        ''', (user_id, amount, "台灣轉帳"))
-        
-        conn.commit()
-        return True, "審核通過"
+        results, credits = approve_deposit_requests(db, admin_id, request_ids, **filters)
     except Exception as e:
-        conn.rollback()
-        print(f"批准儲值錯誤: {e}")
-        return False, f"系統錯誤: {e}"
-    finally:
-        conn.close()
+        print(f"批次批准儲值錯誤: {e}")
+        return None
+    apply_deposit_credits(credits)
+    return results
+
+def approve_deposit_request(request_id: int, admin_id: int):
+    results = approve_deposit_requests_batch([request_id], admin_id)
+    if results is None:
+        return False, "系統錯誤"
+    outcome = results[0]['結果']
+    if outcome != APPROVED:
+        return False, outcome
+    return True, "審核通過"
 
 def reject_deposit_request(request_id: int, admin_id: int, reason: str):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            UPDATE deposit_requests 
-            SET status = 'rejected', processed_at = CURRENT_TIMESTAMP, 
-                processed_by = ?, reject_reason = ?
-            WHERE id = ?
-        ''', (admin_id, reason, request_id))
-        conn.commit()
+        with db.transaction() as cursor:
+            cursor.execute('''
+                UPDATE deposit_requests 
+                SET status = 'rejected', processed_at = CURRENT_TIMESTAMP, 
+                    processed_by = ?, reject_reason = ?
+                WHERE id = ?
+            ''', (admin_id, reason, request_id))
         return True
     except Exception as e:
-        conn.rollback()
         print(f"拒絕儲值錯誤: {e}")
         return False
-    finally:
-        conn.close()
 
-def get_transactions(user_id: int, limit: int = 10):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT amount, type, description, created_at 
+def get_transactions(user_id: int, limit: int = 10, after=None):
+    cursor = db.cursor()
+    cursor.execute(f'''
+        SELECT amount, type, description, created_at, id 
         FROM transactions 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
+        WHERE user_id = ? {keyset_after(after)}
+        ORDER BY created_at DESC, id DESC 
         LIMIT ?
-    ''', (user_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    ''', (user_id, *(after or ()), limit))
+    return [(Money(amount), *rest) for amount, *rest in cursor.fetchall()]
 
-def get_deposits(user_id: int, limit: int = 10):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT amount, method, status, created_at 
+def get_deposits(user_id: int, limit: int = 10, after=None):
+    cursor = db.cursor()
+    cursor.execute(f'''
+        SELECT amount, method, status, created_at, id 
         FROM deposits 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
+        WHERE user_id = ? {keyset_after(after)}
+        ORDER BY created_at DESC, id DESC 
         LIMIT ?
-    ''', (user_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    ''', (user_id, *(after or ()), limit))
+    return [(Money(amount), *rest) for amount, *rest in cursor.fetchall()]
 
-def get_leaderboard(limit: int = 10):
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT username, balance 
-        FROM wallets 
-        ORDER BY balance DESC 
-        LIMIT ?
-    ''', (limit,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+def clear_balance(user_id: int) -> Optional[Money]:
+    """將餘額清零並記錄交易，回傳清零前的餘額（未註冊回傳 None）"""
+    try:
+        with db.transaction() as cursor:
+            cursor.execute('SELECT balance FROM wallets WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
+            if not result:
+                return None
+            
+            balance = Money(result[0])
+            cursor.execute('UPDATE wallets SET balance = 0 WHERE user_id = ?', (user_id,))
+            cursor.execute('''
+                INSERT INTO transactions (user_id, amount, type, description)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, -balance, "系統", "管理員清零"))
+            add_ledger_entry(cursor, -balance)
+        risk_state.on_balance_set(user_id, Money(0))
+        balance_leaderboard.set_balance(user_id, Money(0))
+        return balance
+    except Exception as e:
+        print(f"清零餘額錯誤: {e}")
+        raise
+
+# ============ 背景維護工作 ============
+def send_ledger_drift_alerts(result):
+    """將帳本檢查發現的不一致排入通知頻道，每位用戶一個欄位"""
+    drifts = result['異常用戶']
+    if not drifts or not NOTIFICATION_CHANNEL_ID:
+        return
+    
+    for start in range(0, len(drifts), RISK_ALERTS_PER_EMBED):
+        chunk = drifts[start:start + RISK_ALERTS_PER_EMBED]
+        alert_embed = discord.Embed(
+            title="🚨 帳本不一致",
+            description=f"錢包餘額與交易紀錄加總不符，共 {len(drifts)} 位用戶"
+                        f"（已檢查至交易編號 {result['已檢查至交易編號']}）",
+            color=discord.Color.red()
+        )
+        for drift in chunk:
+            wallet_balance = drift['錢包餘額']
+            if isinstance(wallet_balance, Money):
+                wallet_balance = f"${wallet_balance:.2f}"
+            alert_embed.add_field(
+                name=f"用戶 ID: {drift['用戶ID']}",
+                value=f"錢包餘額: {wallet_balance}\n帳本餘額: ${drift['帳本餘額']:.2f}\n差額: ${Money(drift['差額']):.2f}",
+                inline=False
+            )
+        dispatcher.send_channel(NOTIFICATION_CHANNEL_ID, content="@管理員", embed=alert_embed)
+
+@tasks.loop(seconds=60)
+async def maintenance_loop():
+    """定期清除到期封禁、同步管理後台對黑名單的修改、檢查商城目錄版本、寫入風險事件、重建風控計數、比對排行榜、檢查帳本"""
+    try:
+        await run_bulk_db(security_manager.purge_expired_bans)
+        await run_bulk_db(security_manager.reload_blacklist_cache)
+        await run_bulk_db(shop_catalog.refresh)
+        await run_bulk_db(security_manager.flush_risk_events)
+        if maintenance_loop.current_loop % RISK_STATE_REBUILD_EVERY == RISK_STATE_REBUILD_EVERY - 1:
+            await run_bulk_db(risk_state.rebuild)
+        if maintenance_loop.current_loop % LEADERBOARD_VERIFY_EVERY == LEADERBOARD_VERIFY_EVERY - 1:
+            corrected = await run_bulk_db(balance_leaderboard.verify, db)
+            if corrected:
+                print(f"排行榜已與資料庫同步，修正 {corrected} 位用戶")
+        if maintenance_loop.current_loop % LEDGER_VERIFY_EVERY == LEDGER_VERIFY_EVERY - 1:
+            result = await run_bulk_db(ledger_verifier.verify)
+            for drift in result['異常用戶']:
+                print(f"⚠️ 帳本不一致: 用戶 {drift['用戶ID']} 錢包餘額 {drift['錢包餘額']} / 帳本餘額 {drift['帳本餘額']}")
+            send_ledger_drift_alerts(result)
+    except Exception as e:
+        print(f"背景維護錯誤: {e}")
 
 @bot.event
 async def on_ready():
-    init_database()
+    await run_bulk_db(init_database)
+    await run_bulk_db(shop_catalog.refresh, True)
+    await run_bulk_db(risk_state.rebuild)
+    await run_bulk_db(balance_leaderboard.load, db)
+    if not maintenance_loop.is_running():
+        maintenance_loop.start()
+    risk_worker.start()
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        print(f'啟動效能指標端點失敗: {e}')
     print(f'{bot.user} 已上線！')
     try:
         synced = await bot.tree.sync()
@@ -663,7 +917,7 @@ async def register(interaction: discord.Interaction):
     user_id = interaction.user.id
     username = interaction.user.name
     
-    if create_wallet(user_id, username):
+    if await run_db(create_wallet, user_id, username):
         embed = discord.Embed(
             title="✅ 註冊成功！",
             description=f"歡迎 {username}！\n你的個人錢包已創建",
@@ -683,7 +937,7 @@ async def register(interaction: discord.Interaction):
 @bot.tree.command(name="我的餘額", description="查詢你的當前餘額")
 async def balance(interaction: discord.Interaction):
     user_id = interaction.user.id
-    balance_amount = get_balance(user_id)
+    balance_amount = await run_db(get_balance, user_id)
     
     if balance_amount is None:
         embed = discord.Embed(
@@ -709,7 +963,7 @@ async def shop(interaction: discord.Interaction):
     
     user_id = interaction.user.id
     username = interaction.user.name
-    balance = get_balance(user_id)
+    balance = await run_db(get_balance, user_id)
     
     if balance is None:
         embed = discord.Embed(
@@ -720,32 +974,12 @@ async def shop(interaction: discord.Interaction):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     
-    # 檢測可疑操作
-    warnings = security_manager.detect_suspicious_activity(user_id, username)
+    # 風控分析交給背景工作，不影響回應時間
+    risk_worker.submit(user_id, username)
     
-    if warnings:
-        # 有可疑操作，發送警告給管理員
-        if NOTIFICATION_CHANNEL_ID:
-            try:
-                channel = bot.get_channel(NOTIFICATION_CHANNEL_ID)
-                if channel:
-                    alert_embed = discord.Embed(
-                        title="⚠️ 可疑操作警報",
-                        description=f"用戶 {username} (ID: {user_id}) 行為異常",
-                        color=discord.Color.orange()
-                    )
-                    alert_embed.add_field(
-                        name="異常行為",
-                        value="\n".join([f"• {w}" for w in warnings]),
-                        inline=False
-                    )
-                    await channel.send(embed=alert_embed)
-            except:
-                pass
-    
-    items = get_shop_items()
-    
-    if not items:
+    catalog = shop_catalog.current or await run_db(shop_catalog.refresh)
+    
+    if not catalog.items:
         embed = discord.Embed(
             title="🏪 商城",
             description="目前沒有可用商品",
@@ -760,108 +994,108 @@ async def shop(interaction: discord.Interaction):
         color=discord.Color.gold()
     )
     
-    categories = {}
-    for name, price, description, category, stock, emoji, commission_rate in items:
-        if category not in categories:
-            categories[category] = []
-        categories[category].append((name, price, description, stock, emoji, commission_rate))
-    
-    for category, products in categories.items():
-        product_list = ""
-        for name, price, description, stock, emoji, commission_rate in products:
-            stock_text = f"（剩餘 {stock}）" if stock > 0 else ""
-            product_list += f"{emoji} **{name}** - ${price}\n{description}{stock_text}\n\n"
-        embed.add_field(name=f"【{category}】", value=product_list, inline=False)
+    # 商城欄位已依目錄版本預先渲染，這裡只需加上用戶餘額
+    for name, value in catalog.embed_fields:
+        embed.add_field(name=name, value=value, inline=False)
     
     embed.set_footer(text="點擊下方按鈕購買商品")
     
-    view = ShopView(items[:25])
-    await interaction.response.send_message(embed=embed, view=view)
-
-class ShopView(discord.ui.View):
-    def __init__(self, items):
-        super().__init__(timeout=300)
-        
-        for name, price, description, category, stock, emoji, commission_rate in items:
-            button = discord.ui.Button(
-                label=f"{emoji} {name} - ${price}",
-                style=discord.ButtonStyle.primary,
-                custom_id=f"buy_{name}"
-            )
-            button.callback = self.create_callback(name, price, description, category, emoji, commission_rate)
-            self.add_item(button)
-    
-    def create_callback(self, item_name: str, price: float, description: str, category: str, emoji: str, commission_rate: float):
-        async def button_callback(interaction: discord.Interaction):
-            user_id = interaction.user.id
-            username = interaction.user.name
-            balance = get_balance(user_id)
-            
-            if balance is None:
-                await interaction.response.send_message("❌ 請先註冊錢包", ephemeral=True)
-                return
-            
-            if balance < price:
-                embed = discord.Embed(
-                    title="❌ 餘額不足",
-                    description=f"此商品需要 ${price}，你的餘額只有 ${balance:.2f}",
-                    color=discord.Color.red()
-                )
-                embed.add_field(name="💡 提示", value="使用 /我要儲值 進行儲值", inline=False)
-                await interaction.response.send_message(embed=embed, ephemeral=True)
-                return
-            
-            confirm_embed = discord.Embed(
-                title=f"{emoji} 確認購買",
-                description=f"**{item_name}**\n{description}",
-                color=discord.Color.blue()
-            )
-            confirm_embed.add_field(name="💰 價格", value=f"${price}", inline=True)
-            confirm_embed.add_field(name="💳 你的餘額", value=f"${balance:.2f}", inline=True)
-            confirm_embed.add_field(name="💵 購買後餘額", value=f"${balance - price:.2f}", inline=True)
-            
-            confirm_view = ConfirmPurchaseView(item_name, price, category, commission_rate)
-            await interaction.response.send_message(embed=confirm_embed, view=confirm_view, ephemeral=True)
-        
-        return button_callback
-
-class ConfirmPurchaseView(discord.ui.View):
-    def __init__(self, item_name: str, price: float, category: str, commission_rate: float):
-        super().__init__(timeout=60)
-        self.item_name = item_name
-        self.price = price
-        self.category = category
-        self.commission_rate = commission_rate
+    await interaction.response.send_message(embed=embed, view=get_shop_view(catalog))
+
+ITEM_CHANGED_MESSAGE = f"❌ {ITEM_CHANGED_REASON}"
+
+# 商城按鈕模板依目錄版本快取，所有 /商城 訊息共用同一個
+shop_view_cache = {}
+
+def get_shop_view(catalog) -> discord.ui.View:
+    view = shop_view_cache.get(catalog.version)
+    if view is None:
+        view = template_view(*(
+            discord.ui.Button(label=spec.label, style=discord.ButtonStyle.primary, custom_id=spec.custom_id)
+            for spec in catalog.buttons
+        ))
+        shop_view_cache.clear()
+        shop_view_cache[catalog.version] = view
+    return view
+
+@component_router.route(SHOP_BUY_ROUTE)
+async def on_shop_item(interaction: discord.Interaction, item_id: str, version: str):
+    """商城商品按鈕：商品 ID 與目錄版本都在 custom_id 中，版本不同表示商品資訊已更新"""
+    item = shop_catalog.get_item_by_id(int(item_id), int(version))
+    if item is None:
+        await interaction.response.send_message(ITEM_CHANGED_MESSAGE, ephemeral=True)
+        return
     
-    @discord.ui.button(label="✅ 確認購買", style=discord.ButtonStyle.success)
-    async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
-        user_id = interaction.user.id
-        username = interaction.user.name
-        balance = get_balance(user_id)
-        
-        if balance < self.price:
-            await interaction.response.send_message("❌ 餘額不足", ephemeral=True)
-            return
-        
-        modal = PurchaseNoteModal(self.item_name, self.price, self.category, self.commission_rate)
-        await interaction.response.send_modal(modal)
+    user_id = interaction.user.id
+    balance = await run_db(get_balance, user_id)
     
-    @discord.ui.button(label="❌ 取消", style=discord.ButtonStyle.danger)
-    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+    if balance is None:
+        await interaction.response.send_message("❌ 請先註冊錢包", ephemeral=True)
+        return
+    
+    if balance < item.price:
         embed = discord.Embed(
-            title="❌ 已取消",
-            description="購買已取消",
-            color=discord.Color.grey()
+            title="❌ 餘額不足",
+            description=f"此商品需要 ${item.price}，你的餘額只有 ${balance:.2f}",
+            color=discord.Color.red()
         )
-        await interaction.response.edit_message(embed=embed, view=None)
+        embed.add_field(name="💡 提示", value="使用 /我要儲值 進行儲值", inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    confirm_embed = discord.Embed(
+        title=f"{item.emoji} 確認購買",
+        description=f"**{item.name}**\n{item.description}",
+        color=discord.Color.blue()
+    )
+    confirm_embed.add_field(name="💰 價格", value=f"${item.price}", inline=True)
+    confirm_embed.add_field(name="💳 你的餘額", value=f"${balance:.2f}", inline=True)
+    confirm_embed.add_field(name="💵 購買後餘額", value=f"${balance - item.price:.2f}", inline=True)
+    
+    # 確認按鈕帶著用戶看到的價格（分），價格變動時不會以新價格成交
+    confirm_view = template_view(
+        discord.ui.Button(label="✅ 確認購買", style=discord.ButtonStyle.success,
+                          custom_id=make_custom_id('shop:confirm', item.id, item.price.cents)),
+        discord.ui.Button(label="❌ 取消", style=discord.ButtonStyle.danger,
+                          custom_id=make_custom_id('shop:cancel'))
+    )
+    await interaction.response.send_message(embed=confirm_embed, view=confirm_view, ephemeral=True)
+
+@component_router.route('shop:confirm')
+async def on_confirm_purchase(interaction: discord.Interaction, item_id: str, price: str):
+    # 先讀一次目錄版本（主鍵查詢），快取不會比資料庫舊上一個維護週期
+    await run_db(shop_catalog.refresh)
+    item = shop_catalog.get_item_by_id(int(item_id))
+    if item is None or item.price != Money(int(price)):
+        await interaction.response.send_message(ITEM_CHANGED_MESSAGE, ephemeral=True)
+        return
+    
+    user_id = interaction.user.id
+    balance = await run_db(get_balance, user_id)
+    
+    # 這裡只是提早提示，實際扣款由 purchase() 在交易內以條件判斷
+    if balance is None or balance < item.price:
+        await interaction.response.send_message("❌ 餘額不足", ephemeral=True)
+        return
+    
+    modal = PurchaseNoteModal(item.name, item.price, item.category)
+    await interaction.response.send_modal(modal)
+
+@component_router.route('shop:cancel')
+async def on_cancel_purchase(interaction: discord.Interaction):
+    embed = discord.Embed(
+        title="❌ 已取消",
+        description="購買已取消",
+        color=discord.Color.grey()
+    )
+    await interaction.response.edit_message(embed=embed, view=None)
 
 class PurchaseNoteModal(discord.ui.Modal, title="購買資訊"):
-    def __init__(self, item_name: str, price: float, category: str, commission_rate: float):
+    def __init__(self, item_name: str, price: Money, category: str):
         super().__init__()
         self.item_name = item_name
         self.price = price
         self.category = category
-        self.commission_rate = commission_rate
     
     note = discord.ui.TextInput(
         label="備註說明（選填）",
@@ -876,20 +1110,15 @@ class PurchaseNoteModal(discord.ui.Modal, title="購買資訊"):
         username = interaction.user.name
         note_text = self.note.value or "無"
         
-        success = update_balance(user_id, -self.price, "消費", f"購買: {self.item_name}")
+        # 商品是否仍上架、價格是否相同由 purchase() 在扣款的交易內確認
+        success, result = await run_db(purchase, user_id, username, self.item_name, self.price, note_text)
         
         if not success:
-            await interaction.response.send_message("❌ 購買失敗，請稍後再試", ephemeral=True)
+            await interaction.response.send_message(f"❌ {result}", ephemeral=True)
             return
         
-        order_number = create_order(user_id, username, self.item_name, self.price, 1, self.commission_rate, note_text)
-        
-        if not order_number:
-            update_balance(user_id, self.price, "退款", f"訂單創建失敗退款: {self.item_name}")
-            await interaction.response.send_message("❌ 訂單創建失敗，已退款", ephemeral=True)
-            return
-        
-        new_balance = get_balance(user_id)
+        order_number = result['order_number']
+        new_balance = result['new_balance']
         
         user_embed = discord.Embed(
             title="✅ 購買成功！",
@@ -905,11 +1134,11 @@ class PurchaseNoteModal(discord.ui.Modal, title="購買資訊"):
         
         await interaction.response.send_message(embed=user_embed, ephemeral=True)
         
-        await self.notify_staff(interaction, order_number, user_id, username, note_text)
+        self.notify_staff(interaction, order_number, user_id, username, note_text, result['commission_rate'])
     
-    async def notify_staff(self, interaction: discord.Interaction, order_number: str, user_id: int, username: str, note: str):
-        staff_earning = self.price * self.commission_rate
-        platform_fee = self.price - staff_earning
+    def notify_staff(self, interaction: discord.Interaction, order_number: str, user_id: int, username: str, note: str,
+                     commission_rate: float):
+        staff_earning, platform_fee = self.price.split(commission_rate)
         
         staff_embed = discord.Embed(
             title="🔔 新訂單通知",
@@ -920,60 +1149,108 @@ class PurchaseNoteModal(discord.ui.Modal, title="購買資訊"):
         staff_embed.add_field(name="👤 用戶", value=f"<@{user_id}>", inline=True)
         staff_embed.add_field(name="📦 商品", value=self.item_name, inline=True)
         staff_embed.add_field(name="💰 訂單金額", value=f"${self.price}", inline=True)
-        staff_embed.add_field(name="💵 工作人員可得", value=f"${staff_earning:.2f} ({self.commission_rate*100}%)", inline=True)
+        staff_embed.add_field(name="💵 工作人員可得", value=f"${staff_earning:.2f} ({commission_rate*100}%)", inline=True)
         staff_embed.add_field(name="🏢 平台抽成", value=f"${platform_fee:.2f}", inline=True)
         staff_embed.add_field(name="📁 分類", value=self.category, inline=True)
         staff_embed.add_field(name="⏰ 時間", value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), inline=True)
         staff_embed.add_field(name="📝 用戶備註", value=note, inline=False)
         staff_embed.set_footer(text=f"使用 /完成訂單 {order_number} 標記完成並發放分潤")
         
-        if NOTIFICATION_CHANNEL_ID:
-            try:
-                channel = bot.get_channel(NOTIFICATION_CHANNEL_ID)
-                if channel:
-                    role_id = STAFF_ROLES.get(self.category)
-                    mention = f"<@&{role_id}>" if role_id else "@工作人員"
-                    await channel.send(content=mention, embed=staff_embed)
-                    return
-            except Exception as e:
-                print(f"發送通知失敗: {e}")
-        
-        try:
-            await interaction.channel.send(embed=staff_embed)
-        except:
-            pass
+        if NOTIFICATION_CHANNEL_ID and bot.get_channel(NOTIFICATION_CHANNEL_ID):
+            role_id = STAFF_ROLES.get(self.category)
+            mention = f"<@&{role_id}>" if role_id else "@工作人員"
+            dispatcher.send_channel(NOTIFICATION_CHANNEL_ID, content=mention, embed=staff_embed)
+        elif interaction.channel_id:
+            dispatcher.send_channel(interaction.channel_id, embed=staff_embed)
+
+class PaginatedView(discord.ui.View):
+    """分頁瀏覽
+    
+    fetch_page(limit, after) 為同步的資料庫函式，回傳一頁資料，
+    每列最後兩個欄位為 (created_at, id)；render_page(rows, page) 回傳該頁的 Embed。
+    每次翻頁只查詢一頁（多取一筆判斷是否還有下一頁）。
+    """
+    
+    def __init__(self, owner_id: int, fetch_page, render_page, page_size: int = 10):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.fetch_page = fetch_page
+        self.render_page = render_page
+        self.page_size = page_size
+        # 每一頁的起點（上一頁最後一筆的 keyset），第一頁為 None
+        self.page_starts = [None]
+        self.rows = []
+        self.has_next = False
+    
+    async def load_page(self) -> discord.Embed:
+        rows = await run_db(self.fetch_page, self.page_size + 1, self.page_starts[-1])
+        self.has_next = len(rows) > self.page_size
+        self.rows = rows[:self.page_size]
+        self.previous_page.disabled = len(self.page_starts) == 1
+        self.next_page.disabled = not self.has_next
+        return self.render_page(self.rows, len(self.page_starts))
+    
+    async def send(self, interaction: discord.Interaction, empty_embed: discord.Embed, ephemeral: bool = False):
+        """查詢第一頁並回覆；只有一頁時不附加翻頁按鈕"""
+        embed = await self.load_page()
+        if not self.rows:
+            await interaction.response.send_message(embed=empty_embed, ephemeral=ephemeral)
+            return
+        view = self if self.has_next else discord.utils.MISSING
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=ephemeral)
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("❌ 只有使用指令的人可以翻頁", ephemeral=True)
+            return False
+        return True
+    
+    @discord.ui.button(label="◀ 上一頁", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.page_starts) > 1:
+            self.page_starts.pop()
+        embed = await self.load_page()
+        await interaction.response.edit_message(embed=embed, view=self)
+    
+    @discord.ui.button(label="下一頁 ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.has_next:
+            created_at, row_id = self.rows[-1][-2:]
+            self.page_starts.append((created_at, row_id))
+        embed = await self.load_page()
+        await interaction.response.edit_message(embed=embed, view=self)
 
 @bot.tree.command(name="我的訂單", description="查看你的購買紀錄")
 async def my_orders(interaction: discord.Interaction):
     user_id = interaction.user.id
-    orders = get_user_orders(user_id, 10)
     
-    if not orders:
+    def render(orders, page):
         embed = discord.Embed(
-            title="📦 我的訂單",
-            description="你還沒有任何訂單",
-            color=discord.Color.grey()
+            title=f"📦 我的訂單（第 {page} 頁）",
+            color=discord.Color.blue()
         )
-        await interaction.response.send_message(embed=embed)
-        return
+        
+        for order_number, item_name, total_price, status, created_at, _ in orders:
+            status_emoji = "✅" if status == "completed" else "⏳"
+            status_text = "已完成" if status == "completed" else "處理中"
+            
+            embed.add_field(
+                name=f"{status_emoji} {order_number}",
+                value=f"商品: {item_name}\n金額: ${total_price}\n狀態: {status_text}\n時間: {created_at}",
+                inline=False
+            )
+        
+        embed.set_footer(text=f"用戶: {interaction.user.name}")
+        return embed
     
-    embed = discord.Embed(
-        title="📦 我的訂單（最近10筆）",
-        color=discord.Color.blue()
+    empty_embed = discord.Embed(
+        title="📦 我的訂單",
+        description="你還沒有任何訂單",
+        color=discord.Color.grey()
     )
     
-    for order_number, item_name, total_price, status, created_at in orders:
-        status_emoji = "✅" if status == "completed" else "⏳"
-        status_text = "已完成" if status == "completed" else "處理中"
-        
-        embed.add_field(
-            name=f"{status_emoji} {order_number}",
-            value=f"商品: {item_name}\n金額: ${total_price}\n狀態: {status_text}\n時間: {created_at}",
-            inline=False
-        )
-    
-    embed.set_footer(text=f"用戶: {interaction.user.name}")
-    await interaction.response.send_message(embed=embed)
+    view = PaginatedView(user_id, lambda limit, after: get_user_orders(user_id, limit, after), render)
+    await view.send(interaction, empty_embed)
 
 @bot.tree.command(name="我要儲值", description="申請儲值並查看轉帳資訊")
 async def deposit_request(interaction: discord.Interaction):
@@ -985,10 +1262,10 @@ async def deposit_request(interaction: discord.Interaction):
         return
     
     # 檢查儲值限制
-    can_deposit, count, amount = security_manager.check_deposit_limit(user_id)
+    can_deposit, count, amount = await run_db(security_manager.check_deposit_limit, user_id)
     
     if not can_deposit:
-        is_new = security_manager._is_new_account(user_id)
+        is_new = await run_db(security_manager._is_new_account, user_id)
         
         embed = discord.Embed(
             title="❌ 儲值限制",
@@ -1005,7 +1282,7 @@ async def deposit_request(interaction: discord.Interaction):
         else:
             embed.add_field(
                 name="今日儲值記錄",
-                value=f"次數: {count}/3\n金額: ${amount}/10000",
+                value=f"次數: {count}/3\n金額: ${amount}/{DAILY_DEPOSIT_LIMIT}",
                 inline=False
             )
         
@@ -1018,7 +1295,8 @@ async def deposit_request(interaction: discord.Interaction):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         
         # 記錄可疑操作
-        security_manager.log_suspicious_action(
+        await run_db(
+            security_manager.log_suspicious_action,
             user_id, username,
             'DEPOSIT_LIMIT_EXCEEDED',
             f"嘗試超限儲值（今日第{count+1}次）",
@@ -1026,7 +1304,7 @@ async def deposit_request(interaction: discord.Interaction):
         )
         return
     
-    balance = get_balance(user_id)
+    balance = await run_db(get_balance, user_id)
     
     if balance is None:
         embed = discord.Embed(
@@ -1064,60 +1342,74 @@ async def deposit_request(interaction: discord.Interaction):
         inline=False
     )
     
-    view = DepositView()
-    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+    await interaction.response.send_message(embed=embed, view=get_deposit_view(), ephemeral=True)
 
-class DepositView(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=300)
-        
-        for amount, points in DEPOSIT_PLANS.items():
-            button = discord.ui.Button(
-                label=f"${amount} → {points}點",
-                style=discord.ButtonStyle.primary,
-                custom_id=f"deposit_{amount}"
-            )
-            button.callback = self.create_callback(amount, points)
-            self.add_item(button)
-    
-    def create_callback(self, amount: int, points: int):
-        async def button_callback(interaction: discord.Interaction):
-            embed = discord.Embed(
-                title="💰 轉帳資訊",
-                description=f"請轉帳 **${amount}** 到以下帳戶",
-                color=discord.Color.green()
-            )
-            
-            embed.add_field(name="🏦 銀行名稱", value=BANK_INFO["銀行名稱"], inline=True)
-            embed.add_field(name="🔢 銀行代碼", value=BANK_INFO["銀行代碼"], inline=True)
-            embed.add_field(name="💳 帳號", value=BANK_INFO["帳號"], inline=False)
-            embed.add_field(name="👤 戶名", value=BANK_INFO["戶名"], inline=False)
-            embed.add_field(name="💵 轉帳金額", value=f"**${amount}**", inline=True)
-            embed.add_field(name="🎁 獲得點數", value=f"**{points} 點**", inline=True)
-            
-            embed.add_field(
-                name="\n📸 下一步",
-                value="完成轉帳後，請點擊下方按鈕上傳付款截圖",
-                inline=False
-            )
-            
-            embed.set_footer(text="請在30分鐘內完成轉帳並上傳截圖")
-            
-            upload_view = UploadView(amount, points)
-            await interaction.response.edit_message(embed=embed, view=upload_view)
-        
-        return button_callback
+def get_deposit_view() -> discord.ui.View:
+    return template_view(*(
+        discord.ui.Button(
+            label=f"${amount} → {points}點",
+            style=discord.ButtonStyle.primary,
+            custom_id=make_custom_id('deposit:plan', amount)
+        )
+        for amount, points in DEPOSIT_PLANS.items()
+    ))
+
+PLAN_CHANGED_MESSAGE = "❌ 儲值方案已變更，請重新使用 /我要儲值"
+
+@component_router.route('deposit:plan')
+async def on_deposit_plan(interaction: discord.Interaction, amount: str):
+    """儲值方案按鈕：custom_id 只帶轉帳金額，入帳點數一律以目前的 DEPOSIT_PLANS 為準"""
+    amount = int(amount)
+    points = DEPOSIT_PLANS.get(amount)
+    if points is None:
+        await interaction.response.send_message(PLAN_CHANGED_MESSAGE, ephemeral=True)
+        return
+    
+    embed = discord.Embed(
+        title="💰 轉帳資訊",
+        description=f"請轉帳 **${amount}** 到以下帳戶",
+        color=discord.Color.green()
+    )
+    
+    embed.add_field(name="🏦 銀行名稱", value=BANK_INFO["銀行名稱"], inline=True)
+    embed.add_field(name="🔢 銀行代碼", value=BANK_INFO["銀行代碼"], inline=True)
+    embed.add_field(name="💳 帳號", value=BANK_INFO["帳號"], inline=False)
+    embed.add_field(name="👤 戶名", value=BANK_INFO["戶名"], inline=False)
+    embed.add_field(name="💵 轉帳金額", value=f"**${amount}**", inline=True)
+    embed.add_field(name="🎁 獲得點數", value=f"**{points} 點**", inline=True)
+    
+    embed.add_field(
+        name="\n📸 下一步",
+        value="完成轉帳後，請點擊下方按鈕上傳付款截圖",
+        inline=False
+    )
+    
+    embed.set_footer(text="請在30分鐘內完成轉帳並上傳截圖")
+    
+    # 上傳按鈕帶著發出時間，超過期限後不再接受
+    upload_view = template_view(
+        discord.ui.Button(label="📸 上傳付款截圖", style=discord.ButtonStyle.success,
+                          custom_id=make_custom_id('deposit:upload', amount, int(time.time())))
+    )
+    await interaction.response.edit_message(embed=embed, view=upload_view)
 
-class UploadView(discord.ui.View):
-    def __init__(self, amount: int, points: int):
-        super().__init__(timeout=1800)
-        self.amount = amount
-        self.points = points
+# 選擇方案後上傳截圖的期限（秒）
+DEPOSIT_UPLOAD_WINDOW = 1800
+
+@component_router.route('deposit:upload')
+async def on_deposit_upload(interaction: discord.Interaction, amount: str, issued_at: str):
+    if time.time() - int(issued_at) > DEPOSIT_UPLOAD_WINDOW:
+        await interaction.response.send_message("❌ 上傳期限已過，請重新使用 /我要儲值", ephemeral=True)
+        return
     
-    @discord.ui.button(label="📸 上傳付款截圖", style=discord.ButtonStyle.success)
-    async def upload_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        modal = ScreenshotModal(self.amount, self.points)
-        await interaction.response.send_modal(modal)
+    amount = int(amount)
+    points = DEPOSIT_PLANS.get(amount)
+    if points is None:
+        await interaction.response.send_message(PLAN_CHANGED_MESSAGE, ephemeral=True)
+        return
+    
+    modal = ScreenshotModal(amount, points)
+    await interaction.response.send_modal(modal)
 
 class ScreenshotModal(discord.ui.Modal, title="上傳付款截圖"):
     def __init__(self, amount: int, points: int):
@@ -1146,34 +1438,33 @@ class ScreenshotModal(discord.ui.Modal, title="上傳付款截圖"):
         username = interaction.user.name
         screenshot = self.screenshot_url.value
         
+        amount = Money.from_amount(self.amount)
+        points = Money.from_amount(self.points)
+        
         # 檢查盜刷
-        if security_manager.check_stolen_card(user_id, username, self.amount):
+        if await run_db(security_manager.check_stolen_card, user_id, username, amount):
             # 發送警告給管理員
             if NOTIFICATION_CHANNEL_ID:
-                try:
-                    channel = bot.get_channel(NOTIFICATION_CHANNEL_ID)
-                    if channel:
-                        alert_embed = discord.Embed(
-                            title="🚨 疑似盜刷警報",
-                            description=f"用戶 {username} (ID: {user_id}) 的儲值行為異常",
-                            color=discord.Color.red()
-                        )
-                        alert_embed.add_field(name="儲值金額", value=f"${self.amount}", inline=True)
-                        alert_embed.add_field(name="風險等級", value="🚨 高", inline=True)
-                        alert_embed.add_field(
-                            name="建議操作",
-                            value="1. 仔細審核此儲值申請\n2. 查看用戶歷史紀錄\n3. 必要時聯繫用戶確認",
-                            inline=False
-                        )
-                        await channel.send(content="@管理員", embed=alert_embed)
-                except:
-                    pass
+                alert_embed = discord.Embed(
+                    title="🚨 疑似盜刷警報",
+                    description=f"用戶 {username} (ID: {user_id}) 的儲值行為異常",
+                    color=discord.Color.red()
+                )
+                alert_embed.add_field(name="儲值金額", value=f"${self.amount}", inline=True)
+                alert_embed.add_field(name="風險等級", value="🚨 高", inline=True)
+                alert_embed.add_field(
+                    name="建議操作",
+                    value="1. 仔細審核此儲值申請\n2. 查看用戶歷史紀錄\n3. 必要時聯繫用戶確認",
+                    inline=False
+                )
+                dispatcher.send_channel(NOTIFICATION_CHANNEL_ID, content="@管理員", embed=alert_embed)
         
         # 記錄儲值嘗試
-        security_manager.record_deposit_attempt(user_id, self.amount)
+        await run_db(security_manager.record_deposit_attempt, user_id, amount)
         
-        request_id = create_deposit_request(
-            user_id, username, self.amount, self.points, screenshot
+        request_id = await run_db(
+            create_deposit_request,
+            user_id, username, amount, points, screenshot
         )
         
         if request_id:
@@ -1199,72 +1490,74 @@ class ScreenshotModal(discord.ui.Modal, title="上傳付款截圖"):
 @bot.tree.command(name="消費紀錄", description="查看你的消費紀錄")
 async def transactions_cmd(interaction: discord.Interaction):
     user_id = interaction.user.id
-    records = get_transactions(user_id, 10)
     
-    if not records:
+    def render(records, page):
         embed = discord.Embed(
-            title="📊 消費紀錄",
-            description="目前沒有任何交易紀錄",
-            color=discord.Color.grey()
+            title=f"📊 消費紀錄（第 {page} 頁）",
+            color=discord.Color.purple()
         )
-        await interaction.response.send_message(embed=embed)
-        return
+        
+        for amount, trans_type, description, created_at, _ in records:
+            sign = "+" if amount > 0 else ""
+            embed.add_field(
+                name=f"{trans_type} - {created_at}",
+                value=f"{sign}${amount:.2f} - {description or '無說明'}",
+                inline=False
+            )
+        
+        embed.set_footer(text=f"用戶: {interaction.user.name}")
+        return embed
     
-    embed = discord.Embed(
-        title="📊 消費紀錄（最近10筆）",
-        color=discord.Color.purple()
+    empty_embed = discord.Embed(
+        title="📊 消費紀錄",
+        description="目前沒有任何交易紀錄",
+        color=discord.Color.grey()
     )
-    
-    for amount, trans_type, description, created_at in records:
-        sign = "+" if amount > 0 else ""
-        embed.add_field(
-            name=f"{trans_type} - {created_at}",
-            value=f"{sign}${amount:.2f} - {description or '無說明'}",
-            inline=False
-        )
-    
-    embed.set_footer(text=f"用戶: {interaction.user.name}")
-    await interaction.response.send_message(embed=embed)
+    
+    view = PaginatedView(user_id, lambda limit, after: get_transactions(user_id, limit, after), render)
+    await view.send(interaction, empty_embed)
 
 @bot.tree.command(name="儲值紀錄", description="查看你的儲值紀錄")
 async def deposits_history(interaction: discord.Interaction):
     user_id = interaction.user.id
-    records = get_deposits(user_id, 10)
     
-    if not records:
+    # 累計儲值直接取風控計數，不需要加總全部紀錄
+    state = await run_db(risk_state.snapshot, user_id)
+    total = state['lifetime_deposits'] if state else 0
+    
+    def render(records, page):
         embed = discord.Embed(
-            title="💳 儲值紀錄",
-            description="目前沒有任何儲值紀錄",
-            color=discord.Color.grey()
+            title=f"💳 儲值紀錄（第 {page} 頁）",
+            color=discord.Color.gold()
         )
-        await interaction.response.send_message(embed=embed)
-        return
+        
+        for amount, method, status, created_at, _ in records:
+            status_emoji = "✅" if status == "completed" else "⏳"
+            embed.add_field(
+                name=f"{status_emoji} {created_at}",
+                value=f"金額: ${amount:.2f}\n方式: {method or '未指定'}",
+                inline=False
+            )
+        
+        embed.add_field(name="累計儲值", value=f"${total:.2f}", inline=False)
+        embed.set_footer(text=f"用戶: {interaction.user.name}")
+        return embed
     
-    embed = discord.Embed(
-        title="💳 儲值紀錄（最近10筆）",
-        color=discord.Color.gold()
+    empty_embed = discord.Embed(
+        title="💳 儲值紀錄",
+        description="目前沒有任何儲值紀錄",
+        color=discord.Color.grey()
     )
     
-    total = 0
-    for amount, method, status, created_at in records:
-        total += amount
-        status_emoji = "✅" if status == "completed" else "⏳"
-        embed.add_field(
-            name=f"{status_emoji} {created_at}",
-            value=f"金額: ${amount:.2f}\n方式: {method or '未指定'}",
-            inline=False
-        )
-    
-    embed.add_field(name="累計儲值", value=f"${total:.2f}", inline=False)
-    embed.set_footer(text=f"用戶: {interaction.user.name}")
-    await interaction.response.send_message(embed=embed)
+    view = PaginatedView(user_id, lambda limit, after: get_deposits(user_id, limit, after), render)
+    await view.send(interaction, empty_embed)
 
 @bot.tree.command(name="我的收入", description="查看你的分潤收入")
 async def my_earnings(interaction: discord.Interaction):
     staff_id = interaction.user.id
     
-    total_earning, order_count = get_staff_total_earnings(staff_id)
-    commissions = get_staff_commissions(staff_id, 10)
+    total_earning, order_count = await run_db(get_staff_total_earnings, staff_id)
+    commissions = await run_db(get_staff_commissions, staff_id, 10)
     
     embed = discord.Embed(
         title="💰 我的收入",
@@ -1309,23 +1602,7 @@ async def monthly_earnings(interaction: discord.Interaction):
     staff_id = interaction.user.id
     now = datetime.now()
     
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    
-    start_date = f"{now.year}-{now.month:02d}-01"
-    if now.month == 12:
-        end_date = f"{now.year+1}-01-01"
-    else:
-        end_date = f"{now.year}-{now.month+1:02d}-01"
-    
-    cursor.execute('''
-        SELECT COUNT(*), SUM(staff_earning), SUM(order_amount)
-        FROM commissions
-        WHERE staff_id = ? AND created_at >= ? AND created_at < ?
-    ''', (staff_id, start_date, end_date))
-    
-    result = cursor.fetchone()
-    conn.close()
+    result = await run_db(get_staff_monthly_earnings, staff_id, now.year, now.month)
     
     if not result or result[0] == 0:
         embed = discord.Embed(
@@ -1365,7 +1642,7 @@ async def monthly_earnings(interaction: discord.Interaction):
 
 @bot.tree.command(name="收入排行", description="查看工作人員收入排行榜")
 async def earnings_leaderboard(interaction: discord.Interaction):
-    rankings = get_top_earners(10)
+    rankings = await run_db(get_top_earners, 10)
     
     if not rankings:
         embed = discord.Embed(
@@ -1406,42 +1683,42 @@ async def view_orders(interaction: discord.Interaction):
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    orders = get_pending_orders()
-    
-    if not orders:
+    def render(orders, page):
         embed = discord.Embed(
             title="📦 待處理訂單",
-            description="目前沒有待處理的訂單",
-            color=discord.Color.grey()
+            description=f"第 {page} 頁",
+            color=discord.Color.orange()
         )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
+        
+        for (order_number, user_id, username, item_name, item_price, quantity, 
+             total_price, note, staff_earning, platform_fee, created_at, _) in orders:
+            embed.add_field(
+                name=f"訂單 {order_number}",
+                value=(
+                    f"👤 用戶: <@{user_id}> ({username})\n"
+                    f"📦 商品: {item_name}\n"
+                    f"💰 金額: ${total_price}\n"
+                    f"💵 工作人員可得: ${staff_earning:.2f}\n"
+                    f"🏢 平台抽成: ${platform_fee:.2f}\n"
+                    f"📝 備註: {note}\n"
+                    f"⏰ 時間: {created_at}\n"
+                    f"━━━━━━━━━━━━━━━━"
+                ),
+                inline=False
+            )
+        
+        embed.set_footer(text="使用 /完成訂單 [訂單號] [@工作人員] 標記完成並發放分潤")
+        return embed
     
-    embed = discord.Embed(
+    empty_embed = discord.Embed(
         title="📦 待處理訂單",
-        description=f"共有 {len(orders)} 筆待處理訂單",
-        color=discord.Color.orange()
+        description="目前沒有待處理的訂單",
+        color=discord.Color.grey()
     )
     
-    for (order_number, user_id, username, item_name, item_price, quantity, 
-         total_price, note, created_at, staff_earning, platform_fee) in orders:
-        embed.add_field(
-            name=f"訂單 {order_number}",
-            value=(
-                f"👤 用戶: <@{user_id}> ({username})\n"
-                f"📦 商品: {item_name}\n"
-                f"💰 金額: ${total_price}\n"
-                f"💵 工作人員可得: ${staff_earning:.2f}\n"
-                f"🏢 平台抽成: ${platform_fee:.2f}\n"
-                f"📝 備註: {note}\n"
-                f"⏰ 時間: {created_at}\n"
-                f"━━━━━━━━━━━━━━━━"
-            ),
-            inline=False
-        )
-    
-    embed.set_footer(text="使用 /完成訂單 [訂單號] [@工作人員] 標記完成並發放分潤")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    # 備註最長 500 字，每頁 5 筆才不會超過 Embed 的 6000 字上限
+    view = PaginatedView(interaction.user.id, get_pending_orders, render, page_size=5)
+    await view.send(interaction, empty_embed, ephemeral=True)
 
 @bot.tree.command(name="完成訂單", description="[管理員] 標記訂單為已完成並發放分潤")
 @app_commands.describe(
@@ -1453,7 +1730,7 @@ async def complete_order_cmd(interaction: discord.Interaction, 訂單號: str, 
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    order_info = get_order(訂單號)
+    order_info = await run_db(get_order, 訂單號)
     if not order_info:
         await interaction.response.send_message("❌ 找不到此訂單", ephemeral=True)
         return
@@ -1462,15 +1739,12 @@ async def complete_order_cmd(interaction: discord.Interaction, 訂單號: str, 
      status, note, created_at, old_staff_id, commission_rate, staff_earning, 
      platform_fee, commission_paid) = order_info
     
-    if status == 'completed':
-        await interaction.response.send_message("⚠️ 此訂單已完成", ephemeral=True)
-        return
-    
+    # 能否完成由 complete_order_with_commission() 判斷，與批次完成相同（見 order_completion_error()）
     staff = 工作人員 if 工作人員 else interaction.user
     staff_id = staff.id
     staff_name = staff.name
     
-    success, result = complete_order_with_commission(訂單號, staff_id, staff_name)
+    success, result = await run_db(complete_order_with_commission, 訂單號, staff_id, staff_name)
     
     if success:
         earnings_info = result
@@ -1491,49 +1765,138 @@ async def complete_order_cmd(interaction: discord.Interaction, 訂單號: str, 
         
         await interaction.response.send_message(embed=embed)
         
-        try:
-            user = await bot.fetch_user(user_id)
-            user_embed = discord.Embed(
-                title="✅ 訂單已完成",
-                description=f"你的訂單 {訂單號} 已經完成！",
-                color=discord.Color.green()
-            )
-            user_embed.add_field(name="商品", value=item_name, inline=True)
-            user_embed.add_field(name="金額", value=f"${total_price}", inline=True)
-            user_embed.set_footer(text="感謝你的購買！")
-            
-            await user.send(embed=user_embed)
-        except:
-            pass
+        user_embed = discord.Embed(
+            title="✅ 訂單已完成",
+            description=f"你的訂單 {訂單號} 已經完成！",
+            color=discord.Color.green()
+        )
+        user_embed.add_field(name="商品", value=item_name, inline=True)
+        user_embed.add_field(name="金額", value=f"${total_price}", inline=True)
+        user_embed.set_footer(text="感謝你的購買！")
+        dispatcher.send_user(user_id, embed=user_embed)
         
         if staff_id != interaction.user.id:
-            try:
-                staff_user = await bot.fetch_user(staff_id)
-                staff_embed = discord.Embed(
-                    title="💰 收入到帳",
-                    description=f"訂單 {訂單號} 已完成",
-                    color=discord.Color.gold()
-                )
-                staff_embed.add_field(name="你的收入", value=f"${earnings_info['staff_earning']:.2f}", inline=True)
-                staff_embed.add_field(name="訂單金額", value=f"${earnings_info['total_price']:.2f}", inline=True)
-                staff_embed.add_field(name="抽成比例", value=f"{earnings_info['commission_rate']*100}%", inline=True)
-                staff_embed.set_footer(text="繼續加油！")
-                
-                await staff_user.send(embed=staff_embed)
-            except:
-                pass
+            staff_embed = discord.Embed(
+                title="💰 收入到帳",
+                description=f"訂單 {訂單號} 已完成",
+                color=discord.Color.gold()
+            )
+            staff_embed.add_field(name="你的收入", value=f"${earnings_info['staff_earning']:.2f}", inline=True)
+            staff_embed.add_field(name="訂單金額", value=f"${earnings_info['total_price']:.2f}", inline=True)
+            staff_embed.add_field(name="抽成比例", value=f"{earnings_info['commission_rate']*100}%", inline=True)
+            staff_embed.set_footer(text="繼續加油！")
+            dispatcher.send_user(staff_id, embed=staff_embed)
     else:
         await interaction.response.send_message(f"❌ 處理失敗: {result}", ephemeral=True)
 
+def notify_completed_orders(completed, staff_id: int, notify_staff: bool):
+    """批次完成後私訊客戶（每位客戶一則）與工作人員（一則彙總）"""
+    by_user = {}
+    for order in completed:
+        by_user.setdefault(order['user_id'], []).append(order)
+    
+    for user_id, orders in by_user.items():
+        user_embed = discord.Embed(
+            title="✅ 訂單已完成",
+            description=f"你有 {len(orders)} 筆訂單已經完成！",
+            color=discord.Color.green()
+        )
+        for order in orders[:25]:
+            user_embed.add_field(
+                name=order['order_number'],
+                value=f"商品: {order['item_name']}\n金額: ${order['total_price']}",
+                inline=False
+            )
+        user_embed.set_footer(text="感謝你的購買！")
+        dispatcher.send_user(user_id, embed=user_embed)
+    
+    if notify_staff:
+        total_earning = sum(order['staff_earning'] for order in completed)
+        staff_embed = discord.Embed(
+            title="💰 收入到帳",
+            description=f"{len(completed)} 筆訂單已完成",
+            color=discord.Color.gold()
+        )
+        staff_embed.add_field(name="你的收入", value=f"${total_earning:.2f}", inline=True)
+        staff_embed.add_field(
+            name="訂單總額",
+            value=f"${sum(order['total_price'] for order in completed):.2f}",
+            inline=True
+        )
+        staff_embed.set_footer(text="繼續加油！")
+        dispatcher.send_user(staff_id, embed=staff_embed)
+
+@bot.tree.command(name="批次完成訂單", description="[管理員] 一次完成多筆訂單並發放分潤")
+@app_commands.describe(
+    訂單號="要完成的訂單號，以空白或逗號分隔",
+    工作人員="負責這些訂單的工作人員（可選，預設為執行者）"
+)
+async def complete_orders_batch_cmd(interaction: discord.Interaction, 訂單號: str, 工作人員: Optional[discord.Member] = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
+        return
+    
+    order_numbers = list(dict.fromkeys(訂單號.replace('，', ' ').replace(',', ' ').split()))
+    if not order_numbers:
+        await interaction.response.send_message("❌ 請輸入至少一個訂單號", ephemeral=True)
+        return
+    if len(order_numbers) > MAX_BATCH_ORDERS:
+        await interaction.response.send_message(f"❌ 一次最多完成 {MAX_BATCH_ORDERS} 筆訂單", ephemeral=True)
+        return
+    
+    staff = 工作人員 if 工作人員 else interaction.user
+    completed, failed = await run_db(complete_orders_with_commission, order_numbers, staff.id, staff.name)
+    
+    embed = discord.Embed(
+        title="✅ 批次完成訂單" if completed else "❌ 沒有完成任何訂單",
+        description=f"完成 {len(completed)} 筆，失敗 {len(failed)} 筆",
+        color=discord.Color.green() if completed else discord.Color.red()
+    )
+    if completed:
+        embed.add_field(name="👨‍💼 工作人員", value=staff.mention, inline=True)
+        embed.add_field(
+            name="💰 訂單總額",
+            value=f"${sum(order['total_price'] for order in completed):.2f}",
+            inline=True
+        )
+        embed.add_field(
+            name="💵 工作人員收入",
+            value=f"${sum(order['staff_earning'] for order in completed):.2f}",
+            inline=True
+        )
+        embed.add_field(
+            name="🏢 平台抽成",
+            value=f"${sum(order['platform_fee'] for order in completed):.2f}",
+            inline=True
+        )
+        embed.add_field(
+            name="📋 已完成",
+            value="\n".join(order['order_number'] for order in completed)[:1024],
+            inline=False
+        )
+    if failed:
+        embed.add_field(
+            name="⚠️ 未完成",
+            value="\n".join(f"{order_number}: {reason}" for order_number, reason in failed)[:1024],
+            inline=False
+        )
+    embed.set_footer(text=f"完成者: {interaction.user.name}")
+    
+    await interaction.response.send_message(embed=embed)
+    
+    # 私訊通知在背景發送，不延遲指令回應
+    if completed:
+        notify_completed_orders(completed, staff.id, staff.id != interaction.user.id)
+
 @bot.tree.command(name="平台統計", description="[管理員] 查看平台營收統計")
 async def platform_stats(interaction: discord.Interaction):
     if not interaction.user.guild_permissions.administrator:
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    stats = get_platform_stats()
+    stats = await run_bulk_db(get_platform_stats)
     now = datetime.now()
-    monthly_stats = get_monthly_platform_stats(now.year, now.month)
+    monthly_stats = await run_bulk_db(get_monthly_platform_stats, now.year, now.month)
     
     embed = discord.Embed(
         title="📊 平台統計",
@@ -1584,39 +1947,38 @@ async def review_deposits(interaction: discord.Interaction):
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    requests = get_pending_requests()
-    
-    if not requests:
+    def render(requests, page):
         embed = discord.Embed(
             title="📋 待審核儲值申請",
-            description="目前沒有待審核的申請",
-            color=discord.Color.grey()
+            description=f"第 {page} 頁",
+            color=discord.Color.orange()
         )
-        await interaction.response.send_message(embed=embed, ephemeral=True)
-        return
+        
+        for user_id, username, amount, points, screenshot, created_at, req_id in requests:
+            embed.add_field(
+                name=f"申請 #{req_id} - {username}",
+                value=(
+                    f"👤 用戶: <@{user_id}>\n"
+                    f"💰 金額: ${amount}\n"
+                    f"🎁 點數: {points} 點\n"
+                    f"📸 截圖: [查看]({screenshot})\n"
+                    f"⏰ 時間: {created_at}\n"
+                    f"━━━━━━━━━━━━━━━━"
+                ),
+                inline=False
+            )
+        
+        embed.set_footer(text="使用 /通過儲值 或 /拒絕儲值 處理申請")
+        return embed
     
-    embed = discord.Embed(
+    empty_embed = discord.Embed(
         title="📋 待審核儲值申請",
-        description=f"共有 {len(requests)} 筆待審核",
-        color=discord.Color.orange()
+        description="目前沒有待審核的申請",
+        color=discord.Color.grey()
     )
     
-    for req_id, user_id, username, amount, points, screenshot, created_at in requests:
-        embed.add_field(
-            name=f"申請 #{req_id} - {username}",
-            value=(
-                f"👤 用戶: <@{user_id}>\n"
-                f"💰 金額: ${amount}\n"
-                f"🎁 點數: {points} 點\n"
-                f"📸 截圖: [查看]({screenshot})\n"
-                f"⏰ 時間: {created_at}\n"
-                f"━━━━━━━━━━━━━━━━"
-            ),
-            inline=False
-        )
-    
-    embed.set_footer(text="使用 /通過儲值 或 /拒絕儲值 處理申請")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    view = PaginatedView(interaction.user.id, get_pending_requests, render)
+    await view.send(interaction, empty_embed, ephemeral=True)
 
 @bot.tree.command(name="通過儲值", description="[管理員] 通過儲值申請")
 @app_commands.describe(申請編號="要通過的申請編號")
@@ -1625,7 +1987,7 @@ async def approve_deposit(interaction: discord.Interaction, 申請編號: int):
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    request_info = get_deposit_request(申請編號)
+    request_info = await run_db(get_deposit_request, 申請編號)
     if not request_info:
         await interaction.response.send_message("❌ 找不到此申請", ephemeral=True)
         return
@@ -1636,7 +1998,7 @@ async def approve_deposit(interaction: discord.Interaction, 申請編號: int):
         await interaction.response.send_message(f"❌ 此申請已處理（狀態: {status}）", ephemeral=True)
         return
     
-    success, message = approve_deposit_request(申請編號, interaction.user.id)
+    success, message = await run_db(approve_deposit_request, 申請編號, interaction.user.id)
     
     if success:
         admin_embed = discord.Embed(
@@ -1650,24 +2012,119 @@ async def approve_deposit(interaction: discord.Interaction, 申請編號: int):
         
         await interaction.response.send_message(embed=admin_embed)
         
-        try:
-            user = await bot.fetch_user(user_id)
-            user_embed = discord.Embed(
-                title="🎉 儲值審核通過！",
-                description=f"你的儲值申請已通過，{points} 點已入帳",
-                color=discord.Color.green()
-            )
-            user_embed.add_field(name="申請編號", value=f"#{申請編號}", inline=True)
-            user_embed.add_field(name="轉帳金額", value=f"${amount}", inline=True)
-            user_embed.add_field(name="入帳點數", value=f"{points} 點", inline=True)
-            user_embed.set_footer(text="感謝你的儲值！")
-            
-            await user.send(embed=user_embed)
-        except:
-            pass
+        user_embed = discord.Embed(
+            title="🎉 儲值審核通過！",
+            description=f"你的儲值申請已通過，{points} 點已入帳",
+            color=discord.Color.green()
+        )
+        user_embed.add_field(name="申請編號", value=f"#{申請編號}", inline=True)
+        user_embed.add_field(name="轉帳金額", value=f"${amount}", inline=True)
+        user_embed.add_field(name="入帳點數", value=f"{points} 點", inline=True)
+        user_embed.set_footer(text="感謝你的儲值！")
+        dispatcher.send_user(user_id, embed=user_embed)
     else:
         await interaction.response.send_message(f"❌ 處理失敗: {message}", ephemeral=True)
 
+def notify_approved_deposits(approved):
+    """批次通過後私訊每位用戶一則入帳通知"""
+    by_user = {}
+    for result in approved:
+        by_user.setdefault(result['用戶ID'], []).append(result)
+    
+    for user_id, requests in by_user.items():
+        points = sum(result['入帳點數'] for result in requests)
+        user_embed = discord.Embed(
+            title="🎉 儲值審核通過！",
+            description=f"你的 {len(requests)} 筆儲值申請已通過，{points} 點已入帳",
+            color=discord.Color.green()
+        )
+        for result in requests[:25]:
+            user_embed.add_field(
+                name=f"申請編號 #{result['申請編號']}",
+                value=f"轉帳金額: ${result['轉帳金額']}\n入帳點數: {result['入帳點數']} 點",
+                inline=False
+            )
+        user_embed.set_footer(text="感謝你的儲值！")
+        dispatcher.send_user(user_id, embed=user_embed)
+
+@bot.tree.command(name="批次通過儲值", description="[管理員] 一次通過多筆儲值申請")
+@app_commands.describe(
+    申請編號="要通過的申請編號，以空白或逗號分隔（留空則依條件篩選待審核申請）",
+    金額上限="只通過轉帳金額不超過此金額的申請",
+    申請日期前="只通過此日期之前提出的申請 (YYYY-MM-DD)",
+    全部待審核="未指定編號與條件時，確認通過所有待審核申請"
+)
+async def approve_deposits_batch(interaction: discord.Interaction, 申請編號: Optional[str] = None,
+                                 金額上限: Optional[float] = None, 申請日期前: Optional[str] = None,
+                                 全部待審核: bool = False):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
+        return
+    
+    request_ids = None
+    if 申請編號:
+        try:
+            request_ids = [int(value.lstrip('#')) for value in 申請編號.replace('，', ' ').replace(',', ' ').split()]
+        except ValueError:
+            await interaction.response.send_message("❌ 申請編號格式錯誤", ephemeral=True)
+            return
+        if len(request_ids) > MAX_BATCH_DEPOSITS:
+            await interaction.response.send_message(f"❌ 一次最多通過 {MAX_BATCH_DEPOSITS} 筆申請", ephemeral=True)
+            return
+    
+    if 申請日期前:
+        try:
+            datetime.strptime(申請日期前, '%Y-%m-%d')
+        except ValueError:
+            await interaction.response.send_message("❌ 日期格式錯誤（YYYY-MM-DD）", ephemeral=True)
+            return
+    
+    if request_ids is None and 金額上限 is None and not 申請日期前 and not 全部待審核:
+        await interaction.response.send_message("❌ 請指定申請編號或篩選條件，或勾選全部待審核", ephemeral=True)
+        return
+    
+    await interaction.response.defer()
+    
+    results = await run_db(
+        approve_deposit_requests_batch, request_ids, interaction.user.id,
+        max_amount=Money.from_amount(金額上限) if 金額上限 is not None else None,
+        created_before=申請日期前 or None
+    )
+    if results is None:
+        await interaction.followup.send("❌ 處理失敗，請稍後再試", ephemeral=True)
+        return
+    
+    approved = [result for result in results if result['結果'] == APPROVED]
+    failed = [result for result in results if result['結果'] != APPROVED]
+    
+    embed = discord.Embed(
+        title="✅ 批次通過儲值" if approved else "❌ 沒有通過任何申請",
+        description=f"通過 {len(approved)} 筆，失敗 {len(failed)} 筆",
+        color=discord.Color.green() if approved else discord.Color.red()
+    )
+    if approved:
+        embed.add_field(name="入帳用戶", value=f"{len({result['用戶ID'] for result in approved})} 位", inline=True)
+        embed.add_field(name="轉帳總額", value=f"${sum(result['轉帳金額'] for result in approved)}", inline=True)
+        embed.add_field(name="入帳點數", value=f"{sum(result['入帳點數'] for result in approved)} 點", inline=True)
+        embed.add_field(
+            name="📋 已通過",
+            value="\n".join(f"#{result['申請編號']} <@{result['用戶ID']}> {result['入帳點數']} 點"
+                            for result in approved)[:1024],
+            inline=False
+        )
+    if failed:
+        embed.add_field(
+            name="⚠️ 未通過",
+            value="\n".join(f"#{result['申請編號']}: {result['結果']}" for result in failed)[:1024],
+            inline=False
+        )
+    embed.set_footer(text=f"審核者: {interaction.user.name}")
+    
+    await interaction.followup.send(embed=embed)
+    
+    if approved:
+        notify_approved_deposits(approved)
+
 @bot.tree.command(name="拒絕儲值", description="[管理員] 拒絕儲值申請")
 @app_commands.describe(申請編號="要拒絕的申請編號", 原因="拒絕原因")
 async def reject_deposit(interaction: discord.Interaction, 申請編號: int, 原因: str):
@@ -1675,7 +2132,7 @@ async def reject_deposit(interaction: discord.Interaction, 申請編號: int, 
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    request_info = get_deposit_request(申請編號)
+    request_info = await run_db(get_deposit_request, 申請編號)
     if not request_info:
         await interaction.response.send_message("❌ 找不到此申請", ephemeral=True)
         return
@@ -1686,7 +2143,7 @@ async def reject_deposit(interaction: discord.Interaction, 申請編號: int, 
         await interaction.response.send_message(f"❌ 此申請已處理（狀態: {status}）", ephemeral=True)
         return
     
-    success = reject_deposit_request(申請編號, interaction.user.id, 原因)
+    success = await run_db(reject_deposit_request, 申請編號, interaction.user.id, 原因)
     
     if success:
         admin_embed = discord.Embed(
@@ -1700,20 +2157,15 @@ async def reject_deposit(interaction: discord.Interaction, 申請編號: int, 
         
         await interaction.response.send_message(embed=admin_embed)
         
-        try:
-            user = await bot.fetch_user(user_id)
-            user_embed = discord.Embed(
-                title="❌ 儲值申請被拒絕",
-                description="你的儲值申請未通過審核",
-                color=discord.Color.red()
-            )
-            user_embed.add_field(name="申請編號", value=f"#{申請編號}", inline=True)
-            user_embed.add_field(name="拒絕原因", value=原因, inline=False)
-            user_embed.set_footer(text="如有疑問請聯繫管理員")
-            
-            await user.send(embed=user_embed)
-        except:
-            pass
+        user_embed = discord.Embed(
+            title="❌ 儲值申請被拒絕",
+            description="你的儲值申請未通過審核",
+            color=discord.Color.red()
+        )
+        user_embed.add_field(name="申請編號", value=f"#{申請編號}", inline=True)
+        user_embed.add_field(name="拒絕原因", value=原因, inline=False)
+        user_embed.set_footer(text="如有疑問請聯繫管理員")
+        dispatcher.send_user(user_id, embed=user_embed)
     else:
         await interaction.response.send_message("❌ 處理失敗", ephemeral=True)
 
@@ -1724,17 +2176,18 @@ async def add_money(interaction: discord.Interaction, 用戶: discord.Member, 
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
+    金額 = Money.from_amount(金額)
     if 金額 <= 0:
         await interaction.response.send_message("❌ 金額必須大於 0", ephemeral=True)
         return
     
-    balance = get_balance(用戶.id)
+    balance = await run_db(get_balance, 用戶.id)
     if balance is None:
         await interaction.response.send_message(f"❌ {用戶.mention} 尚未註冊錢包", ephemeral=True)
         return
     
-    if update_balance(用戶.id, 金額, "儲值", 說明):
-        new_balance = get_balance(用戶.id)
+    if await run_db(update_balance, 用戶.id, 金額, "儲值", 說明):
+        new_balance = await run_db(get_balance, 用戶.id)
         embed = discord.Embed(
             title="✅ 加錢成功",
             color=discord.Color.green()
@@ -1755,17 +2208,18 @@ async def deduct_money(interaction: discord.Interaction, 用戶: discord.Member,
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
+    金額 = Money.from_amount(金額)
     if 金額 <= 0:
         await interaction.response.send_message("❌ 金額必須大於 0", ephemeral=True)
         return
     
-    balance = get_balance(用戶.id)
+    balance = await run_db(get_balance, 用戶.id)
     if balance is None:
         await interaction.response.send_message(f"❌ {用戶.mention} 尚未註冊錢包", ephemeral=True)
         return
     
-    if update_balance(用戶.id, -金額, "消費", 說明):
-        new_balance = get_balance(用戶.id)
+    if await run_db(update_balance, 用戶.id, -金額, "消費", 說明):
+        new_balance = await run_db(get_balance, 用戶.id)
         embed = discord.Embed(
             title="✅ 扣錢成功",
             color=discord.Color.orange()
@@ -1786,21 +2240,11 @@ async def reset_balance(interaction: discord.Interaction, 用戶: discord.Member
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    balance = get_balance(用戶.id)
+    balance = await run_db(clear_balance, 用戶.id)
     if balance is None:
         await interaction.response.send_message(f"❌ {用戶.mention} 尚未註冊錢包", ephemeral=True)
         return
     
-    conn = sqlite3.connect('wallet.db')
-    cursor = conn.cursor()
-    cursor.execute('UPDATE wallets SET balance = 0 WHERE user_id = ?', (用戶.id,))
-    cursor.execute('''
-        INSERT INTO transactions (user_id, amount, type, description)
-        VALUES (?, ?, ?, ?)
-    ''', (用戶.id, -balance, "系統", "管理員清零"))
-    conn.commit()
-    conn.close()
-    
     embed = discord.Embed(
         title="✅ 清零成功",
         description=f"{用戶.mention} 的餘額已清零",
@@ -1813,7 +2257,7 @@ async def reset_balance(interaction: discord.Interaction, 用戶: discord.Member
 
 @bot.tree.command(name="全服餘額排行", description="查看全服務器餘額排行榜")
 async def leaderboard(interaction: discord.Interaction):
-    rankings = get_leaderboard(10)
+    rankings = balance_leaderboard.top(10)
     
     if not rankings:
         embed = discord.Embed(
@@ -1840,6 +2284,29 @@ async def leaderboard(interaction: discord.Interaction):
     
     await interaction.response.send_message(embed=embed)
 
+@bot.tree.command(name="我的排名", description="查看你在全服餘額排行榜的名次")
+async def my_rank(interaction: discord.Interaction):
+    result = balance_leaderboard.rank(interaction.user.id)
+    
+    if result is None:
+        embed = discord.Embed(
+            title="❌ 尚未註冊",
+            description="請先使用 /註冊 創建錢包",
+            color=discord.Color.red()
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    
+    rank, total, balance = result
+    embed = discord.Embed(
+        title="🏆 我的排名",
+        color=discord.Color.gold()
+    )
+    embed.add_field(name="名次", value=f"第 {rank} 名 / 共 {total} 人", inline=True)
+    embed.add_field(name="餘額", value=f"${balance:.2f}", inline=True)
+    embed.set_footer(text=f"用戶: {interaction.user.name}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 # ============ 安全管理指令 ============
 
 @bot.tree.command(name="封禁用戶", description="[管理員] 將用戶加入黑名單")
@@ -1856,7 +2323,8 @@ async def ban_user(interaction: discord.Interaction, 用戶: discord.Member,
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    success = security_manager.add_to_blacklist(
+    success = await run_db(
+        security_manager.add_to_blacklist,
         用戶.id, 用戶.name, 原因, interaction.user.id, 天數, 備註
     )
     
@@ -1877,18 +2345,14 @@ async def ban_user(interaction: discord.Interaction, 用戶: discord.Member,
         await interaction.response.send_message(embed=embed)
         
         # 通知被封禁的用戶
-        try:
-            user_embed = discord.Embed(
-                title="🚫 帳號已被封禁",
-                description=f"你的帳號已被封禁 {duration_text}",
-                color=discord.Color.red()
-            )
-            user_embed.add_field(name="封禁原因", value=原因, inline=False)
-            user_embed.add_field(name="申訴方式", value="請聯繫伺服器管理員", inline=False)
-            
-            await 用戶.send(embed=user_embed)
-        except:
-            pass
+        user_embed = discord.Embed(
+            title="🚫 帳號已被封禁",
+            description=f"你的帳號已被封禁 {duration_text}",
+            color=discord.Color.red()
+        )
+        user_embed.add_field(name="封禁原因", value=原因, inline=False)
+        user_embed.add_field(name="申訴方式", value="請聯繫伺服器管理員", inline=False)
+        dispatcher.send_user(用戶.id, embed=user_embed)
     else:
         await interaction.response.send_message("❌ 封禁失敗", ephemeral=True)
 
@@ -1900,7 +2364,7 @@ async def unban_user(interaction: discord.Interaction, 用戶: discord.Member):
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    success = security_manager.remove_from_blacklist(用戶.id)
+    success = await run_db(security_manager.remove_from_blacklist, 用戶.id)
     
     if success:
         embed = discord.Embed(
@@ -1913,15 +2377,12 @@ async def unban_user(interaction: discord.Interaction, 用戶: discord.Member):
         await interaction.response.send_message(embed=embed)
         
         # 通知被解封的用戶
-        try:
-            user_embed = discord.Embed(
-                title="✅ 帳號已解封",
-                description="你的帳號已被解除封禁，現在可以正常使用了",
-                color=discord.Color.green()
-            )
-            await 用戶.send(embed=user_embed)
-        except:
-            pass
+        user_embed = discord.Embed(
+            title="✅ 帳號已解封",
+            description="你的帳號已被解除封禁，現在可以正常使用了",
+            color=discord.Color.green()
+        )
+        dispatcher.send_user(用戶.id, embed=user_embed)
     else:
         await interaction.response.send_message("❌ 解封失敗或該用戶不在黑名單中", ephemeral=True)
 
@@ -1937,13 +2398,13 @@ async def check_user_security(interaction: discord.Interaction, 用戶: discord.
     is_banned, ban_reason = security_manager.is_blacklisted(用戶.id)
     
     # 檢查可疑操作
-    warnings = security_manager.detect_suspicious_activity(用戶.id, 用戶.name)
+    warnings = await run_db(security_manager.detect_suspicious_activity, 用戶.id, 用戶.name)
     
     # 檢查儲值限制
-    can_deposit, deposit_count, deposit_amount = security_manager.check_deposit_limit(用戶.id)
+    can_deposit, deposit_count, deposit_amount = await run_db(security_manager.check_deposit_limit, 用戶.id)
     
     # 檢查是否為新帳號
-    is_new = security_manager._is_new_account(用戶.id)
+    is_new = await run_db(security_manager._is_new_account, 用戶.id)
     
     embed = discord.Embed(
         title=f"🔍 用戶安全檢查 - {用戶.name}",
@@ -1983,7 +2444,7 @@ async def view_blacklist(interaction: discord.Interaction):
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    blacklist = security_manager.get_blacklist(20)
+    blacklist = await run_db(security_manager.get_blacklist, 20)
     
     if not blacklist:
         embed = discord.Embed(
@@ -2023,7 +2484,7 @@ async def view_risk_events(interaction: discord.Interaction):
         await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
         return
     
-    events = security_manager.get_risk_events(handled=False, limit=20)
+    events = await run_db(security_manager.get_risk_events, handled=False, limit=20)
     
     if not events:
         embed = discord.Embed(
@@ -2073,7 +2534,7 @@ async def auto_risk_control(interaction: discord.Interaction):
     
     await interaction.response.defer(ephemeral=True)
     
-    results = security_manager.auto_handle_risks()
+    results = await run_bulk_db(security_manager.auto_handle_risks)
     
     embed = discord.Embed(
         title="🤖 自動風控執行完成",
@@ -2094,9 +2555,111 @@ async def auto_risk_control(interaction: discord.Interaction):
     
     await interaction.followup.send(embed=embed, ephemeral=True)
 
+def format_latency_rows(rows) -> str:
+    """每列顯示標籤中最後一個值（指令名稱或函式名稱）與延遲統計"""
+    lines = [
+        f"`{key[-1]}` {stats['count']} 次｜平均 {stats['avg']*1000:.0f}ms｜p95 {stats['p95']*1000:.0f}ms｜合計 {stats['sum']:.1f}s"
+        for key, stats in rows
+    ]
+    return "\n".join(lines)[:1024] or "尚無資料"
+
+@bot.tree.command(name="效能統計", description="[管理員] 查看指令延遲、資料庫耗時與佇列狀態")
+async def performance_stats(interaction: discord.Interaction):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
+        return
+    
+    embed = discord.Embed(
+        title="📈 效能統計",
+        description="自 Bot 啟動以來的累計數據",
+        color=discord.Color.blue()
+    )
+    embed.add_field(
+        name="⏱️ 最慢的指令與按鈕（依 p95）",
+        value=format_latency_rows(top_series(INTERACTION_SECONDS, 'p95', 8)),
+        inline=False
+    )
+    embed.add_field(
+        name="🗄️ 資料庫函式（依總耗時）",
+        value=format_latency_rows(top_series(DB_CALL_SECONDS, 'sum', 8)),
+        inline=False
+    )
+    embed.add_field(
+        name="📬 佇列",
+        value=(
+            f"資料庫: 執行中 {db_executor.in_flight}／等待 {db_executor.waiting}\n"
+            f"資料庫（管理）: 執行中 {bulk_db_executor.in_flight}／等待 {bulk_db_executor.waiting}\n"
+            f"風控: {risk_worker.queue_size}（丟棄 {risk_worker.dropped}）\n"
+            f"訊息發送: {dispatcher.queue_size}（延遲 {dispatcher.delayed}／丟棄 {dispatcher.dropped}／失敗 {dispatcher.failed}）"
+        ),
+        inline=False
+    )
+    latency = bot.latency
+    embed.add_field(name="📡 Gateway 延遲", value=f"{latency*1000:.0f}ms" if math.isfinite(latency) else "未連線", inline=True)
+    embed.add_field(name="💾 資料庫大小", value=f"{database_size() / 1024 / 1024:.1f} MB", inline=True)
+    embed.set_footer(text=f"完整指標: http://{metrics_server.host}:{metrics_server.port}/metrics")
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# /sql分析 顯示的語句數
+SQL_REPORT_ROWS = 10
+
+@bot.tree.command(name="sql分析", description="[管理員] 記錄 SQL 耗時並找出整張表掃描的語句")
+@app_commands.describe(動作="報告：顯示耗時排行並附上完整報告；開始／停止：切換記錄")
+async def sql_profile(interaction: discord.Interaction, 動作: Literal['報告', '開始', '停止'] = '報告'):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ 此指令僅限管理員使用", ephemeral=True)
+        return
+    
+    if 動作 == '開始':
+        if db.profiler is None:
+            db.enable_profiler(SQLProfiler())
+        await interaction.response.send_message("✅ 已開始記錄 SQL，稍後使用 /sql分析 查看報告", ephemeral=True)
+        return
+    
+    if 動作 == '停止':
+        db.disable_profiler()
+        await interaction.response.send_message("✅ 已停止記錄 SQL", ephemeral=True)
+        return
+    
+    profiler = db.profiler
+    if profiler is None:
+        await interaction.response.send_message("❌ 尚未開始記錄，請使用 /sql分析 動作:開始 或設定 SQL_PROFILE=1", ephemeral=True)
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    # 第一次出現的語句在這裡執行 EXPLAIN QUERY PLAN
+    report = await run_bulk_db(profiler.format_report, db)
+    rows = profiler.report_rows(limit=SQL_REPORT_ROWS)
+    scans = [row for row in rows if '全表掃描' in row['警告']]
+    
+    embed = discord.Embed(
+        title="🧮 SQL 耗時排行",
+        description=f"前 {len(rows)} 名中有 {len(scans)} 條語句整張表掃描，完整報告見附件",
+        color=discord.Color.orange() if scans else discord.Color.blue()
+    )
+    for rank, row in enumerate(rows, 1):
+        marker = "⚠️ " if '全表掃描' in row['警告'] else ""
+        value = f"```sql\n{row['語句'][:400]}\n```"
+        if row['警告'] and row['警告'] != '✅':
+            value += f"\n{row['警告']}"
+        embed.add_field(
+            name=f"#{rank} {marker}{row['總耗時(ms)']}ms｜{row['次數']} 次｜平均 {row['平均(ms)']}ms｜{row['列數']} 列",
+            value=value[:1024],
+            inline=False
+        )
+    
+    report_file = discord.File(io.BytesIO(report.encode('utf-8')), filename="sql_profile.txt")
+    await interaction.followup.send(embed=embed, file=report_file, ephemeral=True)
+
 if __name__ == "__main__":
     TOKEN = os.getenv('DISCORD_TOKEN')
     if not TOKEN:
         print("錯誤: 請設置 DISCORD_TOKEN 環境變數")
     else:
-        bot.run(TOKEN)
\ No newline at end of file
+        bot.run(TOKEN)
+        db_executor.shutdown()
+        security_manager.flush_risk_events()
+        bulk_db_executor.shutdown()
+        db.close_all()
\ No newline at end of file
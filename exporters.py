@@ -0,0 +1,77 @@
+"""
+串流匯出
+功能：直接從資料庫游標分批讀取並寫出 CSV、NDJSON、JSON 陣列，可選 gzip 壓縮
+不論資料筆數多少，記憶體中最多只保留一批資料
+"""
+
+import csv
+import gzip
+import json
+from typing import IO, Sequence, Tuple
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'json')
+
+# 每次從游標讀取的筆數
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _open_output(filename: str, fmt: str, compress: bool) -> Tuple[IO, str]:
+    """開啟輸出檔案，回傳 (檔案, 實際檔名)"""
+    # CSV 加上 BOM，讓 Excel 正確顯示中文
+    encoding = 'utf-8-sig' if fmt == 'csv' else 'utf-8'
+    if compress:
+        if not filename.endswith('.gz'):
+            filename += '.gz'
+        return gzip.open(filename, 'wt', encoding=encoding, newline=''), filename
+    return open(filename, 'w', encoding=encoding, newline=''), filename
+
+
+def export_cursor(cursor, headers: Sequence[str], filename: str, fmt: str = 'csv',
+                  compress: bool = False, chunk_size: int = EXPORT_CHUNK_SIZE) -> Tuple[int, str]:
+    """將已執行查詢的游標結果串流寫入檔案
+
+    Args:
+        cursor: 已執行 SELECT 的游標
+        headers: 欄位名稱（順序與 SELECT 欄位相同）
+        filename: 輸出檔名（compress=True 時自動加上 .gz）
+        fmt: 'csv'、'ndjson'（每行一筆 JSON）或 'json'（JSON 陣列）
+
+    Returns:
+        (匯出筆數, 實際檔名)
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支援的匯出格式: {fmt}")
+
+    headers = list(headers)
+    count = 0
+    f, filename = _open_output(filename, fmt, compress)
+
+    with f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(headers)
+        elif fmt == 'json':
+            f.write('[')
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            if fmt == 'csv':
+                writer.writerows(rows)
+                count += len(rows)
+                continue
+
+            for row in rows:
+                record = json.dumps(dict(zip(headers, row)), ensure_ascii=False)
+                if fmt == 'ndjson':
+                    f.write(record + '\n')
+                else:
+                    f.write(('\n  ' if count == 0 else ',\n  ') + record)
+                count += 1
+
+        if fmt == 'json':
+            f.write('\n]\n' if count else ']\n')
+
+    return count, filename
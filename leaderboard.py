@@ -0,0 +1,112 @@
+"""
+餘額排行榜
+功能：在記憶體中以排序陣列維護所有用戶餘額，提供前 N 名與個人排名查詢
+餘額變動時由呼叫端更新；啟動時從資料庫載入，並定期與資料庫比對修正
+"""
+
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from money import Money, ZERO
+
+
+class BalanceLeaderboard:
+    """餘額排行榜
+
+    _keys 依 (-餘額, user_id) 排序，排名以二分搜尋取得（O(log n)），
+    前 N 名直接取陣列開頭，不需掃描資料表。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[int, int]] = []
+        self._balances: Dict[int, Money] = {}
+        self._names: Dict[int, str] = {}
+
+    def load(self, db) -> int:
+        """從資料庫載入所有錢包，回傳用戶數"""
+        cursor = db.cursor()
+        cursor.execute('SELECT user_id, username, balance FROM wallets')
+        rows = cursor.fetchall()
+
+        with self._lock:
+            self._balances = {user_id: Money(balance or 0) for user_id, _, balance in rows}
+            self._names = {user_id: username for user_id, username, _ in rows}
+            self._keys = sorted((-balance, user_id) for user_id, balance in self._balances.items())
+        return len(rows)
+
+    def verify(self, db) -> int:
+        """與資料庫比對並修正差異（例如管理後台直接修改的餘額），回傳修正的用戶數"""
+        cursor = db.cursor()
+        cursor.execute('SELECT user_id, username, balance FROM wallets')
+        rows = cursor.fetchall()
+
+        corrected = 0
+        with self._lock:
+            seen = set()
+            for user_id, username, balance in rows:
+                seen.add(user_id)
+                balance = Money(balance or 0)
+                self._names[user_id] = username
+                if self._balances.get(user_id) != balance:
+                    self._set(user_id, balance)
+                    corrected += 1
+
+            for user_id in [uid for uid in self._balances if uid not in seen]:
+                self._remove(user_id)
+                self._names.pop(user_id, None)
+                corrected += 1
+        return corrected
+
+    # ============ 更新 ============
+
+    def _remove(self, user_id: int):
+        balance = self._balances.pop(user_id, None)
+        if balance is None:
+            return
+        key = (-balance, user_id)
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def _set(self, user_id: int, balance: Money):
+        self._remove(user_id)
+        self._balances[user_id] = balance
+        insort(self._keys, (-balance, user_id))
+
+    def add_user(self, user_id: int, username: str, balance: Money = ZERO):
+        """新增錢包"""
+        with self._lock:
+            self._names[user_id] = username
+            self._set(user_id, balance)
+
+    def set_balance(self, user_id: int, balance: Money):
+        """設定餘額（已知變動後的餘額時使用）"""
+        with self._lock:
+            if user_id in self._balances:
+                self._set(user_id, balance)
+
+    def add_balance(self, user_id: int, delta: Money):
+        """增減餘額；尚未載入的用戶略過，由 verify() 補上"""
+        with self._lock:
+            balance = self._balances.get(user_id)
+            if balance is not None:
+                self._set(user_id, balance + delta)
+
+    # ============ 查詢 ============
+
+    def top(self, limit: int = 10) -> List[Tuple[str, Money]]:
+        """前 N 名 [(用戶名, 餘額), ...]"""
+        with self._lock:
+            return [(self._names.get(user_id, str(user_id)), Money(-neg_balance))
+                    for neg_balance, user_id in self._keys[:limit]]
+
+    def rank(self, user_id: int) -> Optional[Tuple[int, int, Money]]:
+        """個人排名 (名次, 總人數, 餘額)，未註冊回傳 None"""
+        with self._lock:
+            balance = self._balances.get(user_id)
+            if balance is None:
+                return None
+            index = bisect_left(self._keys, (-balance, user_id))
+            return index + 1, len(self._keys), balance
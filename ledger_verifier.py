@@ -0,0 +1,154 @@
+"""
+帳本一致性檢查
+功能：檢查 wallets.balance 是否等於該用戶 transactions 的加總
+每次檢查後為有新交易的用戶寫入檢查點（帳本餘額 + 最後交易編號），
+下次只需讀取之後新增的交易；檢查點也用來計算某日結束時的餘額
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from money import Money
+
+# 已發布為遷移 7，不可修改；ledger_balance 由遷移 8 轉為 INTEGER（分）
+LEDGER_VERIFIER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+        user_id INTEGER NOT NULL,
+        last_transaction_id INTEGER NOT NULL,
+        ledger_balance REAL NOT NULL,
+        as_of TIMESTAMP NOT NULL,
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, last_transaction_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_ledger_checkpoints_user_as_of ON ledger_checkpoints (user_id, as_of)',
+    # 已檢查到的交易編號
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_verifier_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_transaction_id INTEGER NOT NULL
+    )
+    ''',
+    'INSERT OR IGNORE INTO ledger_verifier_state (id, last_transaction_id) VALUES (1, 0)',
+]
+
+
+class LedgerVerifier:
+    """帳本一致性檢查"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def verify(self, full: bool = False) -> Dict:
+        """檢查帳本
+
+        Args:
+            full: True 時清除所有檢查點並從第一筆交易重新計算
+
+        Returns:
+            {'檢查交易數', '檢查用戶數', '異常用戶': [...], '已檢查至交易編號'}
+        """
+        # 在同一個交易中讀取交易與餘額，確保兩者是同一個時間點
+        with self.db.transaction() as cursor:
+            if full:
+                cursor.execute('DELETE FROM ledger_checkpoints')
+                cursor.execute('UPDATE ledger_verifier_state SET last_transaction_id = 0 WHERE id = 1')
+
+            cursor.execute('SELECT last_transaction_id FROM ledger_verifier_state WHERE id = 1')
+            watermark = cursor.fetchone()[0]
+
+            # 只讀取上次檢查之後的新交易（主鍵範圍查詢）
+            cursor.execute('''
+                SELECT user_id, SUM(amount), COUNT(*), MAX(id), MAX(created_at)
+                FROM transactions
+                WHERE id > ?
+                GROUP BY user_id
+            ''', (watermark,))
+            changes = cursor.fetchall()
+
+            drifts = []
+            checked_rows = 0
+            new_watermark = watermark
+
+            for user_id, delta, row_count, last_id, as_of in changes:
+                checked_rows += row_count
+                new_watermark = max(new_watermark, last_id)
+
+                cursor.execute('''
+                    SELECT ledger_balance FROM ledger_checkpoints
+                    WHERE user_id = ?
+                    ORDER BY last_transaction_id DESC LIMIT 1
+                ''', (user_id,))
+                previous = cursor.fetchone()
+                ledger_balance = Money((previous[0] if previous else 0) + delta)
+
+                cursor.execute('''
+                    INSERT INTO ledger_checkpoints (user_id, last_transaction_id, ledger_balance, as_of)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, last_id, ledger_balance, as_of))
+
+                cursor.execute('SELECT balance FROM wallets WHERE user_id = ?', (user_id,))
+                wallet = cursor.fetchone()
+                wallet_balance = Money(wallet[0]) if wallet else None
+
+                if wallet_balance != ledger_balance:
+                    drifts.append({
+                        '用戶ID': user_id,
+                        '錢包餘額': wallet_balance if wallet_balance is not None else '無錢包',
+                        '帳本餘額': ledger_balance,
+                        '差額': (wallet_balance or 0) - ledger_balance
+                    })
+
+            cursor.execute('UPDATE ledger_verifier_state SET last_transaction_id = ? WHERE id = 1',
+                           (new_watermark,))
+
+        return {
+            '檢查交易數': checked_rows,
+            '檢查用戶數': len(changes),
+            '異常用戶': drifts,
+            '已檢查至交易編號': new_watermark
+        }
+
+    def balance_as_of(self, user_id: int, date: str) -> Money:
+        """計算用戶在某日結束時的餘額
+
+        從該日之前最近的檢查點開始，只加總檢查點之後到該日結束的交易。
+
+        Args:
+            date: 日期 (YYYY-MM-DD)
+        """
+        end = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        cursor = self.db.cursor()
+
+        cursor.execute('''
+            SELECT last_transaction_id, ledger_balance FROM ledger_checkpoints
+            WHERE user_id = ? AND as_of < ?
+            ORDER BY as_of DESC, last_transaction_id DESC LIMIT 1
+        ''', (user_id, end))
+        checkpoint = cursor.fetchone()
+        last_id, balance = checkpoint if checkpoint else (0, 0)
+
+        cursor.execute('''
+            SELECT COALESCE(SUM(amount), 0) FROM transactions
+            WHERE user_id = ? AND created_at < ? AND id > ?
+        ''', (user_id, end, last_id))
+        return Money(balance + cursor.fetchone()[0])
+
+    def get_checkpoints(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """用戶最近的檢查點"""
+        cursor = self.db.cursor()
+        cursor.execute('''
+            SELECT last_transaction_id, ledger_balance, as_of, checked_at
+            FROM ledger_checkpoints
+            WHERE user_id = ?
+            ORDER BY last_transaction_id DESC LIMIT ?
+        ''', (user_id, limit))
+        return [
+            {'交易編號': r[0], '帳本餘額': Money(r[1]), '截至時間': r[2], '檢查時間': r[3]}
+            for r in cursor.fetchall()
+        ]
+
+    def latest_checkpoint(self, user_id: int) -> Optional[Dict]:
+        checkpoints = self.get_checkpoints(user_id, 1)
+        return checkpoints[0] if checkpoints else None
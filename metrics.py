@@ -0,0 +1,243 @@
+"""
+效能指標
+功能：計數器、量表與直方圖，以 Prometheus 文字格式從本機 HTTP 端點輸出
+指令延遲、資料庫函式執行時間、背景佇列長度與 gateway 延遲都記錄在這裡，
+也提供 top_series() 給管理員指令的摘要
+可在任何執行緒中記錄（資料庫函式在執行緒池中計時）
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+# 預設的延遲分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """指標基底：依標籤值分開記錄"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 registry: Optional['MetricsRegistry'] = None):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """只增不減的計數"""
+
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """由既有的計數屬性提供數值（例如背景工作的 dropped 計數）"""
+        self._functions[self._key(labels)] = func
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            values = dict(self._values)
+        for key, func in self._functions.items():
+            try:
+                values[key] = float(func())
+            except Exception as e:
+                print(f"讀取指標 {self.name} 錯誤: {e}")
+        return values
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+                for key, value in sorted(self.values().items())]
+
+
+class Gauge(Counter):
+    """可增可減的數值（佇列長度、延遲等），通常以 set_function 在輸出時讀取"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _HistogramSeries:
+    __slots__ = ('bucket_counts', 'count', 'total', 'maximum')
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+
+class Histogram(Metric):
+    """分桶統計（延遲分佈）"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional['MetricsRegistry'] = None):
+        super().__init__(name, help_text, labels, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HistogramSeries(len(self.buckets))
+            series.bucket_counts[index] += 1
+            series.count += 1
+            series.total += value
+            series.maximum = max(series.maximum, value)
+
+    def _quantile(self, series: _HistogramSeries, q: float) -> float:
+        """以分桶線性內插估計分位數（與 Prometheus histogram_quantile 相同做法）"""
+        rank = q * series.count
+        cumulative = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, series.bucket_counts):
+            if count and cumulative + count >= rank:
+                if math.isinf(upper):
+                    return series.maximum
+                estimate = lower + (upper - lower) * (rank - cumulative) / count
+                return min(estimate, series.maximum)
+            cumulative += count
+            lower = upper
+        return series.maximum
+
+    def snapshot(self) -> Dict[LabelValues, Dict[str, float]]:
+        """各標籤的 {'count', 'sum', 'avg', 'p50', 'p95', 'max'}"""
+        with self._lock:
+            return {
+                key: {
+                    'count': series.count,
+                    'sum': series.total,
+                    'avg': series.total / series.count,
+                    'p50': self._quantile(series, 0.5),
+                    'p95': self._quantile(series, 0.95),
+                    'max': series.maximum
+                }
+                for key, series in self._series.items() if series.count
+            }
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for upper, count in zip(self.buckets, series.bucket_counts):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, ('le', _format_value(upper)))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.label_names, key)
+                lines.append(f'{self.name}_sum{labels} {_format_value(series.total)}')
+                lines.append(f'{self.name}_count{labels} {series.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """所有指標的集合"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指標名稱重複: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus 文字格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def top_series(histogram: Histogram, sort_by: str = 'p95', limit: int = 10) -> List[Tuple[LabelValues, Dict[str, float]]]:
+    """依指定欄位排序的前幾個標籤組合，供摘要顯示"""
+    return sorted(histogram.snapshot().items(), key=lambda item: item[1][sort_by], reverse=True)[:limit]
+
+
+class MetricsServer:
+    """以 aiohttp 提供 GET /metrics"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    async def start(self):
+        """啟動 HTTP 端點（重複呼叫不會重複啟動）"""
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        self._runner = runner
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,496 @@
+"""
+資料庫版本遷移
+功能：schema_version 版本表、依序套用遷移、熱門查詢索引
+Bot、SecurityManager 與 OrderManager 啟動時都會呼叫 run_migrations()
+"""
+
+import re
+from typing import Callable, List, Tuple, Union
+
+from daily_stats import CREATE_DAILY_STATS, rebuild_daily_stats
+from ledger_verifier import LEDGER_VERIFIER_SCHEMA
+from staff_earnings import STAFF_EARNINGS_SCHEMA, rebuild_staff_earnings
+
+# ============ 遷移 1：基礎資料表 ============
+
+BASELINE_SCHEMA = [
+    # 錢包與交易
+    '''
+    CREATE TABLE IF NOT EXISTS wallets (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL,
+        balance REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        type TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES wallets (user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS deposits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        method TEXT,
+        status TEXT DEFAULT 'completed',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES wallets (user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS deposit_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        amount REAL NOT NULL,
+        bonus_points REAL NOT NULL,
+        screenshot_url TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        processed_at TIMESTAMP,
+        processed_by INTEGER,
+        reject_reason TEXT,
+        FOREIGN KEY (user_id) REFERENCES wallets (user_id)
+    )
+    ''',
+    # 商城
+    '''
+    CREATE TABLE IF NOT EXISTS shop_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT UNIQUE NOT NULL,
+        price REAL NOT NULL,
+        description TEXT,
+        category TEXT,
+        stock INTEGER DEFAULT -1,
+        emoji TEXT,
+        enabled INTEGER DEFAULT 1,
+        commission_rate REAL DEFAULT 0.70,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_number TEXT UNIQUE NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        item_name TEXT NOT NULL,
+        item_price REAL NOT NULL,
+        quantity INTEGER DEFAULT 1,
+        total_price REAL NOT NULL,
+        status TEXT DEFAULT 'pending',
+        note TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP,
+        staff_id INTEGER,
+        commission_rate REAL DEFAULT 0.70,
+        staff_earning REAL DEFAULT 0,
+        platform_fee REAL DEFAULT 0,
+        commission_paid INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES wallets (user_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS commissions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_number TEXT NOT NULL,
+        staff_id INTEGER NOT NULL,
+        staff_name TEXT NOT NULL,
+        order_amount REAL NOT NULL,
+        commission_rate REAL NOT NULL,
+        staff_earning REAL NOT NULL,
+        platform_fee REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (order_number) REFERENCES orders (order_number)
+    )
+    ''',
+    # 黑名單表
+    '''
+    CREATE TABLE IF NOT EXISTS blacklist (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL UNIQUE,
+        username TEXT NOT NULL,
+        reason TEXT NOT NULL,
+        banned_by INTEGER,
+        banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        banned_until TIMESTAMP,
+        is_permanent INTEGER DEFAULT 1,
+        notes TEXT
+    )
+    ''',
+    # 風險事件記錄表
+    '''
+    CREATE TABLE IF NOT EXISTS risk_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        severity TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        handled INTEGER DEFAULT 0,
+        handled_by INTEGER,
+        handled_at TIMESTAMP
+    )
+    ''',
+    # 儲值限制記錄表（防止一天多次儲值）
+    '''
+    CREATE TABLE IF NOT EXISTS deposit_limits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        deposit_date DATE NOT NULL,
+        deposit_count INTEGER DEFAULT 0,
+        total_amount REAL DEFAULT 0,
+        UNIQUE(user_id, deposit_date)
+    )
+    ''',
+    # 可疑操作日誌表
+    '''
+    CREATE TABLE IF NOT EXISTS suspicious_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        details TEXT,
+        ip_address TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+# ============ 遷移 2：熱門查詢索引 ============
+# 每個索引對應 discord_wallet_bot.py / security_system.py / admin_dashboard.py 中
+# 實際的 WHERE 與 ORDER BY 條件
+
+HOT_QUERY_INDEXES = [
+    # /我的訂單、1小時內下單次數、用戶訂單查詢
+    'CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)',
+    # 用戶待處理訂單數
+    'CREATE INDEX IF NOT EXISTS idx_orders_user_status ON orders (user_id, status)',
+    # /查看訂單、待處理訂單列表
+    'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders (status, created_at)',
+    # 本月已完成訂單統計
+    'CREATE INDEX IF NOT EXISTS idx_orders_status_completed ON orders (status, completed_at)',
+    # 工作人員待處理訂單、可疑工作人員檢測
+    'CREATE INDEX IF NOT EXISTS idx_orders_staff_status ON orders (staff_id, status)',
+    # 時間區間訂單、對帳報表
+    'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at)',
+
+    # /消費紀錄
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions (user_id, created_at)',
+    # 30天內退款次數
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_type_created ON transactions (user_id, type, created_at)',
+    # 對帳報表
+    'CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions (created_at)',
+
+    # /我的收入、/本月收入、工作人員統計
+    'CREATE INDEX IF NOT EXISTS idx_commissions_staff_created ON commissions (staff_id, created_at)',
+    # 本月分潤、每日摘要、對帳報表
+    'CREATE INDEX IF NOT EXISTS idx_commissions_created ON commissions (created_at)',
+    # 訂單與分潤 JOIN
+    'CREATE INDEX IF NOT EXISTS idx_commissions_order ON commissions (order_number)',
+
+    # /儲值紀錄、新帳號累計儲值
+    'CREATE INDEX IF NOT EXISTS idx_deposits_user_created ON deposits (user_id, created_at)',
+    # 每日摘要、對帳報表
+    'CREATE INDEX IF NOT EXISTS idx_deposits_created ON deposits (created_at)',
+
+    # 1小時內儲值次數（盜刷檢測）
+    'CREATE INDEX IF NOT EXISTS idx_deposit_requests_user_created ON deposit_requests (user_id, created_at)',
+    # /審核儲值
+    'CREATE INDEX IF NOT EXISTS idx_deposit_requests_status_created ON deposit_requests (status, created_at)',
+
+    # 自動風控：未處理的高危事件
+    'CREATE INDEX IF NOT EXISTS idx_risk_events_handled_severity_created ON risk_events (handled, severity, created_at)',
+    # /查看風險事件
+    'CREATE INDEX IF NOT EXISTS idx_risk_events_handled_created ON risk_events (handled, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_risk_events_created ON risk_events (created_at)',
+
+    # /全服餘額排行、餘額異常檢測
+    'CREATE INDEX IF NOT EXISTS idx_wallets_balance ON wallets (balance)',
+
+    # 黑名單列表
+    'CREATE INDEX IF NOT EXISTS idx_blacklist_banned_at ON blacklist (banned_at)',
+]
+
+# ============ 遷移 3：商城目錄版本 ============
+# shop_items 的任何新增、修改、刪除都會遞增版本號，讓各程序的目錄快取失效
+
+CATALOG_VERSION = [
+    '''
+    CREATE TABLE IF NOT EXISTS catalog_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    ''',
+    'INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_shop_items_insert AFTER INSERT ON shop_items
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_shop_items_update AFTER UPDATE ON shop_items
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_shop_items_delete AFTER DELETE ON shop_items
+    BEGIN
+        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+    END
+    ''',
+]
+
+# ============ 遷移 4：訂單流水號 ============
+# 每天一列計數器，在購買交易內遞增，跨程序也不會重複
+
+ORDER_SEQUENCES = [
+    '''
+    CREATE TABLE IF NOT EXISTS order_sequences (
+        day TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL
+    )
+    ''',
+]
+
+# ============ 遷移 5：每日統計彙總 ============
+# 建立 daily_stats；資料由遷移 8 以分為單位從基礎資料回填
+
+DAILY_STATS = [CREATE_DAILY_STATS]
+
+# ============ 遷移 6：工作人員收入彙總 ============
+# 建立 staff_earnings；資料由遷移 8 以分為單位從分潤紀錄回填
+
+STAFF_EARNINGS = STAFF_EARNINGS_SCHEMA
+
+# ============ 遷移 7：帳本檢查點 ============
+# 檢查點在第一次執行帳本檢查時建立
+
+LEDGER_CHECKPOINTS = LEDGER_VERIFIER_SCHEMA
+
+# ============ 遷移 8：金額改為整數（分） ============
+# 金額欄位從 REAL（元）改為 INTEGER（分），加總不再有浮點誤差
+# SQLite 無法修改欄位型別，依官方建議建立新表、複製資料、刪除舊表再改名，
+# 並重建原本的索引與觸發器；彙總表直接從基礎資料重建
+
+MONEY_COLUMNS = {
+    'wallets': ('balance',),
+    'transactions': ('amount',),
+    'deposits': ('amount',),
+    'deposit_requests': ('amount', 'bonus_points'),
+    'shop_items': ('price',),
+    'orders': ('item_price', 'total_price', 'staff_earning', 'platform_fee'),
+    'commissions': ('order_amount', 'staff_earning', 'platform_fee'),
+    'deposit_limits': ('total_amount',),
+    'ledger_checkpoints': ('ledger_balance',),
+}
+
+# 分潤欄位：平台抽成 = 總額 - 工作人員分潤（皆以分計算），兩者分別四捨五入可能差一分，
+# 轉換後以整數重新推導，分潤加抽成必定等於總額，與購買時 Money.split() 的結果一致
+# 資料表 -> (平台抽成欄位, 總額欄位, 分潤欄位)
+SPLIT_COLUMNS = {
+    'orders': ('platform_fee', 'total_price', 'staff_earning'),
+    'commissions': ('platform_fee', 'order_amount', 'staff_earning'),
+}
+
+def _to_cents(column: str) -> str:
+    return f"CAST(ROUND({column} * 100) AS INTEGER)"
+
+def _convert_money_columns(cursor, table: str, columns: Tuple[str, ...]):
+    """將資料表的金額欄位改為 INTEGER 並把數值乘以 100（已是 INTEGER 的欄位略過）"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    table_info = cursor.fetchall()
+    names = [row[1] for row in table_info]
+    columns = tuple(row[1] for row in table_info if row[1] in columns and row[2].upper() == 'REAL')
+    if not columns:
+        return
+
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    create_sql = cursor.fetchone()[0]
+    for column in columns:
+        create_sql, count = re.subn(rf'\b{column}\s+REAL\b', f'{column} INTEGER', create_sql)
+        if count != 1:
+            raise RuntimeError(f"找不到金額欄位 {table}.{column}")
+    create_sql, count = re.subn(rf'^CREATE TABLE\s+"?{table}"?', f'CREATE TABLE {table}_new', create_sql)
+    if count != 1:
+        raise RuntimeError(f"無法解析 {table} 的建表語句")
+
+    cursor.execute('''
+        SELECT sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    ''', (table,))
+    dependents = [row[0] for row in cursor.fetchall()]
+
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    sequence = cursor.fetchone()
+
+    expressions = {name: _to_cents(name) for name in columns}
+    split = SPLIT_COLUMNS.get(table)
+    if split and all(column in columns for column in split):
+        fee, total, earning = split
+        # 只有原本就是總額拆分的列（加總等於總額）才重新推導，其餘照常轉換
+        expressions[fee] = f'''CASE WHEN ABS({earning} + {fee} - {total}) < 0.005
+                 THEN {_to_cents(total)} - {_to_cents(earning)}
+                 ELSE {_to_cents(fee)} END'''
+    select = ", ".join(expressions.get(name, name) for name in names)
+
+    cursor.execute(create_sql)
+    cursor.execute(f'INSERT INTO {table}_new ({", ".join(names)}) SELECT {select} FROM {table}')
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    for sql in dependents:
+        cursor.execute(sql)
+
+    # 保留 AUTOINCREMENT 的序號，已刪除的編號不會被重複使用
+    if sequence:
+        cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (sequence[0], table))
+
+# 彙總表的整數版本（與遷移 5、6 的表相同欄位，金額改為分）
+DAILY_STATS_CENTS = [
+    '''
+    CREATE TABLE daily_stats (
+        day TEXT PRIMARY KEY,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        order_amount INTEGER NOT NULL DEFAULT 0,
+        pending_count INTEGER NOT NULL DEFAULT 0,
+        pending_amount INTEGER NOT NULL DEFAULT 0,
+        completed_count INTEGER NOT NULL DEFAULT 0,
+        completed_amount INTEGER NOT NULL DEFAULT 0,
+        fulfilled_count INTEGER NOT NULL DEFAULT 0,
+        fulfilled_amount INTEGER NOT NULL DEFAULT 0,
+        commission_count INTEGER NOT NULL DEFAULT 0,
+        staff_earning INTEGER NOT NULL DEFAULT 0,
+        platform_fee INTEGER NOT NULL DEFAULT 0,
+        deposit_count INTEGER NOT NULL DEFAULT 0,
+        deposit_amount INTEGER NOT NULL DEFAULT 0,
+        ledger_income INTEGER NOT NULL DEFAULT 0,
+        ledger_expense INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+STAFF_EARNINGS_CENTS = [
+    '''
+    CREATE TABLE staff_earnings (
+        staff_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        staff_name TEXT NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        total_earning INTEGER NOT NULL DEFAULT 0,
+        total_order_amount INTEGER NOT NULL DEFAULT 0,
+        first_at TIMESTAMP,
+        last_at TIMESTAMP,
+        PRIMARY KEY (staff_id, period)
+    )
+    ''',
+    'CREATE INDEX idx_staff_earnings_period_earning ON staff_earnings (period, total_earning)',
+]
+
+def _convert_money_to_cents(cursor):
+    for table, columns in MONEY_COLUMNS.items():
+        _convert_money_columns(cursor, table, columns)
+
+    # 彙總表以整數欄位重建，並從已轉換的基礎資料回填
+    cursor.execute('DROP TABLE daily_stats')
+    for sql in DAILY_STATS_CENTS:
+        cursor.execute(sql)
+    rebuild_daily_stats(cursor)
+
+    cursor.execute('DROP TABLE staff_earnings')
+    for sql in STAFF_EARNINGS_CENTS:
+        cursor.execute(sql)
+    rebuild_staff_earnings(cursor)
+
+    # 商品價格單位改變，讓各程序的目錄快取重新載入
+    cursor.execute('UPDATE catalog_version SET version = version + 1 WHERE id = 1')
+
+# ============ 遷移清單 ============
+# (版本, 說明, SQL 語句列表或接收 cursor 的函式)
+# 新增遷移時只能往後追加，不可修改已發布的版本
+
+Migration = Tuple[int, str, Union[List[str], Callable]]
+
+MIGRATIONS: List[Migration] = [
+    (1, '基礎資料表', BASELINE_SCHEMA),
+    (2, '熱門查詢索引', HOT_QUERY_INDEXES),
+    (3, '商城目錄版本', CATALOG_VERSION),
+    (4, '訂單流水號', ORDER_SEQUENCES),
+    (5, '每日統計彙總', DAILY_STATS),
+    (6, '工作人員收入彙總', STAFF_EARNINGS),
+    (7, '帳本檢查點', LEDGER_CHECKPOINTS),
+    (8, '金額改為整數（分）', _convert_money_to_cents),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(db) -> int:
+    """取得資料庫目前的版本（尚未建立版本表時為 0）"""
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name = 'schema_version'
+    ''')
+    if not cursor.fetchone():
+        return 0
+
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    return cursor.fetchone()[0] or 0
+
+
+def run_migrations(db) -> List[int]:
+    """套用所有尚未執行的遷移
+
+    整個過程在同一個 BEGIN IMMEDIATE 交易中執行，
+    Bot 與管理後台同時啟動時只會有一方實際套用。
+
+    Returns:
+        本次套用的版本列表
+    """
+    if get_schema_version(db) >= LATEST_VERSION:
+        return []
+
+    applied = []
+    with db.transaction() as cursor:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('SELECT MAX(version) FROM schema_version')
+        current = cursor.fetchone()[0] or 0
+
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+
+            if callable(steps):
+                steps(cursor)
+            else:
+                for sql in steps:
+                    cursor.execute(sql)
+
+            cursor.execute('''
+                INSERT INTO schema_version (version, description)
+                VALUES (?, ?)
+            ''', (version, description))
+            applied.append(version)
+
+    for version in applied:
+        print(f"資料庫已遷移至版本 {version}")
+
+    return applied
@@ -0,0 +1,131 @@
+"""
+金額型別
+功能：所有金額以「分」為單位的整數儲存與計算，避免浮點誤差
+Money 是 int 的子類別，可直接寫入 SQLite 與比較大小；格式化時以元顯示
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Tuple
+
+CENTS_PER_UNIT = 100
+
+_CENT = Decimal(1)
+
+
+def _round_cents(value: Decimal) -> int:
+    """四捨五入到整數分"""
+    return int(value.quantize(_CENT, rounding=ROUND_HALF_UP))
+
+
+class Money(int):
+    """金額（單位：分）
+
+    Money.from_amount(12.5) == Money(1250)
+    f"${Money(1250):.2f}" == "$12.50"
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_amount(cls, value) -> 'Money':
+        """由元轉換（接受 int、float、Decimal 或字串），四捨五入到分"""
+        if isinstance(value, Money):
+            return value
+        return cls(_round_cents(Decimal(str(value)) * CENTS_PER_UNIT))
+
+    @classmethod
+    def from_db(cls, value) -> Optional['Money']:
+        """讀取資料庫欄位（NULL 回傳 None）"""
+        return None if value is None else cls(value)
+
+    @property
+    def cents(self) -> int:
+        return int(self)
+
+    @property
+    def amount(self) -> Decimal:
+        """以元表示的精確金額"""
+        return Decimal(int(self)) / CENTS_PER_UNIT
+
+    def split(self, rate: float) -> Tuple['Money', 'Money']:
+        """依比例拆分金額，回傳 (比例部分, 剩餘部分)，兩者相加必定等於原金額"""
+        share = self * rate
+        return share, self - share
+
+    # ============ 運算 ============
+
+    def __add__(self, other):
+        if isinstance(other, int):
+            return Money(int(self) + int(other))
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, int):
+            return Money(int(self) - int(other))
+        return NotImplemented
+
+    def __rsub__(self, other):
+        if isinstance(other, int):
+            return Money(int(other) - int(self))
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-int(self))
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Money(abs(int(self)))
+
+    def __mul__(self, other):
+        """乘上數量或比例，結果四捨五入到分"""
+        if isinstance(other, Money):
+            return NotImplemented
+        if isinstance(other, int):
+            return Money(int(self) * other)
+        if isinstance(other, (float, Decimal)):
+            return Money(_round_cents(Decimal(int(self)) * Decimal(str(other))))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        """金額 / 金額 得到比例；金額 / 數量 得到四捨五入到分的金額"""
+        if isinstance(other, Money):
+            return int(self) / int(other)
+        if isinstance(other, (int, float, Decimal)):
+            return Money(_round_cents(Decimal(int(self)) / Decimal(str(other))))
+        return NotImplemented
+
+    # ============ 顯示 ============
+
+    def __str__(self):
+        if int(self) % CENTS_PER_UNIT == 0:
+            return str(int(self) // CENTS_PER_UNIT)
+        return f"{self.amount:.2f}"
+
+    def __repr__(self):
+        return f"Money('{self.amount:.2f}')"
+
+    def __format__(self, spec):
+        """格式化規格套用在以元表示的金額上，例如 f"{m:,.2f}" """
+        if not spec:
+            return str(self)
+        return format(self.amount, spec)
+
+
+ZERO = Money(0)
+
+
+def to_plain(value):
+    """將 Money（包含在 dict / list 中的）轉成以元表示的 float，供 JSON 輸出"""
+    if isinstance(value, Money):
+        return float(value.amount)
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
@@ -0,0 +1,212 @@
+"""
+訊息發送佇列
+功能：指令只負責把要發送的頻道訊息與私訊放入佇列，由背景工作依路由限速發送
+每個路由（頻道或用戶私訊）有自己的令牌桶；頻道通知大量湧入時合併成一則多個 embed 的彙整訊息，
+發送失敗時有限次數重試，並記錄丟棄、延遲與失敗的訊息數
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+import discord
+
+# 解析函式：頻道 / 用戶 ID -> 可發送訊息的對象（找不到時回傳 None）
+Resolver = Callable[[int], Awaitable[Optional[discord.abc.Messageable]]]
+
+# 路由：('channel', 頻道 ID) 或 ('user', 用戶 ID)
+Route = Tuple[str, int]
+
+# Discord 單則訊息的 embed 數量與總字數上限
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 則，最多連續 capacity 則"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距離下一個令牌可用的秒數（0 表示可立即發送）"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class OutboundMessage:
+    __slots__ = ('content', 'embed', 'coalesce', 'attempts', 'enqueued_at')
+
+    def __init__(self, content: Optional[str], embed: Optional[discord.Embed], coalesce: bool):
+        self.content = content
+        self.embed = embed
+        self.coalesce = coalesce
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+
+def is_retryable(error: Exception) -> bool:
+    """暫時性錯誤（被限速、伺服器錯誤、網路問題）才重試；無權限、找不到對象等直接放棄"""
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError))
+
+
+class OutboundDispatcher:
+    """背景訊息發送
+
+    send_channel() / send_user() 不會等待也不會拋出例外；佇列已滿時直接丟棄該則訊息。
+    每個路由由一個背景工作依序發送，佇列清空後工作即結束。
+    """
+
+    def __init__(self, resolve_channel: Resolver, resolve_user: Resolver,
+                 max_queue: int = 1000, rate: float = 1.0, burst: int = 5,
+                 digest_threshold: int = 3, max_attempts: int = 3,
+                 retry_delay: float = 2.0, delay_threshold: float = 5.0):
+        self.resolvers: Dict[str, Resolver] = {'channel': resolve_channel, 'user': resolve_user}
+        self.max_queue = max_queue
+        self.rate = rate
+        self.burst = burst
+        self.digest_threshold = digest_threshold
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.delay_threshold = delay_threshold
+
+        self._pending: Dict[Route, Deque[OutboundMessage]] = {}
+        self._buckets: Dict[Route, TokenBucket] = {}
+        self._workers: Dict[Route, asyncio.Task] = {}
+        self._queued = 0
+
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.delayed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def send_channel(self, channel_id: int, content: Optional[str] = None,
+                     embed: Optional[discord.Embed] = None, coalesce: bool = True) -> bool:
+        """排入頻道訊息；coalesce=True 的訊息在大量湧入時可與其他通知合併"""
+        return self._enqueue(('channel', channel_id), OutboundMessage(content, embed, coalesce))
+
+    def send_user(self, user_id: int, content: Optional[str] = None,
+                  embed: Optional[discord.Embed] = None) -> bool:
+        """排入私訊"""
+        return self._enqueue(('user', user_id), OutboundMessage(content, embed, False))
+
+    @property
+    def queue_size(self) -> int:
+        return self._queued
+
+    def _enqueue(self, route: Route, message: OutboundMessage) -> bool:
+        if self._queued >= self.max_queue:
+            self.dropped += 1
+            return False
+
+        self._pending.setdefault(route, deque()).append(message)
+        self._queued += 1
+        self.enqueued += 1
+
+        if route not in self._workers:
+            self._workers[route] = asyncio.create_task(
+                self._route_loop(route), name=f'outbound-{route[0]}-{route[1]}'
+            )
+        return True
+
+    async def _route_loop(self, route: Route):
+        pending = self._pending[route]
+        bucket = self._buckets.setdefault(route, TokenBucket(self.rate, self.burst))
+        try:
+            while pending:
+                # 等待令牌時新進的通知會一起被合併
+                wait = bucket.wait_time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                bucket.consume()
+
+                batch = self._take_batch(pending)
+                self._queued -= len(batch)
+                retry_after = await self._deliver(route, batch)
+                if retry_after is not None:
+                    pending.extendleft(reversed(batch))
+                    self._queued += len(batch)
+                    await asyncio.sleep(retry_after)
+        finally:
+            del self._workers[route]
+            del self._pending[route]
+            self._prune_buckets()
+
+    def _take_batch(self, pending: Deque[OutboundMessage]) -> List[OutboundMessage]:
+        """取出下一則要發送的訊息；頻道通知堆積到門檻時合併成一則彙整訊息"""
+        first = pending.popleft()
+        batch = [first]
+        if not first.coalesce or len(pending) + 1 < self.digest_threshold:
+            return batch
+
+        chars = len(first.embed) if first.embed else 0
+        while pending and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            message = pending[0]
+            if not message.coalesce:
+                break
+            size = len(message.embed) if message.embed else 0
+            if chars + size > MAX_EMBED_CHARS_PER_MESSAGE:
+                break
+            batch.append(pending.popleft())
+            chars += size
+
+        self.coalesced += len(batch) - 1
+        return batch
+
+    async def _deliver(self, route: Route, batch: List[OutboundMessage]) -> Optional[float]:
+        """發送一則（可能是合併的）訊息；需要重試時回傳等待秒數"""
+        contents = list(dict.fromkeys(message.content for message in batch if message.content))
+        embeds = [message.embed for message in batch if message.embed]
+        kind, target_id = route
+
+        try:
+            target = await self.resolvers[kind](target_id)
+            if target is None:
+                raise LookupError(f"找不到發送對象 {kind} {target_id}")
+            await target.send(content=" ".join(contents) or None, embeds=embeds)
+        except Exception as e:
+            for message in batch:
+                message.attempts += 1
+            attempts = max(message.attempts for message in batch)
+            if is_retryable(e) and attempts < self.max_attempts:
+                self.retried += 1
+                retry_after = getattr(e, 'retry_after', None)
+                return retry_after or self.retry_delay * 2 ** (attempts - 1)
+            self.failed += len(batch)
+            print(f"發送訊息失敗 ({kind} {target_id}): {e}")
+            return None
+
+        now = time.monotonic()
+        self.sent += len(batch)
+        self.delayed += sum(1 for message in batch if now - message.enqueued_at > self.delay_threshold)
+        return None
+
+    def _prune_buckets(self):
+        """移除已閒置到令牌全滿的路由，避免私訊路由無限增加"""
+        for route in [route for route, bucket in self._buckets.items()
+                      if route not in self._workers and bucket.is_full()]:
+            del self._buckets[route]
@@ -0,0 +1,268 @@
+"""
+用戶風控狀態
+功能：在記憶體中維護每位用戶的滾動計數（1小時內訂單、未完成訂單、30天內退款、累計儲值、餘額）
+寫入訂單、交易、儲值後由呼叫端更新計數；啟動時從資料庫重建，未載入的用戶首次查詢時再從資料庫讀取
+所有時間皆以 UTC 計算，與資料庫的 CURRENT_TIMESTAMP 一致
+"""
+
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+
+from money import Money, ZERO
+
+ORDER_WINDOW = timedelta(hours=1)
+REFUND_WINDOW = timedelta(days=30)
+NEW_ACCOUNT_PERIOD = timedelta(days=7)
+
+# 滾動視窗保留的最大筆數（超過門檻後不需要精確計數）
+MAX_WINDOW_EVENTS = 64
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow()
+
+
+def _parse(timestamp: str) -> datetime:
+    return datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+
+
+class UserRiskState:
+    """單一用戶的風控計數"""
+
+    __slots__ = ('balance', 'created_at', 'pending_orders', 'total_orders',
+                 'lifetime_deposits', 'recent_orders', 'recent_refunds')
+
+    def __init__(self, balance: Money = ZERO, created_at: Optional[datetime] = None):
+        self.balance = Money(balance or 0)
+        self.created_at = created_at or _utcnow()
+        self.pending_orders = 0
+        self.total_orders = 0
+        self.lifetime_deposits = ZERO
+        self.recent_orders = deque(maxlen=MAX_WINDOW_EVENTS)
+        self.recent_refunds = deque(maxlen=MAX_WINDOW_EVENTS)
+
+    @staticmethod
+    def _trim(window: deque, cutoff: datetime) -> int:
+        while window and window[0] < cutoff:
+            window.popleft()
+        return len(window)
+
+    def orders_last_hour(self, now: datetime) -> int:
+        return self._trim(self.recent_orders, now - ORDER_WINDOW)
+
+    def refunds_last_30_days(self, now: datetime) -> int:
+        return self._trim(self.recent_refunds, now - REFUND_WINDOW)
+
+    def is_new_account(self, now: datetime) -> bool:
+        return now - self.created_at < NEW_ACCOUNT_PERIOD
+
+
+class RiskStateStore:
+    """所有用戶的風控計數"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._states: Dict[int, UserRiskState] = {}
+        # 重建期間有更新的用戶；重建結果可能已包含或尚未包含這些更新，替換時捨棄，之後再單獨載入
+        self._dirty: Optional[Set[int]] = None
+
+    # ============ 載入 ============
+
+    def rebuild(self) -> int:
+        """從資料庫重建所有用戶的計數，回傳用戶數
+
+        掃描時不持有鎖，購買等寫入後的更新不需等待；掃描期間有更新的用戶不採用掃描結果，
+        替換後於下次查詢時從資料庫單獨載入，避免同一筆訂單被掃描讀到又再累加一次。
+        """
+        now = _utcnow()
+        order_since = (now - ORDER_WINDOW).strftime(TIMESTAMP_FORMAT)
+        refund_since = (now - REFUND_WINDOW).strftime(TIMESTAMP_FORMAT)
+
+        with self._lock:
+            self._dirty = set()
+        try:
+            states = self._scan(order_since, refund_since)
+        except Exception:
+            with self._lock:
+                self._dirty = None
+            raise
+
+        with self._lock:
+            for user_id in self._dirty:
+                states.pop(user_id, None)
+            self._dirty = None
+            self._states = states
+            return len(states)
+
+    def _scan(self, order_since: str, refund_since: str) -> Dict[int, UserRiskState]:
+        """讀取所有用戶的計數（不持有鎖）"""
+        cursor = self.db.cursor()
+        states: Dict[int, UserRiskState] = {}
+
+        cursor.execute('SELECT user_id, balance, created_at FROM wallets')
+        for user_id, balance, created_at in cursor:
+            states[user_id] = UserRiskState(balance, _parse(created_at))
+
+        cursor.execute('''
+            SELECT user_id, COUNT(*),
+                   SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END)
+            FROM orders GROUP BY user_id
+        ''')
+        for user_id, total, pending in cursor:
+            state = states.get(user_id)
+            if state:
+                state.total_orders = total
+                state.pending_orders = pending
+
+        cursor.execute('''
+            SELECT user_id, created_at FROM orders
+            WHERE created_at >= ? ORDER BY created_at
+        ''', (order_since,))
+        for user_id, created_at in cursor:
+            state = states.get(user_id)
+            if state:
+                state.recent_orders.append(_parse(created_at))
+
+        cursor.execute('''
+            SELECT user_id, created_at FROM transactions
+            WHERE type = '退款' AND created_at >= ? ORDER BY created_at
+        ''', (refund_since,))
+        for user_id, created_at in cursor:
+            state = states.get(user_id)
+            if state:
+                state.recent_refunds.append(_parse(created_at))
+
+        cursor.execute('SELECT user_id, SUM(amount) FROM deposits GROUP BY user_id')
+        for user_id, total in cursor:
+            state = states.get(user_id)
+            if state:
+                state.lifetime_deposits = Money(total or 0)
+
+        return states
+
+    def _load_user(self, user_id: int) -> Optional[UserRiskState]:
+        """從資料庫載入單一用戶（呼叫前須持有鎖）"""
+        now = _utcnow()
+        cursor = self.db.cursor()
+
+        cursor.execute('SELECT balance, created_at FROM wallets WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        if not result:
+            return None
+
+        state = UserRiskState(result[0], _parse(result[1]))
+
+        cursor.execute('''
+            SELECT COUNT(*), SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END)
+            FROM orders WHERE user_id = ?
+        ''', (user_id,))
+        total, pending = cursor.fetchone()
+        state.total_orders = total
+        state.pending_orders = pending or 0
+
+        cursor.execute('''
+            SELECT created_at FROM orders
+            WHERE user_id = ? AND created_at >= ? ORDER BY created_at
+        ''', (user_id, (now - ORDER_WINDOW).strftime(TIMESTAMP_FORMAT)))
+        state.recent_orders.extend(_parse(row[0]) for row in cursor)
+
+        cursor.execute('''
+            SELECT created_at FROM transactions
+            WHERE user_id = ? AND type = '退款' AND created_at >= ? ORDER BY created_at
+        ''', (user_id, (now - REFUND_WINDOW).strftime(TIMESTAMP_FORMAT)))
+        state.recent_refunds.extend(_parse(row[0]) for row in cursor)
+
+        cursor.execute('SELECT SUM(amount) FROM deposits WHERE user_id = ?', (user_id,))
+        state.lifetime_deposits = Money(cursor.fetchone()[0] or 0)
+
+        self._states[user_id] = state
+        return state
+
+    def _get(self, user_id: int) -> Optional[UserRiskState]:
+        """取得用戶狀態，尚未載入時從資料庫讀取（呼叫前須持有鎖）"""
+        state = self._states.get(user_id)
+        if state is None:
+            state = self._load_user(user_id)
+        return state
+
+    # ============ 查詢 ============
+
+    def snapshot(self, user_id: int) -> Optional[Dict]:
+        """取得用戶目前的風控計數（未註冊回傳 None）"""
+        now = _utcnow()
+        with self._lock:
+            state = self._get(user_id)
+            if state is None:
+                return None
+            return {
+                'balance': state.balance,
+                'orders_last_hour': state.orders_last_hour(now),
+                'pending_orders': state.pending_orders,
+                'total_orders': state.total_orders,
+                'refunds_last_30_days': state.refunds_last_30_days(now),
+                'lifetime_deposits': state.lifetime_deposits,
+                'is_new_account': state.is_new_account(now)
+            }
+
+    def is_new_account(self, user_id: int) -> bool:
+        """檢查是否為新帳號（未註冊視為新帳號）"""
+        with self._lock:
+            state = self._get(user_id)
+            return state is None or state.is_new_account(_utcnow())
+
+    # ============ 寫入後更新 ============
+    # 以下方法須在對應的資料庫交易提交後呼叫
+
+    def _updated(self, user_id: int) -> Optional[UserRiskState]:
+        """取得要更新的用戶狀態，重建進行中時記錄該用戶（呼叫前須持有鎖）"""
+        if self._dirty is not None:
+            self._dirty.add(user_id)
+        return self._states.get(user_id)
+
+    def on_wallet_created(self, user_id: int):
+        with self._lock:
+            self._updated(user_id)
+            self._states[user_id] = UserRiskState()
+
+    def on_balance_changed(self, user_id: int, delta: Money):
+        with self._lock:
+            state = self._updated(user_id)
+            if state:
+                state.balance += delta
+
+    def on_balance_set(self, user_id: int, balance: Money):
+        with self._lock:
+            state = self._updated(user_id)
+            if state:
+                state.balance = Money(balance)
+
+    def on_order_created(self, user_id: int):
+        with self._lock:
+            state = self._updated(user_id)
+            if state:
+                state.recent_orders.append(_utcnow())
+                state.pending_orders += 1
+                state.total_orders += 1
+
+    def on_order_completed(self, user_id: int):
+        with self._lock:
+            state = self._updated(user_id)
+            if state and state.pending_orders > 0:
+                state.pending_orders -= 1
+
+    def on_refund(self, user_id: int):
+        with self._lock:
+            state = self._updated(user_id)
+            if state:
+                state.recent_refunds.append(_utcnow())
+
+    def on_deposit(self, user_id: int, amount: Money):
+        with self._lock:
+            state = self._updated(user_id)
+            if state:
+                state.lifetime_deposits += amount
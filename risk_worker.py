@@ -0,0 +1,120 @@
+"""
+背景風控工作
+功能：指令只負責把用戶活動放入佇列，由背景工作執行風控分析並批次發送警報
+同一用戶在佇列中只保留一筆，警報依用戶合併並有冷卻時間
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# 分析函式：(user_id, username) -> 可疑操作列表
+Analyzer = Callable[[int, str], Awaitable[List[str]]]
+
+# 警報發送函式：[(user_id, username, 可疑操作列表), ...]
+AlertSender = Callable[[List[Tuple[int, str, List[str]]]], Awaitable[None]]
+
+
+class RiskWorker:
+    """背景風控工作
+
+    submit() 不會等待也不做任何分析；佇列已滿時直接略過該次活動。
+    """
+
+    def __init__(self, analyze: Analyzer, send_alerts: AlertSender,
+                 max_queue: int = 1000, alert_interval: float = 10.0,
+                 alert_cooldown: float = 600.0):
+        self.analyze = analyze
+        self.send_alerts = send_alerts
+        self.max_queue = max_queue
+        self.alert_interval = alert_interval
+        self.alert_cooldown = alert_cooldown
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued: Dict[int, str] = {}
+        self._alerts: Dict[int, Tuple[str, List[str]]] = {}
+        self._last_alert: Dict[int, Tuple[float, Tuple[str, ...]]] = {}
+        self._tasks: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.analyzed = 0
+
+    def start(self):
+        """啟動背景工作（需在事件迴圈中呼叫，重複呼叫不會重複啟動）"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [
+            asyncio.create_task(self._analyze_loop(), name='risk-analyze'),
+            asyncio.create_task(self._alert_loop(), name='risk-alert')
+        ]
+
+    def submit(self, user_id: int, username: str) -> bool:
+        """送出一次用戶活動，回傳是否已排入（或已合併到佇列中的同一用戶）"""
+        if self._queue is None:
+            return False
+
+        self.submitted += 1
+        if user_id in self._queued:
+            self._queued[user_id] = username
+            self.coalesced += 1
+            return True
+
+        try:
+            self._queue.put_nowait(user_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+        self._queued[user_id] = username
+        return True
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _analyze_loop(self):
+        while True:
+            user_id = await self._queue.get()
+            username = self._queued.pop(user_id, str(user_id))
+            try:
+                warnings = await self.analyze(user_id, username)
+                self.analyzed += 1
+                if warnings:
+                    self._queue_alert(user_id, username, warnings)
+            except Exception as e:
+                print(f"風控分析錯誤: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _queue_alert(self, user_id: int, username: str, warnings: List[str]):
+        """加入待發送警報；冷卻時間內內容相同的警報不重複發送"""
+        now = time.monotonic()
+        key = tuple(warnings)
+        last = self._last_alert.get(user_id)
+        if last is not None and last[1] == key and now - last[0] < self.alert_cooldown:
+            return
+
+        self._last_alert[user_id] = (now, key)
+        self._alerts[user_id] = (username, warnings)
+
+    async def _alert_loop(self):
+        while True:
+            await asyncio.sleep(self.alert_interval)
+            if not self._alerts:
+                continue
+
+            alerts, self._alerts = self._alerts, {}
+            batch = [(user_id, username, warnings) for user_id, (username, warnings) in alerts.items()]
+            try:
+                await self.send_alerts(batch)
+            except Exception as e:
+                print(f"發送風控警報錯誤: {e}")
+
+            # 清除已過冷卻時間的紀錄
+            cutoff = time.monotonic() - self.alert_cooldown
+            self._last_alert = {
+                user_id: last for user_id, last in self._last_alert.items() if last[0] >= cutoff
+            }
@@ -3,83 +3,132 @@
 功能：黑名單管理、風險控制、安全防護
 """
 
-import sqlite3
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+import atexit
+import heapq
 import json
+import threading
+
+from db_manager import get_db
+from migrations import run_migrations
+from money import Money, ZERO
+from risk_state import RiskStateStore
+
+# 同一用戶的同類風險事件在冷卻時間內只記錄一次
+RISK_EVENT_COOLDOWN = timedelta(hours=1)
+
+# 緩衝區累積到此筆數時立即寫入
+RISK_EVENT_BATCH_SIZE = 50
+
+RISK_EVENT_INSERT = '''
+    INSERT INTO risk_events (user_id, username, event_type, severity, description, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# ============ 風控金額門檻 ============
+# 每日儲值總額上限
+DAILY_DEPOSIT_LIMIT = Money.from_amount(10000)
+# 餘額異常高
+HIGH_BALANCE_THRESHOLD = Money.from_amount(50000)
+# 新帳號累計儲值過高
+NEW_ACCOUNT_DEPOSIT_THRESHOLD = Money.from_amount(5000)
+# 新帳號單筆大額儲值（疑似盜刷）
+STOLEN_CARD_DEPOSIT_THRESHOLD = Money.from_amount(3000)
 
 class SecurityManager:
     """安全管理系統"""
     
     def __init__(self, db_path='wallet.db'):
         self.db_path = db_path
+        self.db = get_db(db_path)
+        
+        # 黑名單快取：user_id -> (封禁原因, 解封時間；永久封禁為 None)
+        self._ban_lock = threading.Lock()
+        self._bans = {}
+        self._ban_expiry_heap = []
+        
+        # 風控計數：由寫入端更新，規則判斷不需查詢歷史紀錄
+        self.risk_state = RiskStateStore(self.db)
+        
+        # 風險事件緩衝：(user_id, event_type) -> 最後記錄時間（UTC）
+        self._risk_event_lock = threading.Lock()
+        self._risk_event_buffer = []
+        self._risk_event_last = {}
+        
         self._init_security_tables()
+        self.reload_blacklist_cache()
+        self._load_recent_risk_events()
+        atexit.register(self.flush_risk_events)
     
     def _init_security_tables(self):
-        """初始化安全相關資料表"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """初始化安全相關資料表（由版本遷移建立）"""
+        run_migrations(self.db)
+    
+    # ============ 黑名單管理 ============
+    
+    def reload_blacklist_cache(self) -> int:
+        """從資料庫重新載入黑名單快取
         
-        # 黑名單表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS blacklist (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL UNIQUE,
-                username TEXT NOT NULL,
-                reason TEXT NOT NULL,
-                banned_by INTEGER,
-                banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                banned_until TIMESTAMP,
-                is_permanent INTEGER DEFAULT 1,
-                notes TEXT
-            )
-        ''')
+        讀取與替換都持有 _ban_lock；本程序的封禁與解封也在持有同一把鎖時提交並更新快取，
+        重新載入不會以較舊的資料覆蓋剛完成的修改。is_blacklisted() 不取鎖，查詢不受影響。
         
-        # 風險事件記錄表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS risk_events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT NOT NULL,
-                event_type TEXT NOT NULL,
-                severity TEXT NOT NULL,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                handled INTEGER DEFAULT 0,
-                handled_by INTEGER,
-                handled_at TIMESTAMP
-            )
-        ''')
+        Returns:
+            載入的封禁數量
+        """
+        with self._ban_lock:
+            cursor = self.db.cursor()
+            cursor.execute('SELECT user_id, reason, banned_until, is_permanent FROM blacklist')
+            
+            bans = {}
+            expiry_heap = []
+            for user_id, reason, banned_until, is_permanent in cursor.fetchall():
+                if is_permanent:
+                    bans[user_id] = (reason, None)
+                elif banned_until:
+                    until = datetime.strptime(banned_until, '%Y-%m-%d %H:%M:%S')
+                    bans[user_id] = (reason, until)
+                    expiry_heap.append((until, user_id))
+            heapq.heapify(expiry_heap)
+            
+            self._bans = bans
+            self._ban_expiry_heap = expiry_heap
         
-        # 儲值限制記錄表（防止一天多次儲值）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS deposit_limits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                deposit_date DATE NOT NULL,
-                deposit_count INTEGER DEFAULT 0,
-                total_amount REAL DEFAULT 0,
-                UNIQUE(user_id, deposit_date)
-            )
-        ''')
+        return len(bans)
+    
+    def purge_expired_bans(self) -> int:
+        """清除已到期的臨時封禁（由背景工作呼叫，不在指令路徑上）
         
-        # 可疑操作日誌表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS suspicious_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT NOT NULL,
-                action_type TEXT NOT NULL,
-                details TEXT,
-                ip_address TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        Returns:
+            清除的封禁數量
+        """
+        now = datetime.now()
+        expired = []
+        
+        with self._ban_lock:
+            while self._ban_expiry_heap and self._ban_expiry_heap[0][0] <= now:
+                until, user_id = heapq.heappop(self._ban_expiry_heap)
+                entry = self._bans.get(user_id)
+                # 堆積採延遲刪除：封禁已被更新或移除時略過舊的項目
+                if entry is None or entry[1] != until:
+                    continue
+                del self._bans[user_id]
+                expired.append((user_id, until.strftime('%Y-%m-%d %H:%M:%S')))
+        
+        if not expired:
+            return 0
         
-        conn.commit()
-        conn.close()
-    
-    # ============ 黑名單管理 ============
+        try:
+            with self.db.transaction() as cursor:
+                # 只刪除仍是同一筆到期封禁的資料，避免誤刪在其他程序中被重新封禁的用戶
+                cursor.executemany('''
+                    DELETE FROM blacklist
+                    WHERE user_id = ? AND is_permanent = 0 AND banned_until = ?
+                ''', expired)
+        except Exception as e:
+            print(f"清除到期封禁錯誤: {e}")
+        
+        return len(expired)
     
     def add_to_blacklist(self, user_id: int, username: str, reason: str, 
                          banned_by: int, days: Optional[int] = None, notes: str = "") -> bool:
@@ -94,97 +143,77 @@ class SecurityManager:
             days: 封禁天數（None = 永久）
             notes: 備註
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
             is_permanent = 1 if days is None else 0
+            until = None
             banned_until = None
             
             if days is not None:
-                banned_until = (datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO blacklist 
-                (user_id, username, reason, banned_by, banned_until, is_permanent, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, username, reason, banned_by, banned_until, is_permanent, notes))
+                until = (datetime.now() + timedelta(days=days)).replace(microsecond=0)
+                banned_until = until.strftime('%Y-%m-%d %H:%M:%S')
             
-            # 記錄風險事件
-            self._log_risk_event(
-                user_id, username, 'BLACKLISTED', 'CRITICAL',
-                f"加入黑名單：{reason}"
-            )
+            # 提交與更新快取之間不能穿插 reload_blacklist_cache()，否則封禁會被舊資料覆蓋
+            with self._ban_lock:
+                with self.db.transaction() as cursor:
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO blacklist 
+                        (user_id, username, reason, banned_by, banned_until, is_permanent, notes)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (user_id, username, reason, banned_by, banned_until, is_permanent, notes))
+                    
+                    # 記錄風險事件（與封禁在同一個交易中；管理操作不經過緩衝區與冷卻時間，每次封禁都留下紀錄）
+                    cursor.execute(RISK_EVENT_INSERT, (
+                        user_id, username, 'BLACKLISTED', 'CRITICAL', f"加入黑名單：{reason}",
+                        datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+                    ))
+                
+                self._bans[user_id] = (reason, until)
+                if until is not None:
+                    heapq.heappush(self._ban_expiry_heap, (until, user_id))
             
-            conn.commit()
             return True
         except Exception as e:
             print(f"加入黑名單錯誤: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     def remove_from_blacklist(self, user_id: int) -> bool:
         """移除黑名單"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('DELETE FROM blacklist WHERE user_id = ?', (user_id,))
-            conn.commit()
+            with self._ban_lock:
+                with self.db.transaction() as cursor:
+                    cursor.execute('DELETE FROM blacklist WHERE user_id = ?', (user_id,))
+                
+                self._bans.pop(user_id, None)
+            
             return True
         except Exception as e:
             print(f"移除黑名單錯誤: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     def is_blacklisted(self, user_id: int) -> tuple[bool, Optional[str]]:
         """
-        檢查是否在黑名單
+        檢查是否在黑名單（只讀記憶體快取，不存取資料庫）
         
         Returns:
             (是否被封禁, 封禁原因)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        entry = self._bans.get(user_id)
         
-        cursor.execute('''
-            SELECT reason, banned_until, is_permanent
-            FROM blacklist
-            WHERE user_id = ?
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result:
+        if entry is None:
             return False, None
         
-        reason, banned_until, is_permanent = result
+        reason, until = entry
         
-        # 如果是永久封禁
-        if is_permanent:
+        # 永久封禁，或臨時封禁尚未到期
+        if until is None or datetime.now() < until:
             return True, reason
         
-        # 如果是臨時封禁，檢查是否過期
-        if banned_until:
-            banned_time = datetime.strptime(banned_until, '%Y-%m-%d %H:%M:%S')
-            if datetime.now() < banned_time:
-                return True, reason
-            else:
-                # 過期了，自動解除
-                self.remove_from_blacklist(user_id)
-                return False, None
-        
+        # 已到期，等待 purge_expired_bans() 從資料庫移除
         return False, None
     
     def get_blacklist(self, limit: int = 100) -> List[Dict]:
         """獲取黑名單列表"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         cursor.execute('''
             SELECT user_id, username, reason, banned_at, banned_until, 
@@ -195,7 +224,6 @@ class SecurityManager:
         ''', (limit,))
         
         results = cursor.fetchall()
-        conn.close()
         
         blacklist = []
         for r in results:
@@ -213,23 +241,69 @@ class SecurityManager:
     
     # ============ 風險事件記錄 ============
     
+    def _load_recent_risk_events(self):
+        """載入冷卻時間內已記錄的事件，重新啟動後不會重複記錄"""
+        since = datetime.utcnow() - RISK_EVENT_COOLDOWN
+        cursor = self.db.cursor()
+        cursor.execute('''
+            SELECT user_id, event_type, MAX(created_at)
+            FROM risk_events
+            WHERE created_at >= ?
+            GROUP BY user_id, event_type
+        ''', (since.strftime('%Y-%m-%d %H:%M:%S'),))
+        
+        with self._risk_event_lock:
+            for user_id, event_type, created_at in cursor.fetchall():
+                self._risk_event_last[(user_id, event_type)] = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+    
     def _log_risk_event(self, user_id: int, username: str, event_type: str,
                        severity: str, description: str):
-        """記錄風險事件"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """記錄風控規則偵測到的風險事件
+        
+        冷卻時間內重複的事件直接略過；其餘先放入緩衝區，
+        累積到 RISK_EVENT_BATCH_SIZE 筆或呼叫 flush_risk_events() 時批次寫入。
+        """
+        now = datetime.utcnow()
+        key = (user_id, event_type)
+        
+        with self._risk_event_lock:
+            last = self._risk_event_last.get(key)
+            if last is not None and now - last < RISK_EVENT_COOLDOWN:
+                return
+            
+            self._risk_event_last[key] = now
+            self._risk_event_buffer.append(
+                (user_id, username, event_type, severity, description, now.strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            should_flush = len(self._risk_event_buffer) >= RISK_EVENT_BATCH_SIZE
+        
+        if should_flush:
+            self.flush_risk_events()
+    
+    def flush_risk_events(self) -> int:
+        """將緩衝區的風險事件寫入資料庫，回傳寫入筆數"""
+        with self._risk_event_lock:
+            rows, self._risk_event_buffer = self._risk_event_buffer, []
+            
+            # 順便清除已過冷卻時間的紀錄
+            cutoff = datetime.utcnow() - RISK_EVENT_COOLDOWN
+            self._risk_event_last = {
+                key: last for key, last in self._risk_event_last.items() if last >= cutoff
+            }
+        
+        if not rows:
+            return 0
         
         try:
-            cursor.execute('''
-                INSERT INTO risk_events (user_id, username, event_type, severity, description)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, event_type, severity, description))
-            conn.commit()
+            with self.db.transaction() as cursor:
+                cursor.executemany(RISK_EVENT_INSERT, rows)
+            return len(rows)
         except Exception as e:
             print(f"記錄風險事件錯誤: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            # 寫入失敗時放回緩衝區，下次再試
+            with self._risk_event_lock:
+                self._risk_event_buffer = rows + self._risk_event_buffer
+            return 0
     
     def get_risk_events(self, handled: Optional[bool] = None, limit: int = 100) -> List[Dict]:
         """
@@ -238,8 +312,8 @@ class SecurityManager:
         Args:
             handled: None=全部, True=已處理, False=未處理
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.flush_risk_events()
+        cursor = self.db.cursor()
         
         if handled is None:
             cursor.execute('''
@@ -261,7 +335,6 @@ class SecurityManager:
             ''', (handled_int, limit))
         
         results = cursor.fetchall()
-        conn.close()
         
         events = []
         for r in results:
@@ -279,35 +352,28 @@ class SecurityManager:
     
     def mark_event_handled(self, event_id: int, admin_id: int) -> bool:
         """標記風險事件為已處理"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                UPDATE risk_events
-                SET handled = 1, handled_by = ?, handled_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (admin_id, event_id))
-            conn.commit()
+            with self.db.transaction() as cursor:
+                cursor.execute('''
+                    UPDATE risk_events
+                    SET handled = 1, handled_by = ?, handled_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (admin_id, event_id))
             return True
         except Exception as e:
             print(f"標記處理錯誤: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     # ============ 儲值限制檢查 ============
     
-    def check_deposit_limit(self, user_id: int) -> tuple[bool, int, float]:
+    def check_deposit_limit(self, user_id: int) -> tuple[bool, int, Money]:
         """
         檢查今日儲值限制
         
         Returns:
             (是否可以儲值, 今日已儲值次數, 今日已儲值金額)
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         today = datetime.now().strftime('%Y-%m-%d')
         
@@ -321,11 +387,9 @@ class SecurityManager:
         
         if not result:
             # 今天還沒儲值過
-            conn.close()
-            return True, 0, 0.0
+            return True, 0, ZERO
         
-        deposit_count, total_amount = result
-        conn.close()
+        deposit_count, total_amount = result[0], Money(result[1])
         
         # 新帳號限制：每天只能儲值一次
         # 檢查是否為新帳號（註冊未滿7天）
@@ -334,57 +398,34 @@ class SecurityManager:
         if is_new_account and deposit_count >= 1:
             return False, deposit_count, total_amount
         
-        # 一般帳號限制：每天最多3次，或單日超過10000元
-        if deposit_count >= 3 or total_amount >= 10000:
+        # 一般帳號限制：每天最多3次，或單日達到儲值上限
+        if deposit_count >= 3 or total_amount >= DAILY_DEPOSIT_LIMIT:
             return False, deposit_count, total_amount
         
         return True, deposit_count, total_amount
     
-    def record_deposit_attempt(self, user_id: int, amount: float) -> bool:
+    def record_deposit_attempt(self, user_id: int, amount: Money) -> bool:
         """記錄儲值嘗試"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         today = datetime.now().strftime('%Y-%m-%d')
         
         try:
-            cursor.execute('''
-                INSERT INTO deposit_limits (user_id, deposit_date, deposit_count, total_amount)
-                VALUES (?, ?, 1, ?)
-                ON CONFLICT(user_id, deposit_date) 
-                DO UPDATE SET 
-                    deposit_count = deposit_count + 1,
-                    total_amount = total_amount + ?
-            ''', (user_id, today, amount, amount))
-            
-            conn.commit()
+            with self.db.transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO deposit_limits (user_id, deposit_date, deposit_count, total_amount)
+                    VALUES (?, ?, 1, ?)
+                    ON CONFLICT(user_id, deposit_date) 
+                    DO UPDATE SET 
+                        deposit_count = deposit_count + 1,
+                        total_amount = total_amount + ?
+                ''', (user_id, today, amount, amount))
             return True
         except Exception as e:
             print(f"記錄儲值錯誤: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     def _is_new_account(self, user_id: int) -> bool:
         """檢查是否為新帳號（7天內註冊）"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT created_at FROM wallets WHERE user_id = ?
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if not result:
-            return True  # 沒找到資料，視為新帳號
-        
-        created_at = datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S')
-        days_since_creation = (datetime.now() - created_at).days
-        
-        return days_since_creation < 7
+        return self.risk_state.is_new_account(user_id)
     
     # ============ 可疑操作檢測 ============
     
@@ -395,97 +436,64 @@ class SecurityManager:
         Returns:
             可疑操作列表
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         warnings = []
         
-        # 1. 檢查短時間大量下單
-        one_hour_ago = (datetime.now() - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
-        cursor.execute('''
-            SELECT COUNT(*) FROM orders
-            WHERE user_id = ? AND created_at >= ?
-        ''', (user_id, one_hour_ago))
+        state = self.risk_state.snapshot(user_id)
+        if state is None:
+            return warnings
         
-        recent_orders = cursor.fetchone()[0]
+        # 1. 檢查短時間大量下單
+        recent_orders = state['orders_last_hour']
         if recent_orders >= 5:
             warnings.append(f"1小時內下單 {recent_orders} 次")
             self._log_risk_event(user_id, username, 'RAPID_ORDERS', 'HIGH',
                                f"1小時內下單 {recent_orders} 次")
         
         # 2. 檢查大量未完成訂單
-        cursor.execute('''
-            SELECT COUNT(*) FROM orders
-            WHERE user_id = ? AND status = 'pending'
-        ''', (user_id,))
-        
-        pending_orders = cursor.fetchone()[0]
+        pending_orders = state['pending_orders']
         if pending_orders >= 3:
             warnings.append(f"有 {pending_orders} 筆未完成訂單")
             self._log_risk_event(user_id, username, 'MANY_PENDING', 'MEDIUM',
                                f"有 {pending_orders} 筆未完成訂單")
         
         # 3. 檢查餘額異常
-        cursor.execute('SELECT balance FROM wallets WHERE user_id = ?', (user_id,))
-        balance_result = cursor.fetchone()
-        
-        if balance_result:
-            balance = balance_result[0]
-            if balance < 0:
-                warnings.append(f"餘額為負數: ${balance}")
-                self._log_risk_event(user_id, username, 'NEGATIVE_BALANCE', 'CRITICAL',
-                                   f"餘額為負數: ${balance}")
-            elif balance > 50000:
-                warnings.append(f"餘額異常高: ${balance}")
-                self._log_risk_event(user_id, username, 'HIGH_BALANCE', 'MEDIUM',
-                                   f"餘額異常高: ${balance}")
+        balance = state['balance']
+        if balance < 0:
+            warnings.append(f"餘額為負數: ${balance}")
+            self._log_risk_event(user_id, username, 'NEGATIVE_BALANCE', 'CRITICAL',
+                               f"餘額為負數: ${balance}")
+        elif balance > HIGH_BALANCE_THRESHOLD:
+            warnings.append(f"餘額異常高: ${balance}")
+            self._log_risk_event(user_id, username, 'HIGH_BALANCE', 'MEDIUM',
+                               f"餘額異常高: ${balance}")
         
         # 4. 檢查退款請求
-        cursor.execute('''
-            SELECT COUNT(*) FROM transactions
-            WHERE user_id = ? AND type = '退款' 
-              AND created_at >= datetime('now', '-30 days')
-        ''', (user_id,))
-        
-        refund_count = cursor.fetchone()[0]
+        refund_count = state['refunds_last_30_days']
         if refund_count >= 3:
             warnings.append(f"30天內退款 {refund_count} 次")
             self._log_risk_event(user_id, username, 'FREQUENT_REFUNDS', 'HIGH',
                                f"30天內退款 {refund_count} 次")
         
         # 5. 檢查是否為新帳號大額儲值
-        if self._is_new_account(user_id):
-            cursor.execute('''
-                SELECT SUM(amount) FROM deposits
-                WHERE user_id = ?
-            ''', (user_id,))
-            
-            total_deposit = cursor.fetchone()[0]
-            if total_deposit and total_deposit > 5000:
-                warnings.append(f"新帳號大額儲值: ${total_deposit}")
-                self._log_risk_event(user_id, username, 'NEW_ACCOUNT_LARGE_DEPOSIT', 'HIGH',
-                                   f"新帳號大額儲值: ${total_deposit}")
+        total_deposit = state['lifetime_deposits']
+        if state['is_new_account'] and total_deposit > NEW_ACCOUNT_DEPOSIT_THRESHOLD:
+            warnings.append(f"新帳號大額儲值: ${total_deposit}")
+            self._log_risk_event(user_id, username, 'NEW_ACCOUNT_LARGE_DEPOSIT', 'HIGH',
+                               f"新帳號大額儲值: ${total_deposit}")
         
-        conn.close()
         return warnings
     
     def log_suspicious_action(self, user_id: int, username: str, 
                              action_type: str, details: str, ip: str = ""):
         """記錄可疑操作"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO suspicious_logs (user_id, username, action_type, details, ip_address)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, action_type, details, ip))
-            conn.commit()
+            with self.db.transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO suspicious_logs (user_id, username, action_type, details, ip_address)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, username, action_type, details, ip))
         except Exception as e:
             print(f"記錄可疑操作錯誤: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
     
     # ============ 惡意退款檢測 ============
     
@@ -496,25 +504,13 @@ class SecurityManager:
         Returns:
             True = 疑似惡意退款，False = 正常
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 檢查30天內退款次數
-        cursor.execute('''
-            SELECT COUNT(*) FROM transactions
-            WHERE user_id = ? AND type = '退款'
-              AND created_at >= datetime('now', '-30 days')
-        ''', (user_id,))
-        
-        refund_count = cursor.fetchone()[0]
-        
-        # 檢查總訂單數
-        cursor.execute('''
-            SELECT COUNT(*) FROM orders WHERE user_id = ?
-        ''', (user_id,))
+        state = self.risk_state.snapshot(user_id)
+        if state is None:
+            return False
         
-        total_orders = cursor.fetchone()[0]
-        conn.close()
+        # 30天內退款次數與總訂單數
+        refund_count = state['refunds_last_30_days']
+        total_orders = state['total_orders']
         
         # 如果退款次數 >= 3 或 退款率 > 50%
         if refund_count >= 3:
@@ -531,7 +527,7 @@ class SecurityManager:
     
     # ============ 盜刷檢測 ============
     
-    def check_stolen_card(self, user_id: int, username: str, amount: float) -> bool:
+    def check_stolen_card(self, user_id: int, username: str, amount: Money) -> bool:
         """
         檢查是否疑似盜刷
         
@@ -539,14 +535,13 @@ class SecurityManager:
             True = 疑似盜刷，False = 正常
         """
         # 新帳號大額儲值
-        if self._is_new_account(user_id) and amount >= 3000:
+        if self._is_new_account(user_id) and amount >= STOLEN_CARD_DEPOSIT_THRESHOLD:
             self._log_risk_event(user_id, username, 'SUSPECTED_STOLEN_CARD', 'CRITICAL',
                                f"新帳號大額儲值 ${amount}")
             return True
         
         # 檢查短時間內多次儲值
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        cursor = self.db.cursor()
         
         one_hour_ago = (datetime.now() - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
         cursor.execute('''
@@ -555,11 +550,10 @@ class SecurityManager:
         ''', (user_id, one_hour_ago))
         
         result = cursor.fetchone()
-        conn.close()
         
         if result and result[0] >= 3:
             self._log_risk_event(user_id, username, 'RAPID_DEPOSITS', 'HIGH',
-                               f"1小時內儲值 {result[0]} 次，總額 ${result[1]}")
+                               f"1小時內儲值 {result[0]} 次，總額 ${Money(result[1])}")
             return True
         
         return False
@@ -568,8 +562,8 @@ class SecurityManager:
     
     def auto_handle_risks(self) -> Dict:
         """自動處理高風險事件"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.flush_risk_events()
+        cursor = self.db.cursor()
         
         # 獲取未處理的高危事件
         cursor.execute('''
@@ -609,7 +603,6 @@ class SecurityManager:
                     # 標記為已處理
                     self.mark_event_handled(event_id, 0)
         
-        conn.close()
         return actions_taken
 
 
@@ -678,6 +671,7 @@ def security_management_cli():
         
         elif choice == '4':
             user_id = int(input("用戶ID: "))
+            security.reload_blacklist_cache()
             is_banned, reason = security.is_blacklisted(user_id)
             if is_banned:
                 print(f"\n🚫 該用戶已被封禁")
@@ -748,7 +742,7 @@ def security_management_cli():
                 if security._is_new_account(user_id):
                     print(f"  ⚠️ 新帳號每天限制1次儲值")
                 else:
-                    print(f"  ⚠️ 達到每日儲值上限（3次或$10000）")
+                    print(f"  ⚠️ 達到每日儲值上限（3次或${DAILY_DEPOSIT_LIMIT}）")
         
         elif choice == '0':
             break
@@ -0,0 +1,127 @@
+"""
+商城目錄快取
+功能：依目錄版本快取商品、分類索引、預先渲染的商城欄位與按鈕配置
+shop_items 的任何變更都會透過觸發器遞增 catalog_version，快取據此重新載入
+快取只用於顯示與提早提示；確認購買前會先 refresh()，實際成交時 purchase() 在交易內重新讀取商品
+"""
+
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from money import Money
+
+# Discord 每個 View 最多 25 個按鈕
+MAX_BUTTONS = 25
+
+# 商城按鈕的 custom_id：shop:buy:<商品ID>:<目錄版本>
+SHOP_BUY_ROUTE = 'shop:buy'
+
+
+class CatalogItem(NamedTuple):
+    """商品資料"""
+    id: int
+    name: str
+    price: Money
+    description: str
+    category: str
+    stock: int
+    emoji: str
+    commission_rate: float
+
+
+class ButtonSpec(NamedTuple):
+    """商城按鈕配置"""
+    label: str
+    custom_id: str
+    item_id: int
+
+
+class CatalogSnapshot:
+    """某一版本的商城目錄（建立後不再修改，可在多個執行緒間共用）"""
+
+    def __init__(self, version: int, items: List[CatalogItem]):
+        self.version = version
+        self.items = tuple(items)
+        self.by_name: Dict[str, CatalogItem] = {item.name: item for item in items}
+        self.by_id: Dict[int, CatalogItem] = {item.id: item for item in items}
+
+        self.categories: Dict[str, List[CatalogItem]] = {}
+        for item in items:
+            self.categories.setdefault(item.category, []).append(item)
+
+        self.embed_fields: List[Tuple[str, str]] = []
+        for category, products in self.categories.items():
+            product_list = ""
+            for item in products:
+                stock_text = f"（剩餘 {item.stock}）" if item.stock > 0 else ""
+                product_list += f"{item.emoji} **{item.name}** - ${item.price}\n{item.description}{stock_text}\n\n"
+            self.embed_fields.append((f"【{category}】", product_list))
+
+        self.buttons: List[ButtonSpec] = [
+            ButtonSpec(
+                label=f"{item.emoji} {item.name} - ${item.price}",
+                custom_id=f"{SHOP_BUY_ROUTE}:{item.id}:{version}",
+                item_id=item.id
+            )
+            for item in items[:MAX_BUTTONS]
+        ]
+
+
+class ShopCatalog:
+    """商城目錄快取"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+
+    @property
+    def current(self) -> Optional[CatalogSnapshot]:
+        """目前快取的目錄（尚未載入時為 None）"""
+        return self._snapshot
+
+    def get_item(self, item_name: str) -> Optional[CatalogItem]:
+        """從快取取得上架中的商品"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        return snapshot.by_name.get(item_name)
+
+    def get_item_by_id(self, item_id: int, version: Optional[int] = None) -> Optional[CatalogItem]:
+        """從快取取得上架中的商品；指定 version 時目錄版本不同則視為已變更"""
+        snapshot = self._snapshot
+        if snapshot is None or (version is not None and snapshot.version != version):
+            return None
+        return snapshot.by_id.get(item_id)
+
+    def _read_version(self) -> int:
+        cursor = self.db.cursor()
+        cursor.execute('SELECT version FROM catalog_version WHERE id = 1')
+        result = cursor.fetchone()
+        return result[0] if result else 0
+
+    def refresh(self, force: bool = False) -> CatalogSnapshot:
+        """版本變更時重新載入目錄
+
+        只讀取一列版本號；版本相同時直接回傳現有快取。
+        """
+        version = self._read_version()
+        snapshot = self._snapshot
+        if not force and snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self._lock:
+            # 先讀版本再讀商品：若兩者之間有變更，下次 refresh 會看到更新的版本並再次載入
+            cursor = self.db.cursor()
+            cursor.execute('''
+                SELECT id, name, price, description, category, stock, emoji, commission_rate
+                FROM shop_items
+                WHERE enabled = 1
+                ORDER BY id
+            ''')
+            items = [CatalogItem(item_id, name, Money(price), *rest)
+                     for item_id, name, price, *rest in cursor.fetchall()]
+
+            snapshot = CatalogSnapshot(version, items)
+            self._snapshot = snapshot
+            return snapshot
@@ -0,0 +1,251 @@
+"""
+SQL 效能分析
+功能：開啟後記錄每條 SQL 的次數、耗時與列數，並以 EXPLAIN QUERY PLAN 找出整張表掃描的語句
+透過 ConnectionManager.enable_profiler() 套用到所有連線：
+  - 經由 db.cursor() / db.transaction() 取得的游標會計時 execute 與 fetch，並計算列數
+  - 每條連線掛上 set_trace_callback，記錄不經過游標的語句（BEGIN / COMMIT / executescript 等）
+相同語句（空白、IN 清單長度、內嵌常數不同）會合併成一筆；每種語句只執行一次 EXPLAIN QUERY PLAN
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+# 會執行 EXPLAIN QUERY PLAN 的語句
+EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+
+
+def normalize_sql(sql: str, strip_literals: bool = False) -> str:
+    """統一語句格式作為統計的鍵
+
+    strip_literals: trace 收到的是已代入參數的 SQL，需把常數換回 ? 才能與游標記錄的語句合併
+    """
+    sql = _WHITESPACE.sub(' ', sql).strip().rstrip(';').strip()
+    if strip_literals:
+        sql = _STRING_LITERAL.sub('?', sql)
+        sql = _NUMBER_LITERAL.sub('?', sql)
+    return _IN_LIST.sub('IN (?...)', sql)
+
+
+def plan_warnings(steps: Sequence[str]) -> List[str]:
+    """從執行計畫找出需要注意的步驟"""
+    warnings = []
+    for step in steps:
+        # 沒有 USING 的 SCAN 代表整張表掃描（CONSTANT ROW 是沒有 FROM 的查詢）
+        if step.startswith('SCAN') and 'USING' not in step and 'CONSTANT ROW' not in step:
+            warnings.append(f"全表掃描 {step[5:]}")
+        elif 'USE TEMP B-TREE' in step:
+            warnings.append(f"暫存排序 ({step[19:]})")
+    return warnings
+
+
+class StatementStats:
+    """一種語句的累計數據"""
+
+    __slots__ = ('sql', 'calls', 'seconds', 'rows', 'max_seconds', 'sample_sql', 'sample_params',
+                 'plan', 'warnings')
+
+    def __init__(self, sql: str, sample_sql: str, sample_params):
+        self.sql = sql
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.max_seconds = 0.0
+        self.sample_sql = sample_sql
+        self.sample_params = sample_params
+        self.plan: Optional[List[str]] = None
+        self.warnings: List[str] = []
+
+
+class SQLProfiler:
+    """SQL 語句統計（可在多個執行緒間共用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, StatementStats] = {}
+        self._local = threading.local()
+        self.started_at = datetime.now()
+
+    # ============ 記錄 ============
+
+    def _entry(self, key: str, sample_sql: str, sample_params) -> StatementStats:
+        entry = self._stats.get(key)
+        if entry is None:
+            entry = self._stats[key] = StatementStats(key, sample_sql, sample_params)
+        return entry
+
+    def record_execute(self, sql: str, params, seconds: float, rows: int, calls: int = 1) -> str:
+        """記錄一次 execute / executemany，回傳語句的鍵供之後的 fetch 累加"""
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._entry(key, sql, params)
+            entry.calls += calls
+            entry.seconds += seconds
+            entry.rows += rows
+            entry.max_seconds = max(entry.max_seconds, seconds)
+        return key
+
+    def record_fetch(self, key: str, seconds: float, rows: int):
+        """把 fetch 的耗時與列數累加到產生結果的語句"""
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is not None:
+                entry.seconds += seconds
+                entry.rows += rows
+
+    def trace(self, sql: str):
+        """sqlite3 trace callback：只記錄不是經由分析游標執行的語句"""
+        if getattr(self._local, 'in_cursor', False):
+            return
+        key = normalize_sql(sql, strip_literals=True)
+        with self._lock:
+            self._entry(key, sql, None).calls += 1
+
+    def cursor_factory(self, conn: sqlite3.Connection) -> 'ProfilingCursor':
+        return ProfilingCursor(conn, self)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+        self.started_at = datetime.now()
+
+    # ============ 報告 ============
+
+    def explain(self, db):
+        """為尚未分析過的語句執行 EXPLAIN QUERY PLAN（每種語句只執行一次）"""
+        with self._lock:
+            pending = [entry for entry in self._stats.values()
+                       if entry.plan is None and entry.sql.upper().startswith(EXPLAINABLE)]
+
+        cursor = db.connection().cursor()
+        # EXPLAIN 本身不列入統計
+        self._local.in_cursor = True
+        try:
+            for entry in pending:
+                self._explain_entry(cursor, entry)
+        finally:
+            self._local.in_cursor = False
+
+    def _explain_entry(self, cursor: sqlite3.Cursor, entry: StatementStats):
+        # 以第一次執行時的參數分析，計畫與實際執行時相同（例如部分索引的條件）
+        params = entry.sample_params
+        if params is None:
+            params = (None,) * entry.sample_sql.count('?')
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {entry.sample_sql}', params)
+            entry.plan = [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            entry.plan = [f"無法分析: {e}"]
+        entry.warnings = plan_warnings(entry.plan)
+
+    def report_rows(self, db=None, limit: Optional[int] = None) -> List[Dict]:
+        """依總耗時排序的語句統計；傳入 db 時先補上執行計畫"""
+        if db is not None:
+            self.explain(db)
+        with self._lock:
+            entries = sorted(self._stats.values(), key=lambda entry: entry.seconds, reverse=True)
+        return [
+            {
+                '語句': entry.sql,
+                '次數': entry.calls,
+                '總耗時(ms)': round(entry.seconds * 1000, 2),
+                '平均(ms)': round(entry.seconds * 1000 / entry.calls, 3) if entry.calls else 0,
+                '最長(ms)': round(entry.max_seconds * 1000, 2),
+                '列數': entry.rows,
+                '警告': '、'.join(entry.warnings) or ('✅' if entry.plan else ''),
+                '執行計畫': ' | '.join(entry.plan or [])
+            }
+            for entry in entries[:limit]
+        ]
+
+    def format_report(self, db=None, limit: Optional[int] = None) -> str:
+        """文字格式報告"""
+        rows = self.report_rows(db, limit)
+        scans = sum(1 for row in rows if '全表掃描' in row['警告'])
+        lines = [
+            f"SQL 效能分析報告（{self.started_at:%Y-%m-%d %H:%M:%S} 起，產生於 {datetime.now():%Y-%m-%d %H:%M:%S}）",
+            f"語句種類: {len(rows)}，全表掃描: {scans}",
+            ""
+        ]
+        for rank, row in enumerate(rows, 1):
+            marker = '⚠️ ' if '全表掃描' in row['警告'] else ''
+            lines.append(f"#{rank} {marker}總耗時 {row['總耗時(ms)']}ms｜{row['次數']} 次｜"
+                         f"平均 {row['平均(ms)']}ms｜最長 {row['最長(ms)']}ms｜{row['列數']} 列")
+            lines.append(f"    {row['語句']}")
+            if row['執行計畫']:
+                lines.append(f"    計畫: {row['執行計畫']}")
+            if row['警告'] and row['警告'] != '✅':
+                lines.append(f"    警告: {row['警告']}")
+            lines.append("")
+        return '\n'.join(lines)
+
+    def write_report(self, db, path: Optional[str] = None) -> str:
+        """寫入報告檔，回傳檔名"""
+        path = path or f"sql_profile_{datetime.now():%Y%m%d_%H%M%S}.txt"
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.format_report(db))
+        return path
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """計時 execute 與 fetch 的游標"""
+
+    def __init__(self, conn: sqlite3.Connection, profiler: SQLProfiler):
+        super().__init__(conn)
+        self._profiler = profiler
+        self._key: Optional[str] = None
+
+    def _run(self, method, sql, params, calls_from_params: bool):
+        local = self._profiler._local
+        local.in_cursor = True
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            seconds = time.perf_counter() - started
+            local.in_cursor = False
+            if calls_from_params:
+                params = list(params)
+                calls, sample = len(params), (params[0] if params else None)
+            else:
+                calls, sample = 1, params
+            self._key = self._profiler.record_execute(sql, sample, seconds, max(self.rowcount, 0), calls)
+
+    def execute(self, sql, params=()):
+        return self._run(super().execute, sql, params, False)
+
+    def executemany(self, sql, seq_of_params):
+        # 參數可能是產生器，先轉成列表才能同時執行與取樣
+        return self._run(super().executemany, sql, list(seq_of_params), True)
+
+    def _timed_fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        if self._key is not None:
+            rows = len(result) if isinstance(result, list) else int(result is not None)
+            self._profiler.record_fetch(self._key, time.perf_counter() - started, rows)
+        return result
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        if self._key is not None:
+            self._profiler.record_fetch(self._key, time.perf_counter() - started, 1)
+        return row
@@ -0,0 +1,118 @@
+"""
+工作人員收入彙總
+功能：在發放分潤的同一個交易中累加 staff_earnings（累計與每月），
+收入查詢與收入排行只需讀取彙總列
+月份以分潤時間（UTC，與 CURRENT_TIMESTAMP 一致）計算
+金額欄位以分為單位的整數儲存
+"""
+
+from typing import List, Optional, Tuple
+
+from money import Money
+
+# 累計收入使用的期間名稱；每月收入為 'YYYY-MM'
+ALL_TIME = 'all'
+
+# 已發布為遷移 6，不可修改；金額欄位由遷移 8 轉為 INTEGER（分）
+STAFF_EARNINGS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS staff_earnings (
+        staff_id INTEGER NOT NULL,
+        period TEXT NOT NULL,
+        staff_name TEXT NOT NULL,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        total_earning REAL NOT NULL DEFAULT 0,
+        total_order_amount REAL NOT NULL DEFAULT 0,
+        first_at TIMESTAMP,
+        last_at TIMESTAMP,
+        PRIMARY KEY (staff_id, period)
+    )
+    ''',
+    # 收入排行
+    'CREATE INDEX IF NOT EXISTS idx_staff_earnings_period_earning ON staff_earnings (period, total_earning)',
+]
+
+STAFF_EARNINGS_SQL = '''
+    SELECT order_count, total_earning, total_order_amount, first_at, last_at
+    FROM staff_earnings
+    WHERE staff_id = ? AND period = ?
+'''
+
+TOP_EARNERS_SQL = '''
+    SELECT staff_name, staff_id, total_earning, order_count
+    FROM staff_earnings
+    WHERE period = ?
+    ORDER BY total_earning DESC
+    LIMIT ?
+'''
+
+_UPSERT_SQL = '''
+    INSERT INTO staff_earnings (staff_id, period, staff_name, order_count, total_earning,
+                                total_order_amount, first_at, last_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(staff_id, period) DO UPDATE SET
+        staff_name = excluded.staff_name,
+        order_count = order_count + excluded.order_count,
+        total_earning = total_earning + excluded.total_earning,
+        total_order_amount = total_order_amount + excluded.total_order_amount,
+        first_at = MIN(COALESCE(first_at, excluded.first_at), excluded.first_at),
+        last_at = MAX(COALESCE(last_at, excluded.last_at), excluded.last_at)
+'''
+
+
+def add_staff_earning(cursor, staff_id: int, staff_name: str, staff_earning: Money, order_amount: Money,
+                      order_count: int = 1):
+    """累加分潤到累計與當月收入（必須在寫入 commissions 的交易內呼叫）
+
+    批次完成訂單時可一次累加多筆：staff_earning / order_amount 為合計，order_count 為筆數
+    """
+    cursor.execute("SELECT strftime('%Y-%m', 'now'), CURRENT_TIMESTAMP")
+    month, now = cursor.fetchone()
+    for period in (ALL_TIME, month):
+        cursor.execute(_UPSERT_SQL, (staff_id, period, staff_name, order_count, staff_earning,
+                                     order_amount, now, now))
+
+
+def rebuild_staff_earnings(cursor) -> int:
+    """從分潤紀錄重新計算所有工作人員收入（必須在交易內呼叫），回傳列數"""
+    cursor.execute('DELETE FROM staff_earnings')
+
+    # 名稱取最近一筆分潤的工作人員名稱
+    for period_expr in (f"'{ALL_TIME}'", "strftime('%Y-%m', created_at)"):
+        cursor.execute(f'''
+            INSERT INTO staff_earnings (staff_id, period, staff_name, order_count, total_earning,
+                                        total_order_amount, first_at, last_at)
+            SELECT staff_id, {period_expr},
+                   (SELECT c2.staff_name FROM commissions c2
+                    WHERE c2.staff_id = c.staff_id ORDER BY c2.id DESC LIMIT 1),
+                   COUNT(*), SUM(staff_earning), SUM(order_amount),
+                   MIN(created_at), MAX(created_at)
+            FROM commissions c
+            GROUP BY staff_id, {period_expr}
+        ''')
+
+    cursor.execute('SELECT COUNT(*) FROM staff_earnings')
+    return cursor.fetchone()[0]
+
+
+def get_staff_earnings(db, staff_id: int, period: str = ALL_TIME) -> Optional[Tuple]:
+    """取得工作人員某期間的收入
+
+    Returns:
+        (完成訂單數, 總收入, 訂單總額, 首次分潤時間, 最後分潤時間)，沒有紀錄回傳 None
+    """
+    cursor = db.cursor()
+    cursor.execute(STAFF_EARNINGS_SQL, (staff_id, period))
+    result = cursor.fetchone()
+    if not result:
+        return None
+    order_count, total_earning, total_order_amount, first_at, last_at = result
+    return order_count, Money(total_earning), Money(total_order_amount), first_at, last_at
+
+
+def get_top_earners(db, limit: int = 10, period: str = ALL_TIME) -> List[Tuple]:
+    """收入排行 [(工作人員名稱, 工作人員ID, 總收入, 完成訂單數), ...]"""
+    cursor = db.cursor()
+    cursor.execute(TOP_EARNERS_SQL, (period, limit))
+    return [(staff_name, staff_id, Money(total_earning), order_count)
+            for staff_name, staff_id, total_earning, order_count in cursor.fetchall()]
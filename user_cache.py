@@ -0,0 +1,176 @@
+"""
+Discord 用戶快取
+功能：取得 User 與私訊頻道時優先使用 Bot 的快取與伺服器成員快取，其次是本模組的 LRU 快取，
+都找不到時才查詢；同一時間的多筆查詢會合併，伺服器成員以一次 gateway 請求批次取得，
+只有不在任何伺服器中的用戶才逐一呼叫 REST fetch_user
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, List, Optional, TypeVar, Union
+
+import discord
+
+V = TypeVar('V')
+
+UserLike = Union[discord.User, discord.Member]
+
+# query_members 一次最多查詢的用戶數
+QUERY_MEMBERS_LIMIT = 100
+
+
+class LRUCache(Generic[V]):
+    """有數量上限與存活時間的 LRU 快取"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: V):
+        self._items[key] = (value, time.monotonic() + self.ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class UserResolver:
+    """User / 私訊頻道解析
+
+    get_user() 依序檢查 bot.get_user、各伺服器的成員快取、LRU 快取；
+    未命中的用戶在 batch_window 秒內累積後一起查詢。
+    """
+
+    def __init__(self, bot: discord.Client, max_size: int = 2000, ttl: float = 3600.0,
+                 batch_window: float = 0.05):
+        self.bot = bot
+        self.batch_window = batch_window
+        self._users: LRUCache[UserLike] = LRUCache(max_size, ttl)
+        self._dm_channels: LRUCache[discord.DMChannel] = LRUCache(max_size, ttl)
+
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._dm_inflight: Dict[int, asyncio.Task] = {}
+
+        self.cache_hits = 0
+        self.gateway_queries = 0
+        self.rest_fetches = 0
+        self.dm_creates = 0
+
+    def get_cached_user(self, user_id: int) -> Optional[UserLike]:
+        """只查快取，不發出任何請求"""
+        user = self.bot.get_user(user_id)
+        if user is None:
+            for guild in self.bot.guilds:
+                user = guild.get_member(user_id)
+                if user is not None:
+                    break
+        if user is None:
+            user = self._users.get(user_id)
+        return user
+
+    async def get_user(self, user_id: int) -> Optional[UserLike]:
+        """取得用戶（找不到時回傳 None）"""
+        user = self.get_cached_user(user_id)
+        if user is not None:
+            self.cache_hits += 1
+            return user
+
+        future = self._pending.get(user_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[user_id] = future
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_after_window(), name='user-resolve')
+        return await asyncio.shield(future)
+
+    async def get_dm_channel(self, user_id: int) -> Optional[discord.DMChannel]:
+        """取得與用戶的私訊頻道（可直接 send，避免每次 user.send 都重新建立）"""
+        channel = self._dm_channels.get(user_id)
+        if channel is not None:
+            self.cache_hits += 1
+            return channel
+
+        task = self._dm_inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._open_dm(user_id), name=f'user-dm-{user_id}')
+            self._dm_inflight[user_id] = task
+            task.add_done_callback(lambda _: self._dm_inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def _open_dm(self, user_id: int) -> Optional[discord.DMChannel]:
+        user = await self.get_user(user_id)
+        if user is None:
+            return None
+        channel = user.dm_channel
+        if channel is None:
+            channel = await user.create_dm()
+            self.dm_creates += 1
+        self._dm_channels.put(user_id, channel)
+        return channel
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.batch_window)
+        pending, self._pending = self._pending, {}
+        self._flush_task = None
+        try:
+            await self._resolve_batch(pending)
+        except Exception as e:
+            print(f"查詢用戶錯誤: {e}")
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _resolve_batch(self, pending: Dict[int, asyncio.Future]):
+        remaining: List[int] = list(pending)
+
+        # 伺服器成員：透過 gateway 一次查詢最多 100 位，不佔用 REST 額度
+        for guild in self.bot.guilds:
+            if not remaining:
+                break
+            for start in range(0, len(remaining), QUERY_MEMBERS_LIMIT):
+                chunk = remaining[start:start + QUERY_MEMBERS_LIMIT]
+                try:
+                    members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=True)
+                except (asyncio.TimeoutError, discord.ClientException) as e:
+                    print(f"查詢伺服器成員失敗: {e}")
+                    continue
+                self.gateway_queries += 1
+                for member in members:
+                    self._resolve(pending, member.id, member)
+            remaining = [user_id for user_id in remaining if not pending[user_id].done()]
+
+        # 不在任何伺服器的用戶才逐一呼叫 REST
+        for user_id in remaining:
+            try:
+                user = await self.bot.fetch_user(user_id)
+                self.rest_fetches += 1
+            except discord.NotFound:
+                user = None
+            except Exception as e:
+                pending[user_id].set_exception(e)
+                continue
+            self._resolve(pending, user_id, user)
+
+    def _resolve(self, pending: Dict[int, asyncio.Future], user_id: int, user: Optional[UserLike]):
+        future = pending.get(user_id)
+        if future is None or future.done():
+            return
+        if user is not None:
+            self._users.put(user_id, user)
+        future.set_result(user)